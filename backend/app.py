@@ -3,381 +3,342 @@ SanBernard Backend API
 GPX Route Time Estimator with Weather Integration
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, g, request, jsonify
 from flask_cors import CORS
-import gpxpy
-import gpxpy.gpx
 import numpy as np
 from datetime import datetime, timedelta, timezone
 import math
-import httpx
-import json
+import logging
 import os
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, asdict
+import shutil
+import tempfile
+import time
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
+from dataclasses import replace
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from batch import BATCH_MAX_ROUTES, parse_route_files
+from departure import (
+    SWEEP_DEFAULT_HOURS,
+    SWEEP_DEFAULT_STEP_MINUTES,
+    best_windows,
+    departure_starts,
+    ranked_departures,
+    sweep_departures,
+)
+from elevation import get_elevation_service
+from engine import pace_arrays, terrain_arrays
+from garmin import (
+    GarminSession,
+    GarminSessions,
+    fetch_activity_gpx,
+    get_activity_store,
+    get_garmin_client,
+    sync_activities,
+)
+from gpx_stream import parse_gpx_stream
+from history import analyze_history_files
+from legs import LEGS_MAX_QUERIES, RoutePrefix
+from jobs import FAILED, Job, JobQueue, QueueFullError
+from pace_profile import PaceProfile, PaceProfileStore, validate_user_id
+from route import FACTOR_DTYPE, Route
+from response_format import (
+    compress_response,
+    ndjson_record,
+    route_point_records,
+    route_response,
+    stream_response,
+    wants_route_stream,
+)
+from preprocess import preprocess_key, preprocess_route, resolve_preprocess
+from route_store import RouteStore, StoredRoute, hash_upload, make_stored_route
+from simplify import resolve_tolerance
+from telemetry import (
+    REGISTRY,
+    ROUTE_POINTS,
+    configure_logging,
+    log_event,
+    span,
+)
+from uploads import COPY_CHUNK_BYTES, UPLOAD_MAX_REQUEST_BYTES, mapped_file, open_gpx_upload, spool_file, spool_uploads
+from uncertainty import (
+    UNCERTAINTY_CURVE_POINTS,
+    day_sunset,
+    resolve_percentiles,
+    resolve_samples,
+    segment_times,
+    simulate_eta,
+)
+from weather import (
+    WEATHER_CONVERGENCE_SECONDS,
+    WEATHER_MAX_ITERATIONS,
+    ForecastGrid,
+    WeatherData,
+    fetch_forecast_grid,
+    fetch_weather_for_route_area,
+    get_weather_client,
+    run_async,
+)
+
+configure_logging()
+logger = logging.getLogger('sanbernard.api')
+
+
+
+class SpooledRequest(Request):
+    """Request whose file uploads stay in memory only up to UPLOAD_SPOOL_BYTES each"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return spool_file()
+
 
 app = Flask(__name__)
+app.request_class = SpooledRequest
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_REQUEST_BYTES
 CORS(app)
 
-# Constants for time estimation
-BASE_SPEED_KMH = 5.0  # Base walking speed on flat terrain
-NAISMITH_RULE_MINUTES_PER_100M = 10  # Additional minutes per 100m ascent
+REQUESTS = REGISTRY.counter(
+    'sanbernard_http_requests_total', 'HTTP requests by endpoint, method and status', ['endpoint', 'method', 'status']
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'sanbernard_http_request_duration_seconds', 'HTTP request latency by endpoint', ['endpoint']
+)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+# Registered before compression so it runs after it (Flask runs these in reverse) and times it too
+@app.after_request
+def record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+    log_event(logger, logging.DEBUG, 'request', method=request.method, path=request.path,
+              status=response.status_code, seconds=elapsed)
+    return response
+
+
+app.after_request(compress_response)
+
+# Parsed routes by upload hash, so re-estimating (e.g. a new pace factor) skips parsing
+route_store = RouteStore()
+
+# Per-user gradient-binned pace, grown by every analyzed activity
+pace_profiles = PaceProfileStore()
+
+# Background jobs for the async variants of the heavy endpoints
+job_queue = JobQueue()
+
+# Garmin sessions by account (synced GPX files live in get_activity_store())
+garmin_sessions = GarminSessions()
+
+
+def cache_samples(field: str) -> List[Tuple[Dict[str, str], float]]:
+    """One stats() field of every cache, labelled by cache name, for /api/metrics"""
+    caches = {'route': route_store.stats()}
+    forecast_cache = get_weather_client().cache
+    if forecast_cache is not None:
+        caches['forecast'] = forecast_cache.stats()
+    return [({'cache': name}, stats[field]) for name, stats in caches.items()]
 
 
-@dataclass
-class RoutePoint:
-    """Represents a point on the route with all relevant data"""
-    lat: float
-    lon: float
-    elevation: float
-    distance_from_start: float  # meters
-    estimated_time: float  # seconds from start
-    segment_speed: float  # km/h for this segment
-    gradient: float  # percentage
-    terrain_factor: float
-    weather_factor: float
+REGISTRY.callback('sanbernard_cache_hits_total', 'Cache hits', 'counter', lambda: cache_samples('hits'))
+REGISTRY.callback('sanbernard_cache_misses_total', 'Cache misses', 'counter', lambda: cache_samples('misses'))
+REGISTRY.callback('sanbernard_cache_hit_ratio', 'Cache hits over lookups since start', 'gauge',
+                  lambda: cache_samples('hit_rate'))
+REGISTRY.callback('sanbernard_cache_entries', 'Entries held in memory', 'gauge', lambda: cache_samples('entries'))
+REGISTRY.callback('sanbernard_jobs', 'Background jobs by status', 'gauge', lambda: [
+    ({'status': status}, count) for status, count in job_queue.stats().items()
+    if status in ('queued', 'running', 'succeeded', 'failed')
+])
 
 
-@dataclass
-class WeatherData:
-    """Weather data for a specific point and time"""
-    temperature: float  # Celsius
-    precipitation: float  # mm
-    wind_speed: float  # km/h
-    wind_direction: float  # degrees
-    snow_depth: float  # cm
-    weather_code: int
-    description: str
+def profile_factors(terrain: Dict[str, np.ndarray], pace_profile: PaceProfile) -> np.ndarray:
+    """Per-point pace profile factors for the gradient and elapsed-time bins"""
+    # Elapsed-time bins need arrival times: estimate with gradient-only factors first
+    profile_factor = pace_profile.factors(terrain['gradient'])
+    estimated_time = pace_arrays(terrain, profile_factor=profile_factor)['estimated_time']
+    # The segment ending at each point starts at the previous point's arrival
+    elapsed = np.concatenate(([0.0], estimated_time[:-1]))
+    return pace_profile.factors(terrain['gradient'], elapsed)
 
 
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calculate distance between two points using Haversine formula (meters)"""
-    R = 6371000  # Earth's radius in meters
+def estimate_times(route: Route, user_pace_factor: float = 1.0,
+                   weather_grid: Optional[ForecastGrid] = None,
+                   start_time: Optional[datetime] = None,
+                   terrain: Optional[Dict[str, np.ndarray]] = None,
+                   pace_profile: Optional[PaceProfile] = None) -> Route:
+    """
+    Estimate arrival times at each point using Naismith's Rule with modifications.
+    
+    user_pace_factor: Multiplier based on user's historical data (< 1 = faster, > 1 = slower)
+    pace_profile: Per-gradient and elapsed-time factors used instead of user_pace_factor
+    weather_grid: Optional forecast grid; conditions are interpolated to every point at its
+    arrival time and the weather factor applied, repeating until arrival times converge.
+    terrain: Precomputed terrain_arrays() for the route; only the pace-dependent part is rerun.
+    """
+    if not len(route):
+        return route
     
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
+    if terrain is None:
+        terrain = terrain_arrays(route.distance_from_start, route.elevation)
     
-    a = math.sin(delta_phi / 2) ** 2 + \
-        math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    profile_factor = None
+    if pace_profile is not None:
+        user_pace_factor = 1.0
+        profile_factor = profile_factors(terrain, pace_profile)
+    estimates = pace_arrays(terrain, user_pace_factor, profile_factor=profile_factor)
     
-    return R * c
+    if weather_grid is not None:
+        start = (start_time or datetime.now(timezone.utc)).timestamp()
+        for _ in range(WEATHER_MAX_ITERATIONS):
+            weather_factor = weather_grid.weather_factors(
+                route.distance_from_start, start + estimates['estimated_time']
+            )
+            updated = pace_arrays(terrain, user_pace_factor, weather_factor, profile_factor)
+            shift = np.max(np.abs(updated['estimated_time'] - estimates['estimated_time']))
+            estimates = updated
+            if shift < WEATHER_CONVERGENCE_SECONDS:
+                break
+        route.weather_factor = weather_factor.astype(FACTOR_DTYPE)
+        route.weather_applied = True
+    
+    route.estimated_time = estimates['estimated_time']
+    route.segment_speed = estimates['segment_speed'].astype(FACTOR_DTYPE)
+    route.gradient = terrain['gradient'].astype(FACTOR_DTYPE)
+    route.terrain_factor = terrain['terrain_factor'].astype(FACTOR_DTYPE)
+    route.estimated = True
+    
+    return route
 
 
-def calculate_gradient(elevation_change: float, distance: float) -> float:
-    """Calculate gradient as percentage"""
-    if distance == 0:
-        return 0
-    return (elevation_change / distance) * 100
+def read_estimate_options(options) -> Dict[str, Any]:
+    """Validate estimation options from form fields or a JSON body (raises ValueError)"""
+    weather_aware = str(options.get('weather_aware', '')).lower() in ('1', 'true', 'yes')
+    lod_tier = options.get('lod')
+    user_id = options.get('user_id') or None
+    return {
+        'user_pace_factor': float(options.get('pace_factor', 1.0)),
+        'user_id': validate_user_id(user_id) if user_id else None,
+        'weather_aware': weather_aware,
+        'start_time': parse_start_time(options.get('start_time')) if weather_aware else None,
+        'lod_tier': lod_tier,
+        'lod_tolerance': resolve_tolerance(lod_tier, options.get('tolerance')),
+    }
 
 
-def get_terrain_factor(gradient: float) -> float:
-    """
-    Calculate terrain factor based on gradient.
-    Positive gradient (uphill) slows down, negative (downhill) can speed up slightly.
-    """
-    if gradient > 0:
-        # Uphill: exponentially slower
-        return 1.0 + (gradient / 10) * 0.5
-    elif gradient < -15:
-        # Very steep downhill: actually slower due to caution
-        return 1.0 + (abs(gradient) - 15) / 20
-    elif gradient < 0:
-        # Moderate downhill: slightly faster
-        return max(0.85, 1.0 + gradient / 50)
-    return 1.0
-
-
-def get_weather_factor(weather: Optional[WeatherData]) -> float:
-    """Calculate speed reduction factor based on weather conditions"""
-    if not weather:
-        return 1.0
-    
-    factor = 1.0
-    
-    # Wind impact (headwind assumption - worst case)
-    if weather.wind_speed > 50:
-        factor *= 1.4  # Strong wind significantly slows
-    elif weather.wind_speed > 30:
-        factor *= 1.2
-    elif weather.wind_speed > 15:
-        factor *= 1.1
-    
-    # Precipitation impact
-    if weather.precipitation > 5:
-        factor *= 1.3  # Heavy rain
-    elif weather.precipitation > 1:
-        factor *= 1.15  # Light rain
-    
-    # Snow/cold impact
-    if weather.snow_depth > 30:
-        factor *= 2.0  # Deep snow - very slow
-    elif weather.snow_depth > 10:
-        factor *= 1.5
-    elif weather.snow_depth > 0:
-        factor *= 1.2
-    
-    # Temperature impact (extreme cold or heat)
-    if weather.temperature < -10:
-        factor *= 1.3
-    elif weather.temperature < 0:
-        factor *= 1.1
-    elif weather.temperature > 30:
-        factor *= 1.15
-    
-    return factor
-
-
-def get_weather_description(code: int) -> str:
-    """Convert WMO weather code to description"""
-    codes = {
-        0: "Clear sky",
-        1: "Mainly clear",
-        2: "Partly cloudy",
-        3: "Overcast",
-        45: "Foggy",
-        48: "Depositing rime fog",
-        51: "Light drizzle",
-        53: "Moderate drizzle",
-        55: "Dense drizzle",
-        61: "Slight rain",
-        63: "Moderate rain",
-        65: "Heavy rain",
-        66: "Light freezing rain",
-        67: "Heavy freezing rain",
-        71: "Slight snow",
-        73: "Moderate snow",
-        75: "Heavy snow",
-        77: "Snow grains",
-        80: "Slight rain showers",
-        81: "Moderate rain showers",
-        82: "Violent rain showers",
-        85: "Slight snow showers",
-        86: "Heavy snow showers",
-        95: "Thunderstorm",
-        96: "Thunderstorm with slight hail",
-        99: "Thunderstorm with heavy hail",
+def format_bounds(bounds) -> Optional[Dict[str, float]]:
+    """Format gpxpy bounds for Cesium"""
+    if not bounds:
+        return None
+    return {
+        'min_lat': bounds.min_latitude,
+        'max_lat': bounds.max_latitude,
+        'min_lon': bounds.min_longitude,
+        'max_lon': bounds.max_longitude
     }
-    return codes.get(code, "Unknown")
 
 
-async def fetch_weather_for_route_area(points: List[Dict], start_time: datetime):
+def estimate_stored_route(stored: StoredRoute,
+                          options: Dict[str, Any]) -> Tuple[Route, Optional[ForecastGrid], Optional[PaceProfile]]:
+    """Full-resolution estimate of a stored route, with the forecast grid and pace profile it used"""
+    # Estimate on a shallow copy: geometry arrays are shared, estimate arrays are per request
+    route = replace(stored.route)
+    
+    # Optionally apply forecast weather to every point at its arrival time
+    weather_grid = run_async(fetch_forecast_grid(route)) if options['weather_aware'] else None
+    
+    # A learned pace profile replaces the single pace factor when the user has one
+    pace_profile = pace_profiles.get(options['user_id']) if options['user_id'] else None
+    
+    with span('estimate', logger, points=len(route)):
+        route = estimate_times(route, options['user_pace_factor'], weather_grid, options['start_time'],
+                               stored.terrain, pace_profile)
+    return route, weather_grid, pace_profile
+
+
+def build_route_response(stored: StoredRoute, options: Dict[str, Any]) -> Tuple[Dict[str, Any], Route]:
     """
-    Fetch weather data for the route area, returning weather segments.
-    This creates environmental overlays (wind, rain, snow) rather than point-based weather.
+    Estimate a stored route for the given options. Returns the response fields other
+    than the points, and the route whose points are served (thinned for a level of detail).
     """
-    if not points:
-        return []
-
-    # Sample points along route to get weather segments
-    sample_rate = max(1, len(points) // 8)  # ~8 weather segments
-    sampled_points = points[::sample_rate]
-
-    print(f"Fetching weather for {len(sampled_points)} route segments...")
-
-    weather_segments = []
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        for i, point in enumerate(sampled_points):
-            try:
-                # Calculate estimated arrival time at this point
-                arrival_time = start_time + timedelta(seconds=point.get('estimated_time', 0))
-
-                # Ensure arrival_time is timezone-aware (use UTC if naive)
-                if arrival_time.tzinfo is None:
-                    arrival_time = arrival_time.replace(tzinfo=timezone.utc)
-
-                url = "https://api.open-meteo.com/v1/forecast"
-                params = {
-                    "latitude": point['lat'],
-                    "longitude": point['lon'],
-                    "hourly": "temperature_2m,precipitation,wind_speed_10m,wind_direction_10m,snow_depth,weather_code",
-                    "forecast_days": 3,
-                    "timezone": "auto"
-                }
-
-                print(f"Fetching weather for segment {i+1}/{len(sampled_points)}: lat={point['lat']}, lon={point['lon']}")
-
-                response = await client.get(url, params=params)
-                if response.status_code == 200:
-                    data = response.json()
-                    hourly = data.get('hourly', {})
-
-                    # Find the closest hour to arrival time
-                    times = hourly.get('time', [])
-                    hour_index = 0
-                    for j, t in enumerate(times):
-                        time_dt = datetime.fromisoformat(t)
-                        # Ensure both datetimes have timezone info for comparison
-                        if time_dt.tzinfo is None:
-                            time_dt = time_dt.replace(tzinfo=timezone.utc)
-                        if time_dt >= arrival_time:
-                            hour_index = j
-                            break
-
-                    # Extract weather data
-                    temp = hourly.get('temperature_2m', [15])[hour_index]
-                    precip = hourly.get('precipitation', [0])[hour_index]
-                    wind_speed = hourly.get('wind_speed_10m', [0])[hour_index]
-                    wind_dir = hourly.get('wind_direction_10m', [0])[hour_index]
-                    snow = hourly.get('snow_depth', [0])[hour_index] or 0
-                    weather_code = hourly.get('weather_code', [0])[hour_index]
-
-                    # Determine weather type for visualization
-                    has_rain = precip > 0.5 and snow == 0
-                    has_snow = snow > 0 or (weather_code in [71, 73, 75, 77, 85, 86])
-                    has_wind = wind_speed > 5  # km/h (lowered threshold for visibility)
-
-                    segment = {
-                        'lat': point['lat'],
-                        'lon': point['lon'],
-                        'temperature': temp,
-                        'precipitation': precip,
-                        'wind_speed': wind_speed,
-                        'wind_direction': wind_dir,
-                        'snow_depth': snow,
-                        'weather_code': weather_code,
-                        'description': get_weather_description(weather_code),
-                        'has_rain': has_rain,
-                        'has_snow': has_snow,
-                        'has_wind': has_wind,
-                        'distance_from_start': point.get('distance_from_start', 0)
-                    }
-
-                    print(f"✓ Segment {i+1}: {temp}°C, {get_weather_description(weather_code)}, wind={wind_speed}km/h @ {wind_dir}° | rain={has_rain}, snow={has_snow}, wind_arrow={has_wind}")
-                    weather_segments.append(segment)
-                else:
-                    print(f"✗ Weather API returned status {response.status_code} for segment {i+1}")
-
-            except Exception as e:
-                print(f"✗ Weather fetch error for segment {i+1}: {e}")
-
-    print(f"Weather fetch complete: {len(weather_segments)} segments")
-    return weather_segments
-
-
-def parse_gpx(gpx_content: str) -> Dict[str, Any]:
-    """Parse GPX file and extract route information"""
-    gpx = gpxpy.parse(gpx_content)
-    
-    points = []
-    total_distance = 0
-    total_ascent = 0
-    total_descent = 0
-    prev_point = None
-    
-    for track in gpx.tracks:
-        for segment in track.segments:
-            for point in segment.points:
-                if prev_point:
-                    dist = calculate_distance(
-                        prev_point.latitude, prev_point.longitude,
-                        point.latitude, point.longitude
-                    )
-                    total_distance += dist
-                    
-                    if point.elevation and prev_point.elevation:
-                        elev_change = point.elevation - prev_point.elevation
-                        if elev_change > 0:
-                            total_ascent += elev_change
-                        else:
-                            total_descent += abs(elev_change)
-                
-                points.append({
-                    'lat': point.latitude,
-                    'lon': point.longitude,
-                    'elevation': point.elevation or 0,
-                    'time': point.time.isoformat() if point.time else None,
-                    'distance_from_start': total_distance
-                })
-                
-                prev_point = point
-    
-    # Also check routes (not just tracks)
-    for route in gpx.routes:
-        for point in route.points:
-            if prev_point:
-                dist = calculate_distance(
-                    prev_point.latitude, prev_point.longitude,
-                    point.latitude, point.longitude
-                )
-                total_distance += dist
-            
-            points.append({
-                'lat': point.latitude,
-                'lon': point.longitude,
-                'elevation': point.elevation or 0,
-                'time': None,
-                'distance_from_start': total_distance
-            })
-            
-            prev_point = point
+    route, weather_grid, pace_profile = estimate_stored_route(stored, options)
     
-    return {
-        'points': points,
-        'total_distance': total_distance,
-        'total_ascent': total_ascent,
-        'total_descent': total_descent,
-        'bounds': gpx.get_bounds() if gpx.get_bounds() else None
+    route_data = {
+        'route_id': stored.route_id,
+        'total_distance': stored.total_distance,
+        'total_ascent': stored.total_ascent,
+        'total_descent': stored.total_descent,
+        'bounds': stored.bounds,
+        'weather_aware': weather_grid is not None
     }
+    if options['user_id']:
+        route_data['pace_profile'] = pace_profile.summary() if pace_profile else None
+    
+    served = route
+    lod_tolerance = options['lod_tolerance']
+    if lod_tolerance is not None:
+        lod = stored.level_of_detail()
+        kept = lod.indices(lod_tolerance)
+        served = route.take(kept)
+        route_data['lod'] = {
+            'tier': options['lod_tier'] or 'custom',
+            'tolerance': lod_tolerance,
+            'points': int(kept.size),
+            'total_points': len(route),
+            'tiers': lod.tier_sizes()
+        }
+    
+    # Calculate summary
+    if len(route):
+        total_time_seconds = route.total_time
+        route_data['estimated_total_time'] = total_time_seconds
+        route_data['estimated_total_time_formatted'] = format_duration(total_time_seconds)
+    
+    ROUTE_POINTS.observe(len(served), stage='served')
+    return route_data, served
 
 
-def estimate_times(points: List[Dict], user_pace_factor: float = 1.0) -> List[Dict]:
+def route_stream(stored: StoredRoute, options: Dict[str, Any]) -> Iterator[str]:
     """
-    Estimate arrival times at each point using Naismith's Rule with modifications.
-    
-    user_pace_factor: Multiplier based on user's historical data (< 1 = faster, > 1 = slower)
+    NDJSON records for a stored route: a header (bounds and totals, known from parsing
+    alone) before anything is estimated, the estimated points in chunks, then a summary
+    with the remaining response fields. A failure after the header ends the stream with
+    an error record, since the status line has already been sent.
     """
-    if not points:
-        return points
-    
-    estimated_points = []
-    total_time = 0  # seconds
-    
-    for i, point in enumerate(points):
-        if i == 0:
-            point['estimated_time'] = 0
-            point['segment_speed'] = BASE_SPEED_KMH
-            point['gradient'] = 0
-            point['terrain_factor'] = 1.0
-            estimated_points.append(point)
-            continue
-        
-        prev_point = points[i - 1]
-        
-        # Calculate segment distance
-        segment_distance = point['distance_from_start'] - prev_point['distance_from_start']
-        
-        # Calculate gradient
-        elevation_change = point['elevation'] - prev_point['elevation']
-        gradient = calculate_gradient(elevation_change, segment_distance)
-        
-        # Get terrain factor
-        terrain_factor = get_terrain_factor(gradient)
-        
-        # Calculate base time (Naismith's rule)
-        # Time = distance/speed + extra time for ascent
-        base_speed = BASE_SPEED_KMH / terrain_factor / user_pace_factor
-        
-        # Time in seconds
-        segment_time = (segment_distance / 1000) / base_speed * 3600
-        
-        # Add extra time for significant ascent (Naismith's rule: +1 min per 10m ascent)
-        if elevation_change > 0:
-            segment_time += (elevation_change / 10) * 60
-        
-        total_time += segment_time
-        
-        point['estimated_time'] = total_time
-        point['segment_speed'] = base_speed
-        point['gradient'] = gradient
-        point['terrain_factor'] = terrain_factor
-        
-        estimated_points.append(point)
-    
-    return estimated_points
+    yield ndjson_record({
+        'type': 'header',
+        'route_id': stored.route_id,
+        'bounds': stored.bounds,
+        'total_distance': stored.total_distance,
+        'total_ascent': stored.total_ascent,
+        'total_descent': stored.total_descent,
+        'total_points': len(stored.route)
+    })
+    try:
+        route_data, served = build_route_response(stored, options)
+        yield from route_point_records(served)
+        yield ndjson_record({'type': 'summary', **route_data, 'point_count': len(served)})
+    except Exception as e:
+        log_event(logger, logging.WARNING, 'route_stream_failed', route_id=stored.route_id[:12], error=e)
+        yield ndjson_record({'type': 'error', 'error': str(e)})
+
+
+def respond_with_route(stored: StoredRoute, options: Dict[str, Any]) -> Response:
+    """The estimated route as an NDJSON stream when asked for, else JSON or columnar binary"""
+    if wants_route_stream():
+        return stream_response(route_stream(stored, options))
+    return route_response(*build_route_response(stored, options))
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e: RequestEntityTooLarge):
+    """413 as JSON, whether the body is past MAX_CONTENT_LENGTH or an upload decompresses past its limit"""
+    return jsonify({'error': e.description}), 413
 
 
 @app.route('/api/health', methods=['GET'])
@@ -386,98 +347,572 @@ def health_check():
     return jsonify({'status': 'healthy', 'service': 'SanBernard API'})
 
 
+def read_gpx_request() -> Tuple[Any, Dict[str, Any]]:
+    """Uploaded GPX file and estimation options from the form (raises ValueError)"""
+    if 'file' not in request.files:
+        raise ValueError('No file provided')
+    
+    file = request.files['file']
+    if file.filename == '':
+        raise ValueError('No file selected')
+    
+    # Pace factor, weather and level of detail, plus DEM elevation, resampling and smoothing (all optional)
+    options = read_estimate_options(request.form)
+    options['preprocess'] = resolve_preprocess(request.form.get('spacing'), request.form.get('smoothing'),
+                                               request.form.get('dem'))
+    return file, options
+
+
+def load_route(stream, preprocess: Optional[Dict[str, Any]] = None) -> StoredRoute:
+    """Stored route for an upload stream; identical uploads with the same preprocessing are parsed once"""
+    preprocess = preprocess or resolve_preprocess()
+    route_id = hash_upload(stream, preprocess_key(preprocess))
+    stored = route_store.get(route_id)
+    if stored is None:
+        # Parse GPX incrementally from the upload stream
+        with span('parse', logger, route_id=route_id[:12]):
+            parsed = parse_gpx_stream(stream)
+        ROUTE_POINTS.observe(len(parsed['route']), stage='parsed')
+        # Fill elevation gaps, then optionally smooth and resample
+        with span('preprocess', logger, points=len(parsed['route'])):
+            parsed = preprocess_route(parsed, preprocess)
+        stored = store_parsed_route(route_id, parsed)
+    return stored
+
+
+def store_parsed_route(route_id: str, parsed: Dict[str, Any]) -> StoredRoute:
+    """Keep a parsed (and preprocessed) route in the route store"""
+    stored = make_stored_route(route_id, parsed['route'], parsed['total_distance'],
+                               parsed['total_ascent'], parsed['total_descent'],
+                               format_bounds(parsed['bounds']))
+    route_store.put(stored)
+    return stored
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Counters, histograms and cache statistics in Prometheus text format"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/parse-gpx', methods=['POST'])
 def parse_gpx_endpoint():
     """Parse a GPX file and return route data with time estimates"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
+        try:
+            file, options = read_gpx_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+        # Gzip and zip uploads are decompressed into a spooled buffer first
+        with open_gpx_upload(file.filename, file.stream) as stream:
+            stored = load_route(stream, options['preprocess'])
+        return respond_with_route(stored, options)
+    
+    except RequestEntityTooLarge as e:
+        return upload_too_large(e)
+    except ValueError as e:  # Corrupt archive or GPX
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/routes/<route_id>/estimate', methods=['POST'])
+def estimate_route(route_id: str):
+    """Re-estimate a previously uploaded route (e.g. for a new pace factor) without re-parsing"""
+    try:
+        try:
+            options = read_estimate_options(request.get_json(silent=True) or {})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        gpx_content = file.read().decode('utf-8')
+        stored = route_store.get(route_id)
+        if stored is None:
+            return jsonify({'error': 'Unknown route ID, please upload the GPX file again'}), 404
         
-        # Parse GPX
-        route_data = parse_gpx(gpx_content)
+        return respond_with_route(stored, options)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def read_progress_request() -> Dict[str, Any]:
+    """GPS fix and optional heading, last index, pace factor and elapsed time, from JSON or the query string"""
+    data = request.get_json(silent=True) or request.args
+    if data.get('lat') in (None, '') or data.get('lon') in (None, ''):
+        raise ValueError('lat and lon are required')
+    
+    def optional(name: str, kind: Callable[[Any], Any]) -> Any:
+        value = data.get(name)
+        return None if value in (None, '') else kind(value)
+    
+    return {
+        'lat': float(data['lat']),
+        'lon': float(data['lon']),
+        'heading': optional('heading', float),
+        'last_index': optional('last_index', int),
+        'user_pace_factor': float(data.get('pace_factor') or 1.0),
+        'elapsed_seconds': optional('elapsed_seconds', float)
+    }
+
+
+@app.route('/api/routes/<route_id>/progress', methods=['GET', 'POST'])
+def route_progress(route_id: str):
+    """
+    Where a live GPS fix is on a stored route: projected position, distance along and
+    remaining, and the remaining time and ETA (scaled by the pace so far when elapsed_seconds
+    is given). Answered from the route's spatial index and cached estimate.
+    """
+    try:
+        try:
+            fix = read_progress_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Get user pace factor from request (optional)
-        user_pace_factor = float(request.form.get('pace_factor', 1.0))
+        stored = route_store.get(route_id)
+        if stored is None:
+            return jsonify({'error': 'Unknown route ID, please upload the GPX file again'}), 404
         
-        # Estimate times
-        route_data['points'] = estimate_times(route_data['points'], user_pace_factor)
+        position = stored.spatial_index().match(fix['lat'], fix['lon'], fix['heading'], fix['last_index'])
+        if position is None:
+            return jsonify({'error': 'Route has no points'}), 422
         
-        # Calculate summary
-        if route_data['points']:
-            total_time_seconds = route_data['points'][-1]['estimated_time']
-            route_data['estimated_total_time'] = total_time_seconds
-            route_data['estimated_total_time_formatted'] = format_duration(total_time_seconds)
+        # Estimated time at the projected position, between the segment's end points
+        estimated_time = stored.estimated_time(fix['user_pace_factor'])
+        index, following = position['index'], min(position['index'] + 1, len(stored.route) - 1)
+        time_at_position = float(estimated_time[index] +
+                                 position['fraction'] * (estimated_time[following] - estimated_time[index]))
+        remaining_time = float(estimated_time[-1]) - time_at_position
         
-        # Format bounds for Cesium
-        if route_data['bounds']:
-            bounds = route_data['bounds']
-            route_data['bounds'] = {
-                'min_lat': bounds.min_latitude,
-                'max_lat': bounds.max_latitude,
-                'min_lon': bounds.min_longitude,
-                'max_lon': bounds.max_longitude
-            }
+        pace_ratio = None
+        if fix['elapsed_seconds'] is not None and time_at_position > 0:
+            pace_ratio = fix['elapsed_seconds'] / time_at_position
+            remaining_time *= pace_ratio
         
-        return jsonify(route_data)
+        total_distance = stored.route.total_distance
+        return jsonify({
+            'route_id': route_id,
+            **position,
+            'total_distance': total_distance,
+            'remaining_distance': total_distance - position['distance_along'],
+            'progress': position['distance_along'] / total_distance if total_distance else 1.0,
+            'estimated_time_at_position': time_at_position,
+            'pace_ratio': pace_ratio,
+            'remaining_time': remaining_time,
+            'remaining_time_formatted': format_duration(remaining_time),
+            'eta': (datetime.now(timezone.utc) + timedelta(seconds=remaining_time)).isoformat()
+        })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/weather', methods=['POST'])
-def get_weather():
-    """Get weather data for route points"""
-    import asyncio
+def read_legs_request() -> Dict[str, Any]:
+    """Estimation options plus leg, position and split queries from the JSON body (raises ValueError)"""
+    data = request.get_json(silent=True) or {}
+    legs = data.get('legs') or []
+    at_times = data.get('at_times') or []
+    if not isinstance(legs, list) or not isinstance(at_times, list):
+        raise ValueError('legs and at_times must be lists')
+    if not all(isinstance(leg, dict) for leg in legs):
+        raise ValueError('Each leg must be an object with from_/to_ index or distance fields')
+    if not all(isinstance(t, (str, int, float)) and not isinstance(t, bool) for t in at_times):
+        raise ValueError('at_times must be elapsed seconds or ISO times')
+    if len(legs) + len(at_times) > LEGS_MAX_QUERIES:
+        raise ValueError(f'Too many queries (at most {LEGS_MAX_QUERIES} legs and positions per request)')
+    
+    def leg_end(leg: Dict[str, Any], end: str) -> Tuple[bool, float]:
+        # (by index, value); a missing end is the start or the end of the route
+        if leg.get(f'{end}_index') is not None:
+            return True, int(leg[f'{end}_index'])
+        if leg.get(f'{end}_distance') is not None:
+            return False, float(leg[f'{end}_distance'])
+        return False, 0.0 if end == 'from' else math.inf
     
+    ends = [leg_end(leg, end) for leg in legs for end in ('from', 'to')]
+    options = read_estimate_options(data)
+    start = options['start_time'] or parse_start_time(data.get('start_time'))
+    # Positions are asked for as elapsed seconds or as clock times after the start
+    elapsed = [(parse_start_time(t) - start).total_seconds() if isinstance(t, str) else float(t) for t in at_times]
+    if any(e < 0 for e in elapsed):
+        raise ValueError('at_times must not be before the start time')
+    
+    def optional(name: str) -> Optional[float]:
+        return None if data.get(name) in (None, '') else float(data[name])
+    
+    return {
+        **options,
+        'start': start,
+        'by_index': np.array([by_index for by_index, _ in ends], dtype=bool),
+        'ends': np.array([value for _, value in ends], dtype=np.float64),
+        'elapsed': np.array(elapsed, dtype=np.float64),
+        'split_distance': optional('split_distance'),
+        'split_time': optional('split_time')
+    }
+
+
+def legs_report(prefix: RoutePrefix, query: Dict[str, Any]) -> Dict[str, Any]:
+    """Answer every leg, position and split query from the route's prefix arrays (raises ValueError)"""
+    start = query['start']
+    
+    def leg_list(legs: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+        return [{
+            'from_distance': float(legs['from_distance'][i]),
+            'to_distance': float(legs['to_distance'][i]),
+            'distance': float(legs['distance'][i]),
+            'time': float(legs['time'][i]),
+            'time_formatted': format_duration(legs['time'][i]),
+            'start': (start + timedelta(seconds=float(legs['from_time'][i]))).isoformat(),
+            'arrival': (start + timedelta(seconds=float(legs['to_time'][i]))).isoformat(),
+            'ascent': float(legs['ascent'][i]),
+            'descent': float(legs['descent'][i]),
+            'average_speed': float(legs['average_speed'][i])
+        } for i in range(legs['distance'].size)]
+    
+    # Leg ends given by point index are exact; the rest are located by distance
+    by_index, ends = query['by_index'], query['ends']
+    at_distance = prefix.at_distance(np.where(by_index, 0.0, ends))
+    at_index = prefix.at_index(np.where(by_index, ends, 0).astype(np.int64))
+    located = {name: np.where(by_index, at_index[name], at_distance[name]) for name in at_distance}
+    legs = prefix.legs({name: values[0::2] for name, values in located.items()},
+                       {name: values[1::2] for name, values in located.items()})
+    if np.any(legs['distance'] < 0):
+        raise ValueError('A leg ends before it starts')
+    
+    at_time = prefix.at_time(query['elapsed'])
+    positions = [{
+        'elapsed': float(query['elapsed'][i]),
+        'time': (start + timedelta(seconds=float(query['elapsed'][i]))).isoformat(),
+        'index': int(at_time['index'][i]),
+        'lat': float(at_time['lat'][i]),
+        'lon': float(at_time['lon'][i]),
+        'elevation': float(at_time['elevation'][i]),
+        'distance_along': float(at_time['distance'][i]),
+        'ascent': float(at_time['ascent'][i]),
+        'descent': float(at_time['descent'][i]),
+        'finished': bool(query['elapsed'][i] >= prefix.total_time)
+    } for i in range(query['elapsed'].size)]
+    
+    report = {
+        'total_distance': prefix.total_distance,
+        'estimated_total_time': prefix.total_time,
+        'estimated_total_time_formatted': format_duration(prefix.total_time),
+        'start_time': start.isoformat(),
+        'legs': leg_list(legs),
+        'positions': positions
+    }
+    if query['split_distance'] is not None:
+        report['distance_splits'] = leg_list(prefix.splits(every_distance=query['split_distance']))
+    if query['split_time'] is not None:
+        report['time_splits'] = leg_list(prefix.splits(every_time=query['split_time']))
+    return report
+
+
+@app.route('/api/routes/<route_id>/legs', methods=['POST'])
+def route_legs(route_id: str):
+    """
+    Leg statistics between distances or point indices, positions at elapsed or clock times,
+    and distance or time splits for a stored route. Without weather or a pace profile the
+    route's cached estimate is used, so each query is a binary search over prefix arrays.
+    """
     try:
-        data = request.get_json()
-        points = data.get('points', [])
-        start_time_str = data.get('start_time')
+        try:
+            query = read_legs_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if not points:
-            return jsonify({'error': 'No points provided'}), 400
+        stored = route_store.get(route_id)
+        if stored is None:
+            return jsonify({'error': 'Unknown route ID, please upload the GPX file again'}), 404
+        if not len(stored.route):
+            return jsonify({'error': 'Route has no points'}), 422
         
-        start_time = datetime.fromisoformat(start_time_str) if start_time_str else datetime.now()
+        weather_aware = query['weather_aware']
+        if weather_aware or query['user_id']:
+            route, weather_grid, _ = estimate_stored_route(stored, query)
+            weather_aware = weather_grid is not None
+            prefix = stored.route_prefix(estimated_time=route.estimated_time)
+        else:
+            prefix = stored.route_prefix(query['user_pace_factor'])
         
-        # Run async weather fetch for route area
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        weather_segments = loop.run_until_complete(fetch_weather_for_route_area(points, start_time))
-        loop.close()
-
-        # Calculate weather summary from segments
-        weather_summary = {
-            'available': len(weather_segments) > 0,
-            'segments': weather_segments
-        }
+        try:
+            with span('legs', logger, points=len(prefix), legs=query['ends'].size // 2):
+                report = legs_report(prefix, query)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'route_id': route_id, 'weather_aware': weather_aware, **report})
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        if weather_segments:
-            weather_summary.update({
-                'temp_range': {
-                    'min': min(s['temperature'] for s in weather_segments),
-                    'max': max(s['temperature'] for s in weather_segments)
-                },
-                'max_wind': max(s['wind_speed'] for s in weather_segments),
-                'total_precipitation': sum(s['precipitation'] for s in weather_segments),
-                'has_snow': any(s['has_snow'] for s in weather_segments),
-                'has_rain': any(s['has_rain'] for s in weather_segments),
-                'conditions': list(set(s['description'] for s in weather_segments))
-            })
 
-        return jsonify({
-            'weather_summary': weather_summary
+def read_uncertainty_request() -> Dict[str, Any]:
+    """Estimation options plus scenario count, percentiles, seed and deadline from the JSON body (raises ValueError)"""
+    data = request.get_json(silent=True) or {}
+    options = read_estimate_options(data)
+    seed = data.get('seed')
+    return {
+        **options,
+        'start': options['start_time'] or parse_start_time(data.get('start_time')),
+        'samples': resolve_samples(data.get('samples')),
+        'percentiles': resolve_percentiles(data.get('percentiles')),
+        'seed': None if seed in (None, '') else int(seed),
+        'deadline': parse_start_time(data['deadline']) if data.get('deadline') else None,
+        'per_point': str(data.get('per_point', '')).lower() in ('1', 'true', 'yes')
+    }
+
+
+def uncertainty_report(stored: StoredRoute, query: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Finish-time percentiles, chance of finishing before dark (and before a deadline) and
+    percentile arrival curves, simulated around the route's deterministic estimate
+    """
+    route, weather_grid, pace_profile = estimate_stored_route(stored, query)
+    user_pace_factor = query['user_pace_factor']
+    profile_factor = None
+    if pace_profile is not None:
+        user_pace_factor = 1.0
+        profile_factor = profile_factors(stored.terrain, pace_profile)
+    segments = segment_times(stored.terrain, user_pace_factor, profile_factor)
+    weather_factor = route.weather_factor if route.weather_applied else None
+    
+    with span('simulate', logger, samples=query['samples'], points=len(route)):
+        simulation = simulate_eta(route.distance_from_start, route.estimated_time, segments, weather_factor,
+                                  query['samples'], query['percentiles'], query['seed'])
+    total_time = simulation['total_time']
+    start = query['start']
+    
+    def finish_probability(deadline: Optional[datetime]) -> Optional[float]:
+        if deadline is None:
+            return None
+        return round(float(np.mean(total_time <= (deadline - start).total_seconds())), 4)
+    
+    quantiles = []
+    for percentile, value in zip(query['percentiles'], np.percentile(total_time, query['percentiles'])):
+        quantiles.append({
+            'percentile': percentile,
+            'total_time': float(value),
+            'total_time_formatted': format_duration(value),
+            'finish': (start + timedelta(seconds=float(value))).isoformat()
+        })
+    
+    # Daylight at the finish point on the day of the start (no chance when starting after dark)
+    sunset = day_sunset(float(route.lat[-1]), float(route.lon[-1]), start)
+    
+    curves = simulation['curves']
+    if query['per_point'] or len(route) <= UNCERTAINTY_CURVE_POINTS:
+        kept = np.arange(len(route))
+    else:
+        kept = np.unique(np.linspace(0, len(route) - 1, UNCERTAINTY_CURVE_POINTS).round().astype(np.int64))
+    
+    report = {
+        'samples': query['samples'],
+        'seed': query['seed'],
+        'weather_aware': weather_grid is not None,
+        'start_time': start.isoformat(),
+        'estimated_total_time': route.total_time,
+        'estimated_total_time_formatted': format_duration(route.total_time),
+        'mean_total_time': float(total_time.mean()),
+        'std_total_time': float(total_time.std()),
+        'quantiles': quantiles,
+        'sunset': sunset.isoformat() if sunset else None,
+        'p_before_dark': 0.0 if sunset is not None and sunset <= start else finish_probability(sunset),
+        'deadline': query['deadline'].isoformat() if query['deadline'] else None,
+        'p_before_deadline': finish_probability(query['deadline']),
+        'curves': {
+            'percentiles': query['percentiles'],
+            'index': kept.tolist(),
+            'distance_from_start': route.distance_from_start[kept].tolist(),
+            'arrival_time': curves[:, kept].tolist()
+        },
+        'noise_blocks': simulation['blocks']
+    }
+    if pace_profile is not None:
+        report['pace_profile'] = pace_profile.summary()
+    return report
+
+
+@app.route('/api/routes/<route_id>/uncertainty', methods=['POST'])
+def route_uncertainty(route_id: str):
+    """
+    Monte Carlo ETA bands for a stored route: P10/P50/P90 (or requested percentiles) finish
+    times, the chance of finishing before sunset, and percentile arrival curves
+    """
+    try:
+        try:
+            query = read_uncertainty_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        stored = route_store.get(route_id)
+        if stored is None:
+            return jsonify({'error': 'Unknown route ID, please upload the GPX file again'}), 404
+        if len(stored.route) < 2:
+            return jsonify({'error': 'Route needs at least two points'}), 422
+        
+        return jsonify({'route_id': route_id, **uncertainty_report(stored, query)})
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def read_batch_request() -> Tuple[List[Any], Dict[str, Any]]:
+    """Uploaded GPX files and/or zip archives, with the parse-gpx options plus include_points (raises ValueError)"""
+    if 'files' not in request.files:
+        raise ValueError('No files provided')
+    
+    options = read_estimate_options(request.form)
+    options['preprocess'] = resolve_preprocess(request.form.get('spacing'), request.form.get('smoothing'),
+                                               request.form.get('dem'))
+    options['include_points'] = str(request.form.get('include_points', '')).lower() in ('1', 'true', 'yes')
+    return request.files.getlist('files'), options
+
+
+def batch_summary(filename: str, stored: StoredRoute, options: Dict[str, Any]) -> Dict[str, Any]:
+    """One route of a batch: the parse-gpx response fields, with points only when asked for"""
+    try:
+        route_data, served = build_route_response(stored, options)
+    except Exception as e:
+        return {'filename': filename, 'route_id': stored.route_id, 'error': str(e)}
+    summary = {'filename': filename, **route_data}
+    if options['include_points']:
+        summary['points'] = served.to_points()
+    return summary
+
+
+def batch_report(files: List[Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Estimate every GPX file of a batch, in upload order. Files are spooled to disk one at a
+    time; routes already in the store are estimated straight away and the rest are parsed
+    in the worker pool, a bounded window at a time, and estimated as each one arrives.
+    """
+    workdir = tempfile.mkdtemp(prefix='sanbernard-batch-')
+    variant = preprocess_key(options['preprocess'])
+    routes: List[Dict[str, Any]] = []
+    
+    def uncached():
+        for filename, path in spool_uploads(files, workdir, BATCH_MAX_ROUTES):
+            with open(path, 'rb') as f:
+                route_id = hash_upload(f, variant)
+            stored = route_store.get(route_id)
+            if stored is not None:
+                os.remove(path)
+                routes.append(batch_summary(filename, stored, options))
+                continue
+            routes.append({'filename': filename})
+            yield (len(routes) - 1, route_id), path
+    
+    try:
+        with span('batch', logger):
+            for (index, route_id), parsed, error in parse_route_files(uncached(), options['preprocess']):
+                if error is not None:
+                    routes[index]['error'] = error
+                    continue
+                ROUTE_POINTS.observe(len(parsed['route']), stage='parsed')
+                stored = store_parsed_route(route_id, parsed)
+                routes[index] = batch_summary(routes[index]['filename'], stored, options)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    return {
+        'routes': routes,
+        'route_count': len(routes),
+        'failed_routes': sum(1 for route in routes if 'error' in route)
+    }
+
+
+@app.route('/api/batch-estimate', methods=['POST'])
+def batch_estimate():
+    """Parse and estimate many GPX files, or zip archives of them, in one request"""
+    try:
+        try:
+            files, options = read_batch_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify(batch_report(files, options))
+    
+    except RequestEntityTooLarge as e:
+        return upload_too_large(e)
+    except ValueError as e:  # Corrupt archive or too many routes
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def read_weather_request() -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Route points and optional start time from the JSON body (raises ValueError)"""
+    data = request.get_json()
+    points = data.get('points', [])
+    if not points:
+        raise ValueError('No points provided')
+    return points, data.get('start_time')
+
+
+def weather_report(points: List[Dict[str, Any]], start_time_str: Optional[str]) -> Dict[str, Any]:
+    """Forecast segments along the route plus their summary"""
+    start_time = datetime.fromisoformat(start_time_str) if start_time_str else datetime.now()
+    
+    # Run async weather fetch for route area on the shared event loop
+    weather_segments = run_async(fetch_weather_for_route_area(Route.from_points(points), start_time))
+
+    # Calculate weather summary from segments
+    weather_summary = {
+        'available': len(weather_segments) > 0,
+        'segments': weather_segments
+    }
+
+    if weather_segments:
+        weather_summary.update({
+            'temp_range': {
+                'min': min(s['temperature'] for s in weather_segments),
+                'max': max(s['temperature'] for s in weather_segments)
+            },
+            'max_wind': max(s['wind_speed'] for s in weather_segments),
+            'total_precipitation': sum(s['precipitation'] for s in weather_segments),
+            'has_snow': any(s['has_snow'] for s in weather_segments),
+            'has_rain': any(s['has_rain'] for s in weather_segments),
+            'conditions': list(set(s['description'] for s in weather_segments))
         })
+
+    return {
+        'weather_summary': weather_summary
+    }
+
+
+@app.route('/api/weather', methods=['POST'])
+def get_weather():
+    """Get weather data for route points"""
+    try:
+        try:
+            points, start_time_str = read_weather_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify(weather_report(points, start_time_str))
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/elevation', methods=['GET'])
+def elevation_stats():
+    """DEM tile directory and how many tiles are memory-mapped"""
+    service = get_elevation_service()
+    if service is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **service.stats()})
+
+
+@app.route('/api/weather/cache', methods=['GET'])
+def weather_cache_stats():
+    """Forecast cache hit/miss counts and occupancy, for sizing the cache"""
+    cache = get_weather_client().cache
+    if cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **cache.stats()})
+
+
 def summarize_weather(weather_data: List[Optional[WeatherData]]) -> Dict:
     """Create a summary of weather conditions along the route"""
     valid_weather = [w for w in weather_data if w]
@@ -498,6 +933,16 @@ def summarize_weather(weather_data: List[Optional[WeatherData]]) -> Dict:
     }
 
 
+def parse_start_time(value: Optional[str]) -> datetime:
+    """Parse an ISO start time (naive times are UTC); defaults to now"""
+    if not value:
+        return datetime.now(timezone.utc)
+    start_time = datetime.fromisoformat(value)
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+    return start_time
+
+
 def format_duration(seconds: float) -> str:
     """Format duration in seconds to human readable string"""
     hours = int(seconds // 3600)
@@ -508,6 +953,187 @@ def format_duration(seconds: float) -> str:
     return f"{minutes}m"
 
 
+def iso_utc(epoch_seconds: float) -> str:
+    return datetime.fromtimestamp(epoch_seconds, tz=timezone.utc).isoformat()
+
+
+def read_sweep_request() -> Dict[str, Any]:
+    """Route, pace options and candidate start times from the JSON body (raises ValueError)"""
+    data = request.get_json(silent=True) or {}
+    if not data.get('route_id') and not data.get('points'):
+        raise ValueError('Provide a route_id or points')
+    
+    window_start = parse_start_time(data.get('window_start'))
+    window_end = (parse_start_time(data['window_end']) if data.get('window_end')
+                  else window_start + timedelta(hours=SWEEP_DEFAULT_HOURS))
+    step_minutes = float(data.get('step_minutes', SWEEP_DEFAULT_STEP_MINUTES))
+    top = int(data.get('top', 10))
+    if top < 1:
+        raise ValueError('top must be at least 1')
+    return {
+        **read_estimate_options(data),
+        'route_id': data.get('route_id'),
+        'points': data.get('points'),
+        'step_minutes': step_minutes,
+        'starts': departure_starts(window_start.timestamp(), window_end.timestamp(), step_minutes * 60),
+        'top': top
+    }
+
+
+def departure_report(route: Route, terrain: Dict[str, np.ndarray],
+                     options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Ranked departures and best windows over the candidate start times, from one forecast
+    grid fetch (None when no forecast is available)
+    """
+    weather_grid = run_async(fetch_forecast_grid(route))
+    if weather_grid is None:
+        return None
+    
+    # The pace-dependent estimate without weather is shared by every start time
+    pace_profile = pace_profiles.get(options['user_id']) if options['user_id'] else None
+    user_pace_factor = options['user_pace_factor']
+    profile_factor = None
+    if pace_profile is not None:
+        user_pace_factor = 1.0
+        profile_factor = profile_factors(terrain, pace_profile)
+    calm_time = pace_arrays(terrain, user_pace_factor, profile_factor=profile_factor)['estimated_time']
+    
+    starts = options['starts']
+    with span('departure_sweep', logger, starts=starts.size, points=len(route)):
+        sweep = sweep_departures(route.distance_from_start, calm_time, weather_grid, starts)
+    
+    calm_total = float(calm_time[-1])
+    forecast_end = float(weather_grid.times[-1]) if weather_grid.times.size else None
+    departures = ranked_departures(starts, sweep, calm_total, forecast_end, options['top'])
+    for departure in departures:
+        departure['estimated_total_time_formatted'] = format_duration(departure['estimated_total_time'])
+        departure['start'] = iso_utc(departure['start'])
+        departure['arrival'] = iso_utc(departure['arrival'])
+    
+    total_time = sweep['total_time']
+    windows = [{
+        'start': iso_utc(starts[w['first']]),
+        'end': iso_utc(starts[w['last']]),
+        'best_start': iso_utc(starts[w['best']]),
+        'estimated_total_time': float(total_time[w['best']]),
+        'estimated_total_time_formatted': format_duration(total_time[w['best']])
+    } for w in best_windows(starts, total_time)]
+    
+    return {
+        'candidates': int(starts.size),
+        'window_start': iso_utc(starts[0]),
+        'window_end': iso_utc(starts[-1]),
+        'step_minutes': options['step_minutes'],
+        'calm_total_time': calm_total,
+        'calm_total_time_formatted': format_duration(calm_total),
+        'forecast_end': iso_utc(forecast_end) if forecast_end is not None else None,
+        'pace_profile': pace_profile.summary() if pace_profile else None,
+        'windows': windows,
+        'departures': departures
+    }
+
+
+@app.route('/api/departure-sweep', methods=['POST'])
+def departure_sweep():
+    """
+    Weather-adjusted ETAs for every start time in a window, for a stored route (route_id)
+    or route points, ranked best first
+    """
+    try:
+        try:
+            options = read_sweep_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if options['route_id']:
+            stored = route_store.get(options['route_id'])
+            if stored is None:
+                return jsonify({'error': 'Unknown route ID, please upload the GPX file again'}), 404
+            route, terrain = stored.route, stored.terrain
+        else:
+            route = Route.from_points(options['points'])
+            terrain = terrain_arrays(route.distance_from_start, route.elevation)
+        
+        report = departure_report(route, terrain, options)
+        if report is None:
+            return jsonify({'error': 'Weather forecast unavailable'}), 502
+        return jsonify({'route_id': options['route_id'], **report})
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def read_history_request() -> Tuple[List[Any], Optional[str], List[Tuple[str, str]]]:
+    """
+    Uploaded activity files, optional user_id, and the synced Garmin activities of the
+    session given as session_id (read from the store in place) from the form (raises ValueError)
+    """
+    synced = []
+    if request.form.get('session_id'):
+        session = garmin_sessions.get(request.form['session_id'])
+        if session is None:
+            raise ValueError('Unknown or expired Garmin session, please connect again')
+        synced = get_activity_store().activity_uploads(session.user_key)
+    
+    if 'files' not in request.files and not synced:
+        raise ValueError('No files provided')
+    
+    user_id = request.form.get('user_id') or None
+    return request.files.getlist('files'), validate_user_id(user_id) if user_id else None, synced
+
+
+def spool_history_uploads(files: List[Any]) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Spool each upload (every GPX file of a zip archive, gzip files decompressed) to its own
+    file so workers stream from disk instead of every activity being held in memory at
+    once. Returns the directory and (filename, path) pairs.
+    """
+    workdir = tempfile.mkdtemp(prefix='sanbernard-history-')
+    try:
+        uploads = list(spool_uploads(files, workdir))
+    except Exception:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    return workdir, uploads
+
+
+def history_report(workdir: str, uploads: List[Tuple[str, str]], user_id: Optional[str],
+                   progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """Analyze spooled history uploads (removing them afterwards) into the API response"""
+    try:
+        with span('history', logger, files=len(uploads)):
+            result = analyze_history_files(uploads, progress)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    # Only the new activities' bin sums are added; the profile is never rebuilt
+    profile = None
+    if user_id:
+        pace_profile, added = pace_profiles.update(user_id, result['profile_sums'])
+        profile = {**pace_profile.summary(), 'activities_added': added}
+    
+    if not result['activities_analyzed']:
+        return {
+            'error': 'No valid activities with timing data found',
+            'pace_factor': 1.0,
+            'files': result['files'],
+            'failed_files': result['failed_files'],
+            'pace_profile': profile
+        }
+    
+    avg_pace_factor = result['pace_factor']
+    
+    return {
+        'pace_factor': round(avg_pace_factor, 3),
+        'activities_analyzed': result['activities_analyzed'],
+        'interpretation': interpret_pace(avg_pace_factor),
+        'files': result['files'],
+        'failed_files': result['failed_files'],
+        'pace_profile': profile
+    }
+
+
 @app.route('/api/analyze-history', methods=['POST'])
 def analyze_history():
     """
@@ -515,75 +1141,174 @@ def analyze_history():
     Compares actual times with estimated times to learn user's pace.
     """
     try:
-        if 'files' not in request.files:
-            return jsonify({'error': 'No files provided'}), 400
+        try:
+            files, user_id, synced = read_history_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        files = request.files.getlist('files')
-        
-        pace_factors = []
-        
-        for file in files:
-            gpx_content = file.read().decode('utf-8')
-            gpx = gpxpy.parse(gpx_content)
-            
-            for track in gpx.tracks:
-                for segment in track.segments:
-                    if len(segment.points) < 2:
-                        continue
-                    
-                    # Get actual time from GPX
-                    start_time = segment.points[0].time
-                    end_time = segment.points[-1].time
-                    
-                    if not start_time or not end_time:
-                        continue
-                    
-                    actual_duration = (end_time - start_time).total_seconds()
-                    
-                    # Calculate estimated time
-                    points = [{
-                        'lat': p.latitude,
-                        'lon': p.longitude,
-                        'elevation': p.elevation or 0,
-                        'distance_from_start': 0
-                    } for p in segment.points]
-                    
-                    # Calculate distances
-                    total_dist = 0
-                    for i in range(1, len(points)):
-                        dist = calculate_distance(
-                            points[i-1]['lat'], points[i-1]['lon'],
-                            points[i]['lat'], points[i]['lon']
-                        )
-                        total_dist += dist
-                        points[i]['distance_from_start'] = total_dist
-                    
-                    estimated_points = estimate_times(points)
-                    estimated_duration = estimated_points[-1]['estimated_time']
-                    
-                    if estimated_duration > 0:
-                        pace_factor = actual_duration / estimated_duration
-                        pace_factors.append(pace_factor)
+        workdir, uploads = spool_history_uploads(files)
+        uploads += synced
+        return jsonify(history_report(workdir, uploads, user_id))
+    
+    except RequestEntityTooLarge as e:
+        return upload_too_large(e)
+    except ValueError as e:  # Corrupt archive
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/pace-profile/<user_id>', methods=['GET', 'DELETE'])
+def pace_profile_endpoint(user_id: str):
+    """Inspect or reset a user's learned pace profile"""
+    try:
+        validate_user_id(user_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if request.method == 'DELETE':
+        if not pace_profiles.delete(user_id):
+            return jsonify({'error': 'Unknown user_id'}), 404
+        return jsonify({'deleted': user_id})
+    
+    profile = pace_profiles.get(user_id)
+    if profile is None:
+        return jsonify({'error': 'Unknown user_id'}), 404
+    return jsonify(profile.to_table())
+
+
+def submit_job(kind: str, fn: Callable[..., Any], *args, cleanup: Optional[Callable[[], None]] = None):
+    """Queue fn(job, *args) and answer 202 with where to poll; 429 when the queue is full"""
+    try:
+        job = job_queue.submit(kind, fn, *args)
+    except QueueFullError as e:
+        if cleanup is not None:
+            cleanup()
+        return jsonify({'error': str(e)}), 429
+    
+    response = jsonify(job.to_dict())
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response
+
+
+def run_parse_job(job: Job, path: str, options: Dict[str, Any]) -> Tuple[Dict[str, Any], Route]:
+    try:
+        job.report(0.1, 'Parsing GPX')
+        with mapped_file(path) as f:
+            stored = load_route(f, options['preprocess'])
+    finally:
+        os.remove(path)
+    job.report(0.5, 'Estimating times')
+    return build_route_response(stored, options)
+
+
+def run_history_job(job: Job, workdir: str, uploads: List[Tuple[str, str]],
+                    user_id: Optional[str]) -> Dict[str, Any]:
+    def progress(done: int, total: int):
+        job.report(done / total, f'{done} of {total} files analyzed')
+    return history_report(workdir, uploads, user_id, progress)
+
+
+def run_weather_job(job: Job, points: List[Dict[str, Any]], start_time_str: Optional[str]) -> Dict[str, Any]:
+    job.report(0.0, 'Fetching forecasts')
+    return weather_report(points, start_time_str)
+
+
+@app.route('/api/jobs/parse-gpx', methods=['POST'])
+def parse_gpx_job():
+    """Queue /api/parse-gpx; the result is served from /api/jobs/<job_id>/result"""
+    try:
+        try:
+            file, options = read_gpx_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if not pace_factors:
-            return jsonify({
-                'error': 'No valid activities with timing data found',
-                'pace_factor': 1.0
-            }), 200
+        # The upload only lives as long as this request, so the job reads a (decompressed) copy
+        fd, path = tempfile.mkstemp(prefix='sanbernard-upload-', suffix='.gpx')
+        try:
+            with open_gpx_upload(file.filename, file.stream) as stream, os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(stream, f, COPY_CHUNK_BYTES)
+        except Exception:
+            os.remove(path)
+            raise
+        return submit_job('parse-gpx', run_parse_job, path, options, cleanup=lambda: os.remove(path))
+    
+    except RequestEntityTooLarge as e:
+        return upload_too_large(e)
+    except ValueError as e:  # Corrupt archive
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/jobs/analyze-history', methods=['POST'])
+def analyze_history_job():
+    """Queue /api/analyze-history; progress counts analyzed files"""
+    try:
+        try:
+            files, user_id, synced = read_history_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Calculate average pace factor
-        avg_pace_factor = sum(pace_factors) / len(pace_factors)
+        workdir, uploads = spool_history_uploads(files)
+        uploads += synced
+        return submit_job('analyze-history', run_history_job, workdir, uploads, user_id,
+                          cleanup=lambda: shutil.rmtree(workdir, ignore_errors=True))
+    
+    except RequestEntityTooLarge as e:
+        return upload_too_large(e)
+    except ValueError as e:  # Corrupt archive
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/jobs/weather', methods=['POST'])
+def weather_job():
+    """Queue /api/weather"""
+    try:
+        try:
+            points, start_time_str = read_weather_request()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return jsonify({
-            'pace_factor': round(avg_pace_factor, 3),
-            'activities_analyzed': len(pace_factors),
-            'interpretation': interpret_pace(avg_pace_factor)
-        })
+        return submit_job('weather', run_weather_job, points, start_time_str)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/jobs', methods=['GET'])
+def job_queue_stats():
+    """Job counts by status and queue limits"""
+    return jsonify(job_queue.stats())
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id: str):
+    """Status and progress of a job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job ID'}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id: str):
+    """The finished job's response, exactly as the synchronous endpoint would have sent it"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job ID'}), 404
+    if not job.done:
+        return jsonify(job.to_dict()), 202
+    if job.status == FAILED:
+        return jsonify({'error': job.error}), 500
+    if job.kind == 'parse-gpx':
+        return route_response(*job.result)
+    return jsonify(job.result)
+
+
 def interpret_pace(pace_factor: float) -> str:
     """Interpret the pace factor for users"""
     if pace_factor < 0.8:
@@ -598,15 +1323,21 @@ def interpret_pace(pace_factor: float) -> str:
         return "You prefer a leisurely pace. Times will be adjusted accordingly."
 
 
+def read_garmin_session() -> Optional[GarminSession]:
+    """Session named by the X-Garmin-Session header or a session_id field/query parameter"""
+    data = request.get_json(silent=True) or {}
+    session_id = (request.headers.get('X-Garmin-Session') or data.get('session_id') or
+                  request.form.get('session_id') or request.args.get('session_id'))
+    return garmin_sessions.get(session_id)
+
+
 @app.route('/api/garmin/connect', methods=['POST'])
 def garmin_connect():
     """
     Connect to Garmin and fetch activity data.
-    Note: Requires user's Garmin credentials.
+    Note: Requires user's Garmin credentials. Connecting again reuses the account's session.
     """
     try:
-        import garth
-        
         data = request.get_json()
         email = data.get('email')
         password = data.get('password')
@@ -614,17 +1345,16 @@ def garmin_connect():
         if not email or not password:
             return jsonify({'error': 'Email and password required'}), 400
         
-        # Login to Garmin
-        garth.login(email, password)
+        # Login to Garmin (once per account while the session is in use)
+        session, reused = garmin_sessions.login(email, password)
         
         # Get recent activities
-        activities = garth.connectapi("/activitylist-service/activities/search/activities", params={
-            "limit": 50,
-            "activityType": "hiking,walking,running"
-        })
+        activities = run_async(get_garmin_client().activity_page(session.auth(), 0))
         
         return jsonify({
             'connected': True,
+            'session_id': session.session_id,
+            'reused_session': reused,
             'activities_count': len(activities),
             'activities': activities
         })
@@ -633,15 +1363,31 @@ def garmin_connect():
         return jsonify({'error': str(e), 'connected': False}), 500
 
 
+@app.route('/api/garmin/sync', methods=['POST'])
+def garmin_sync():
+    """Download activities newer than the last sync into the local store (for analyze-history)"""
+    try:
+        session = read_garmin_session()
+        if session is None:
+            return jsonify({'error': 'Unknown or expired Garmin session, please connect again'}), 401
+        
+        return jsonify(sync_activities(session, get_garmin_client(), get_activity_store()))
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/garmin/activity/<activity_id>/gpx', methods=['GET'])
 def get_garmin_gpx(activity_id: str):
-    """Download GPX for a specific Garmin activity"""
+    """Download GPX for a specific Garmin activity (served from the store once synced)"""
     try:
-        import garth
+        session = read_garmin_session()
+        if session is None:
+            return jsonify({'error': 'Unknown or expired Garmin session, please connect again'}), 401
         
-        gpx_data = garth.connectapi(f"/download-service/files/activity/{activity_id}", params={
-            "format": "gpx"
-        })
+        path = fetch_activity_gpx(session, get_garmin_client(), get_activity_store(), activity_id)
+        with open(path, encoding='utf-8') as f:
+            gpx_data = f.read()
         
         return jsonify({'gpx': gpx_data})
     
@@ -0,0 +1,71 @@
+"""
+SanBernard Batch Parsing
+Many GPX files (or zip archives of them) parsed in the worker pool, a bounded window at a time
+"""
+
+import os
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from gpx_stream import parse_gpx_stream
+from history import HISTORY_WORKERS, get_pool, reset_pool
+from preprocess import preprocess_route
+from uploads import mapped_file
+
+BATCH_MAX_ROUTES = int(os.environ.get('BATCH_MAX_ROUTES', 200))  # GPX files per request, zip entries included
+BATCH_WINDOW = int(os.environ.get('BATCH_WINDOW', 2 * HISTORY_WORKERS))  # Files spooled or parsing at once
+
+
+def parse_route_file(path: str, preprocess: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker entry point: parse and preprocess one spooled GPX file from its memory map"""
+    with mapped_file(path) as f:
+        parsed = preprocess_route(parse_gpx_stream(f), preprocess)
+    return {
+        'route': parsed['route'],
+        'total_distance': parsed['total_distance'],
+        'total_ascent': parsed['total_ascent'],
+        'total_descent': parsed['total_descent'],
+        'bounds': parsed['bounds']
+    }
+
+
+def parse_route_files(pending: Iterable[Tuple[Any, str]], preprocess: Dict[str, Any],
+                      window: int = BATCH_WINDOW) -> Iterator[Tuple[Any, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Parse (key, path) pairs in the worker pool, yielding (key, parsed, error) as each
+    finishes. pending is consumed lazily: at most `window` files are submitted at once,
+    and each file is removed as soon as its result is in.
+    """
+    pool = get_pool()
+    pending = iter(pending)
+    in_flight: Dict[Any, Tuple[Any, str]] = {}
+
+    def refill():
+        for key, path in pending:
+            in_flight[pool.submit(parse_route_file, path, preprocess)] = (key, path)
+            if len(in_flight) >= window:
+                return
+
+    try:
+        refill()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, path = in_flight.pop(future)
+                os.remove(path)
+                try:
+                    parsed, error = future.result(), None
+                except BrokenProcessPool as e:
+                    parsed, error = None, f'Worker process failed: {e}'
+                    # Files still in the old pool fail with it; the rest go to a fresh one
+                    if pool is get_pool():
+                        reset_pool(pool)
+                    pool = get_pool()
+                except Exception as e:
+                    parsed, error = None, str(e)
+                yield key, parsed, error
+            refill()
+    finally:
+        for future in in_flight:
+            future.cancel()
@@ -0,0 +1,136 @@
+"""
+SanBernard Mock Garmin Server
+Local stand-in for the Garmin Connect activity list and GPX download endpoints
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.synthetic import synthetic_gpx
+
+ACCESS_TOKEN = 'mock-access-token'
+FIRST_ACTIVITY_ID = 10_000_000_000
+LATENCY_SECONDS = 0.02  # Per call
+
+
+def stand_in_client():
+    """garth client holding long-lived tokens the stand-in accepts (no SSO login needed)"""
+    import garth
+    from garth.auth_tokens import OAuth1Token, OAuth2Token
+    far_future = int(time.time()) + 365 * 24 * 3600
+    client = garth.Client()
+    client.configure(
+        oauth1_token=OAuth1Token(oauth_token='mock', oauth_token_secret='mock'),
+        oauth2_token=OAuth2Token(scope='', jti='mock', token_type='Bearer', access_token=ACCESS_TOKEN,
+                                 refresh_token='mock', expires_in=far_future, expires_at=far_future,
+                                 refresh_token_expires_in=far_future, refresh_token_expires_at=far_future)
+    )
+    return client
+
+
+class _GarminHandler(BaseHTTPRequestHandler):
+    server: 'MockGarminServer._Server'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if self.headers.get('Authorization') != f'Bearer {ACCESS_TOKEN}':
+            self._send(401, b'{"error": "unauthorized"}', 'application/json')
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with self.server.lock:
+            self.server.requests.append(url.path)
+            activities = list(self.server.activities)
+
+        if url.path == '/activitylist-service/activities/search/activities':
+            start = int(query.get('start', ['0'])[0])
+            limit = int(query.get('limit', ['20'])[0])
+            newest_first = activities[::-1]
+            self._send(200, json.dumps(newest_first[start:start + limit]).encode('utf-8'), 'application/json')
+        elif url.path.startswith('/download-service/files/activity/'):
+            name = url.path.rsplit('/', 1)[1]
+            activity_id = int(name) if name.isdigit() else None
+            if activity_id is None or activity_id in self.server.failing or not any(a['activityId'] == activity_id for a in activities):
+                self._send(404, b'{"error": "not found"}', 'application/json')
+                return
+            gpx = synthetic_gpx(self.server.points, seed=activity_id % 100_000)
+            self._send(200, gpx.encode('utf-8'), 'application/gpx+xml')
+        else:
+            self._send(404, b'{"error": "not found"}', 'application/json')
+
+
+class MockGarminServer:
+    """Threaded mock Garmin Connect on an ephemeral localhost port; add_activities() simulates new uploads"""
+
+    class _Server(ThreadingHTTPServer):
+        latency: float
+        points: int
+        activities: List[Dict[str, Any]]
+        failing: set
+        requests: List[str]
+        lock: threading.Lock
+
+    def __init__(self, activities: int = 0, points: int = 2000, latency: float = LATENCY_SECONDS):
+        self._server = self._Server(('127.0.0.1', 0), _GarminHandler)
+        self._server.latency = latency
+        self._server.points = points
+        self._server.activities = []
+        self._server.failing = set()
+        self._server.requests = []
+        self._server.lock = threading.Lock()
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self.add_activities(activities)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    @property
+    def requests(self) -> List[str]:
+        """Paths requested so far"""
+        with self._server.lock:
+            return list(self._server.requests)
+
+    def add_activities(self, count: int) -> List[int]:
+        """Append activities with increasing IDs (oldest first), returning their IDs"""
+        with self._server.lock:
+            first = FIRST_ACTIVITY_ID + len(self._server.activities)
+            start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+            added = [{
+                'activityId': first + i,
+                'activityName': f'Hike {first + i}',
+                'activityType': {'typeKey': 'hiking'},
+                'startTimeGMT': (start + timedelta(days=first + i - FIRST_ACTIVITY_ID)).strftime('%Y-%m-%d %H:%M:%S'),
+                'distance': 10000.0,
+                'duration': 10800.0
+            } for i in range(count)]
+            self._server.activities += added
+        return [a['activityId'] for a in added]
+
+    def fail_downloads(self, *activity_ids: int):
+        """Make GPX downloads of these activities return 404"""
+        with self._server.lock:
+            self._server.failing = set(activity_ids)
+
+    def __enter__(self) -> 'MockGarminServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
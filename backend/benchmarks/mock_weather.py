@@ -0,0 +1,73 @@
+"""
+SanBernard Mock Weather Server
+Local stand-in for the Open-Meteo forecast API, so weather benchmarks need no network
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+from urllib.parse import parse_qs, urlparse
+
+FORECAST_HOURS = 72
+LATENCY_SECONDS = 0.02  # Per upstream call, roughly a fast real API round trip
+
+
+def hourly_forecast(lat: float, lon: float, hours: int = FORECAST_HOURS) -> Dict[str, Any]:
+    """Deterministic hourly series for a location, starting at the current UTC hour"""
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0, tzinfo=None)
+    seed = int(abs(lat) * 1000) * 31 + int(abs(lon) * 1000)
+    values = [(seed * 7919 + h * 104729) % 1000 / 1000 for h in range(hours)]
+    return {
+        'time': [(start + timedelta(hours=h)).strftime('%Y-%m-%dT%H:%M') for h in range(hours)],
+        'temperature_2m': [round(15 - lat / 10 + 8 * v, 1) for v in values],
+        'precipitation': [round(3 * v * v, 1) for v in values],
+        'wind_speed_10m': [round(45 * v, 1) for v in values],
+        'wind_direction_10m': [int(360 * v) for v in values],
+        'snow_depth': [0.05 if v > 0.9 else 0.0 for v in values],
+        'weather_code': [(0, 1, 3, 61, 71)[int(v * 5)] for v in values],
+    }
+
+
+class _ForecastHandler(BaseHTTPRequestHandler):
+    latency = LATENCY_SECONDS
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        query = parse_qs(urlparse(self.path).query)
+        lats = [float(v) for v in query['latitude'][0].split(',')]
+        lons = [float(v) for v in query['longitude'][0].split(',')]
+        forecasts = [{'latitude': lat, 'longitude': lon, 'timezone': 'GMT', 'utc_offset_seconds': 0,
+                      'hourly': hourly_forecast(lat, lon)} for lat, lon in zip(lats, lons)]
+        body = json.dumps(forecasts[0] if len(forecasts) == 1 else forecasts).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockWeatherServer:
+    """Threaded mock Open-Meteo on an ephemeral localhost port"""
+
+    def __init__(self, latency: float = LATENCY_SECONDS):
+        handler = type('ForecastHandler', (_ForecastHandler,), {'latency': latency})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_port}/v1/forecast'
+
+    def __enter__(self) -> 'MockWeatherServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,118 @@
+"""
+SanBernard Reference Implementation
+The original per-point helpers, kept as the baseline the vectorized engine is checked and timed against
+"""
+
+import math
+from typing import Any, Dict, List
+
+import gpxpy
+
+from engine import BASE_SPEED_KMH
+
+
+def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Calculate distance between two points using Haversine formula (meters)"""
+    R = 6371000  # Earth's radius in meters
+
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_phi / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return R * c
+
+
+def calculate_gradient(elevation_change: float, distance: float) -> float:
+    """Calculate gradient as percentage"""
+    if distance == 0:
+        return 0
+    return (elevation_change / distance) * 100
+
+
+def get_terrain_factor(gradient: float) -> float:
+    """
+    Calculate terrain factor based on gradient.
+    Positive gradient (uphill) slows down, negative (downhill) can speed up slightly.
+    """
+    if gradient > 0:
+        # Uphill: exponentially slower
+        return 1.0 + (gradient / 10) * 0.5
+    elif gradient < -15:
+        # Very steep downhill: actually slower due to caution
+        return 1.0 + (abs(gradient) - 15) / 20
+    elif gradient < 0:
+        # Moderate downhill: slightly faster
+        return max(0.85, 1.0 + gradient / 50)
+    return 1.0
+
+
+def parse_gpx(gpx_content: str) -> Dict[str, Any]:
+    """Parse a GPX document with gpxpy into per-point dicts: tracks first, then routes"""
+    gpx = gpxpy.parse(gpx_content)
+
+    points = []
+    total_distance = 0
+    prev_point = None
+
+    def add(point, time):
+        nonlocal total_distance, prev_point
+        if prev_point:
+            total_distance += calculate_distance(prev_point.latitude, prev_point.longitude,
+                                                 point.latitude, point.longitude)
+        points.append({
+            'lat': point.latitude,
+            'lon': point.longitude,
+            'elevation': point.elevation or 0,
+            'time': time,
+            'distance_from_start': total_distance
+        })
+        prev_point = point
+
+    for track in gpx.tracks:
+        for segment in track.segments:
+            for point in segment.points:
+                add(point, point.time)
+    for route in gpx.routes:
+        for point in route.points:
+            add(point, None)
+
+    return {'points': points, 'total_distance': total_distance, 'bounds': gpx.get_bounds()}
+
+
+def estimate_times(points: List[Dict], user_pace_factor: float = 1.0) -> List[Dict]:
+    """Naismith's rule with the gradient terrain factor, one point at a time (updates points in place)"""
+    total_time = 0  # seconds
+
+    for i, point in enumerate(points):
+        if i == 0:
+            point['estimated_time'] = 0
+            point['segment_speed'] = BASE_SPEED_KMH
+            point['gradient'] = 0
+            point['terrain_factor'] = 1.0
+            continue
+
+        prev_point = points[i - 1]
+        segment_distance = point['distance_from_start'] - prev_point['distance_from_start']
+        elevation_change = point['elevation'] - prev_point['elevation']
+        gradient = calculate_gradient(elevation_change, segment_distance)
+        terrain_factor = get_terrain_factor(gradient)
+
+        base_speed = BASE_SPEED_KMH / terrain_factor / user_pace_factor
+        segment_time = (segment_distance / 1000) / base_speed * 3600
+
+        # Naismith's rule: +1 min per 10m ascent
+        if elevation_change > 0:
+            segment_time += (elevation_change / 10) * 60
+
+        total_time += segment_time
+        point['estimated_time'] = total_time
+        point['segment_speed'] = base_speed
+        point['gradient'] = gradient
+        point['terrain_factor'] = terrain_factor
+
+    return points
@@ -0,0 +1,109 @@
+"""
+SanBernard Response Format Benchmark
+Encoding time and payload size of JSON vs columnar binary, with and without compression
+
+Run from backend/:  python -m benchmarks.response_format [--points 500000] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+from app import app, build_route_response, read_estimate_options
+from benchmarks.synthetic import synthetic_gpx
+from gpx_stream import parse_gpx_stream
+from response_format import ROUTE_COLUMNS_MIMETYPE, brotli, compress_response, route_response
+from route_store import make_stored_route
+
+SAMPLE_GPX = os.path.join(os.path.dirname(__file__), '..', '..', 'Walking Britain Walk_1156.gpx')
+REPEATS = 3
+
+FORMATS = [
+    ('json', 'application/json', 'identity'),
+    ('json+gzip', 'application/json', 'gzip'),
+    ('json+br', 'application/json', 'br'),
+    ('columns', ROUTE_COLUMNS_MIMETYPE, 'identity'),
+    ('columns+gzip', ROUTE_COLUMNS_MIMETYPE, 'gzip'),
+    ('columns+br', ROUTE_COLUMNS_MIMETYPE, 'br'),
+]
+
+
+def _decode(body: bytes, mimetype: str):
+    """Python stand-in for the client side: json.loads vs zero-copy array views"""
+    if mimetype == 'application/json':
+        return json.loads(body)
+    header_length = int.from_bytes(body[8:12], 'little')
+    header = json.loads(body[12:12 + header_length])
+    start = 12 + header_length + (-(12 + header_length) % 8)
+    return [np.frombuffer(body, dtype=column['dtype'], count=column['length'],
+                          offset=start + column['offset']) for column in header['columns']]
+
+
+def bench_route(name: str, gpx: str):
+    parsed = parse_gpx_stream(gpx)
+    stored = make_stored_route(name, parsed['route'], parsed['total_distance'], parsed['total_ascent'],
+                               parsed['total_descent'], None)
+    options = read_estimate_options({})
+    route_data, route = build_route_response(stored, options)
+
+    results = []
+    for label, mimetype, encoding in FORMATS:
+        if encoding == 'br' and brotli is None:
+            continue
+        timings = []
+        for _ in range(REPEATS):
+            headers = {'Accept': mimetype, 'Accept-Encoding': encoding}
+            with app.test_request_context(headers=headers):
+                started = time.perf_counter()
+                response = compress_response(route_response(dict(route_data), route))
+                body = response.get_data()
+                timings.append(time.perf_counter() - started)
+
+        raw = body
+        if encoding == 'gzip':
+            import gzip
+            raw = gzip.decompress(body)
+        elif encoding == 'br':
+            raw = brotli.decompress(body)
+        started = time.perf_counter()
+        _decode(raw, mimetype)
+        decode_seconds = time.perf_counter() - started
+
+        results.append({
+            'input': name,
+            'points': len(route),
+            'format': label,
+            'bytes': len(body),
+            'bytes_per_point': round(len(body) / max(len(route), 1), 2),
+            'encode_ms': round(min(timings) * 1000, 2),
+            'decode_ms': round(decode_seconds * 1000, 2)
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--points', type=int, default=500_000, help='Synthetic track size')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    if os.path.exists(SAMPLE_GPX):
+        with open(SAMPLE_GPX, encoding='utf-8') as f:
+            results += bench_route('Walking Britain Walk_1156.gpx', f.read())
+    results += bench_route(f'synthetic-{args.points}', synthetic_gpx(args.points))
+
+    print(f"{'input':<32} {'points':>8} {'format':<14} {'bytes':>12} {'B/pt':>7} {'encode ms':>10} {'decode ms':>10}")
+    for r in results:
+        print(f"{r['input']:<32} {r['points']:>8} {r['format']:<14} {r['bytes']:>12} "
+              f"{r['bytes_per_point']:>7} {r['encode_ms']:>10} {r['decode_ms']:>10}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'response_format', 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+SanBernard Benchmark Suite
+Wall time, peak memory and points/sec for each backend stage and endpoint
+
+Run from backend/:
+    python -m benchmarks.suite [--sizes 1000 10000 100000 1000000] [--output results.json]
+    python -m benchmarks.suite --baseline previous.json   # exit 1 on regressions
+
+Peak memory is traced Python/NumPy allocation (tracemalloc) in this process, so the
+history workers' own memory is not included. Weather goes to a local mock server and
+DEM enrichment samples a synthetic .hgt tile.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import replace
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+import app as api
+import weather
+from benchmarks import reference
+from benchmarks.mock_weather import MockWeatherServer
+from benchmarks.synthetic import synthetic_gpx, synthetic_hgt
+from elevation import DEM_ALL, ElevationService, enrich_elevation
+from engine import haversine_distances
+from gpx_stream import parse_gpx_stream
+from preprocess import preprocess_route, resolve_preprocess
+from route_store import RouteStore
+from simplify import RouteLOD
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+VARIANTS = {
+    'track': dict(kind='track', elevation=True, times=True),
+    'track-no-ele': dict(kind='track', elevation=False, times=True),
+    'track-no-time': dict(kind='track', elevation=True, times=False),
+    'route': dict(kind='route', elevation=True, times=False),
+    'route-no-ele': dict(kind='route', elevation=False, times=False),
+}
+LARGE_SIZE = 1_000_000  # From this size every stage runs once
+REGRESSION_THRESHOLD = 0.2  # Slower than baseline by more than this fraction
+
+
+def measure(fn: Callable[[], Any], repeats: int, memory: bool = True,
+            setup: Optional[Callable[[], Any]] = None) -> Dict[str, Any]:
+    """Best wall time over repeats (untraced), plus peak traced memory from one extra run"""
+    timings = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+
+    peak = None
+    if memory:
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {'wall_seconds': min(timings), 'peak_bytes': peak}
+
+
+def _client_post(client, path: str, **kwargs):
+    response = client.post(path, **kwargs)
+    if response.status_code != 200:
+        raise RuntimeError(f'{path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}')
+    return response
+
+
+def _reset_caches():
+    """Cold caches: every repeat parses and fetches from scratch"""
+    api.route_store = RouteStore(path=None)
+    cache = weather.get_weather_client().cache
+    if cache is not None:
+        cache.clear()
+
+
+def bench_variant(variant: str, n_points: int, repeats: int, memory: bool,
+                  dem: ElevationService) -> List[Dict[str, Any]]:
+    gpx = synthetic_gpx(n_points, seed=n_points, **VARIANTS[variant])
+    gpx_bytes = gpx.encode('utf-8')
+    parsed = parse_gpx_stream(gpx)
+    route = parsed['route']
+    client = api.app.test_client()
+
+    stages: Dict[str, Callable[[], Any]] = {
+        'parse_gpx': lambda: parse_gpx_stream(gpx),
+        'estimate_times': lambda: api.estimate_times(replace(route)),
+        'calculate_distance': lambda: [
+            reference.calculate_distance(route.lat[i], route.lon[i], route.lat[i + 1], route.lon[i + 1])
+            for i in range(len(route) - 1)
+        ],
+        'haversine_distances': lambda: haversine_distances(route.lat, route.lon),
+        'simplify': lambda: RouteLOD(route),
+        'dem_enrich': lambda: enrich_elevation(replace(route), DEM_ALL, dem),
+        'preprocess': lambda: preprocess_route({**parsed, 'route': replace(route)},
+                                               resolve_preprocess(spacing=10, smoothing=50)),
+        'weather_estimate': lambda: api.estimate_times(
+            replace(route), weather_grid=api.run_async(weather.fetch_forecast_grid(route))
+        ),
+        'endpoint_parse_gpx': lambda: _client_post(
+            client, '/api/parse-gpx', data={'file': (io.BytesIO(gpx_bytes), 'bench.gpx')},
+            content_type='multipart/form-data'
+        ),
+    }
+
+    # Endpoints that need a route or points from an earlier response
+    uploaded = _client_post(client, '/api/parse-gpx', data={'file': (io.BytesIO(gpx_bytes), 'bench.gpx')},
+                            content_type='multipart/form-data').get_json()
+    points = uploaded.pop('points')
+    stages['endpoint_estimate'] = lambda: _client_post(
+        client, f"/api/routes/{uploaded['route_id']}/estimate", json={'pace_factor': 1.1}
+    )
+    stages['endpoint_weather'] = lambda: _client_post(client, '/api/weather', json={'points': points})
+    if VARIANTS[variant]['times'] and VARIANTS[variant]['kind'] == 'track':
+        stages['endpoint_analyze_history'] = lambda: _client_post(
+            client, '/api/analyze-history', data={'files': [(io.BytesIO(gpx_bytes), 'bench.gpx')]},
+            content_type='multipart/form-data'
+        )
+
+    results = []
+    for stage, fn in stages.items():
+        # Keep the estimate endpoint's route stored; everything else starts cold
+        setup = None if stage == 'endpoint_estimate' else _reset_caches
+        if stage == 'endpoint_estimate':
+            api.load_route(io.BytesIO(gpx_bytes))
+        result = measure(fn, repeats, memory, setup)
+        results.append({
+            'stage': stage,
+            'variant': variant,
+            'points': n_points,
+            'wall_seconds': round(result['wall_seconds'], 6),
+            'peak_bytes': result['peak_bytes'],
+            'points_per_second': round(n_points / result['wall_seconds']) if result['wall_seconds'] else None,
+        })
+        print(f"{variant:<14} {n_points:>9} {stage:<26} {result['wall_seconds']:>10.4f}s "
+              f"{(result['peak_bytes'] or 0) / 1e6:>9.1f}MB {results[-1]['points_per_second'] or 0:>12}",
+              file=sys.stderr)
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def regressions(results: List[Dict[str, Any]], baseline: Dict[str, Any],
+                threshold: float) -> List[Dict[str, Any]]:
+    """Stages whose wall time grew by more than threshold against a previous run"""
+    previous = {(r['stage'], r['variant'], r['points']): r for r in baseline['results']}
+    slower = []
+    for r in results:
+        before = previous.get((r['stage'], r['variant'], r['points']))
+        if before and before['wall_seconds'] and r['wall_seconds'] > before['wall_seconds'] * (1 + threshold):
+            slower.append({**r, 'baseline_seconds': before['wall_seconds'],
+                           'ratio': round(r['wall_seconds'] / before['wall_seconds'], 3)})
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SanBernard backend benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Points per synthetic file')
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--repeats', type=int, default=3, help='Timed runs per stage (best is kept)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the traced peak-memory run')
+    parser.add_argument('--output', help='Write results as JSON to this file (default: stdout)')
+    parser.add_argument('--baseline', help='Previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    results = []
+    # The API logs progress to stdout, which may be carrying the JSON report
+    with MockWeatherServer() as server, tempfile.TemporaryDirectory() as dem_dir, \
+            contextlib.redirect_stdout(sys.stderr):
+        weather.configure_weather_client(base_url=server.url)
+        # One 3" tile under the synthetic routes' start
+        synthetic_hgt(dem_dir)
+        dem = ElevationService(dem_dir)
+        for n_points in args.sizes:
+            repeats = args.repeats if n_points < LARGE_SIZE else 1
+            for variant in args.variants:
+                results += bench_variant(variant, n_points, repeats, not args.no_memory, dem)
+
+    report = {'benchmark': 'suite', 'environment': environment(), 'results': results}
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = regressions(results, json.load(f), args.threshold)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    for r in report.get('regressions', []):
+        print(f"REGRESSION {r['variant']} {r['points']} {r['stage']}: {r['baseline_seconds']}s -> "
+              f"{r['wall_seconds']}s ({r['ratio']}x)", file=sys.stderr)
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+SanBernard Synthetic GPX
+Deterministic GPX documents of any size for benchmarks
+"""
+
+import os
+import numpy as np
+from datetime import datetime, timezone
+
+START_LAT = 54.45  # Lake District
+START_LON = -3.05
+START_TIME = datetime(2024, 6, 1, 8, 0, tzinfo=timezone.utc)
+STEP_METERS = 8.0  # Typical GPS logging interval while walking
+
+
+def synthetic_gpx(n_points: int, seed: int = 0, elevation: bool = True, times: bool = True,
+                  kind: str = 'track') -> str:
+    """
+    A random walk of n_points as a GPX track (kind='track') or route (kind='route'),
+    identical for the same arguments. Routes never carry times, as in real route files.
+    """
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.15, n_points))
+    step = STEP_METERS * rng.uniform(0.5, 1.5, n_points)
+    lat = START_LAT + np.cumsum(step * np.cos(heading)) / 111320
+    lon = START_LON + np.cumsum(step * np.sin(heading)) / (111320 * np.cos(np.radians(START_LAT)))
+    ele = 150 + np.cumsum(rng.normal(0, 1.5, n_points))
+    seconds = np.cumsum(step / rng.uniform(0.8, 1.6, n_points))
+
+    tag = 'trkpt' if kind == 'track' else 'rtept'
+    lat_s = np.char.mod('%.7f', lat)
+    lon_s = np.char.mod('%.7f', lon)
+    children = [''] * n_points
+    if elevation:
+        children = np.char.add(np.char.add('<ele>', np.char.mod('%.1f', ele)), '</ele>')
+    if times and kind == 'track':
+        stamps = (np.datetime64(START_TIME.replace(tzinfo=None), 's') +
+                  seconds.astype('timedelta64[s]')).astype(str)
+        children = np.char.add(children, np.char.add(np.char.add('<time>', stamps), 'Z</time>'))
+    points = '\n'.join(
+        f'<{tag} lat="{a}" lon="{o}">{c}</{tag}>' for a, o, c in zip(lat_s, lon_s, children)
+    )
+
+    if kind == 'track':
+        body = f'<trk><name>Synthetic {n_points}</name><trkseg>\n{points}\n</trkseg></trk>'
+    else:
+        body = f'<rte><name>Synthetic {n_points}</name>\n{points}\n</rte>'
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<gpx version="1.1" creator="SanBernard benchmarks" xmlns="http://www.topografix.com/GPX/1/1">\n'
+            f'{body}\n</gpx>\n')
+
+
+def synthetic_hgt(directory: str, lat: int = 54, lon: int = -4, side: int = 1201, seed: int = 0) -> str:
+    """
+    A smooth random .hgt tile (south-west corner lat, lon) written into directory, with
+    a few void samples, for DEM enrichment benchmarks; returns its path
+    """
+    from elevation import HGT_VOID, tile_name
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:side, 0:side] / (side - 1)
+    grid = 400 + 300 * np.sin(3 * x + rng.uniform(0, 6)) * np.cos(2 * y + rng.uniform(0, 6))
+    grid = grid.round().astype('>i2')
+    grid.flat[rng.integers(grid.size, size=side)] = HGT_VOID
+    path = os.path.join(directory, tile_name(lat, lon))
+    grid.tofile(path)
+    return path
@@ -0,0 +1,122 @@
+"""
+SanBernard Departure Sweep
+Weather-adjusted ETAs for many candidate start times at once, as a (start x point) matrix
+"""
+
+import os
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+from weather import WEATHER_CONVERGENCE_SECONDS, WEATHER_MAX_ITERATIONS, ForecastGrid, weather_factors
+
+SWEEP_MAX_STARTS = int(os.environ.get('SWEEP_MAX_STARTS', 500))  # Candidate departures per request
+SWEEP_CHUNK_CELLS = int(os.environ.get('SWEEP_CHUNK_CELLS', 2_000_000))  # Starts x points evaluated at once
+SWEEP_DEFAULT_HOURS = 24
+SWEEP_DEFAULT_STEP_MINUTES = 30
+WINDOW_TOLERANCE = 0.02  # Starts within 2% of the best ETA form the best windows
+
+
+def departure_starts(window_start: float, window_end: float, step_seconds: float) -> np.ndarray:
+    """Candidate start times (UTC epoch seconds) from window_start to window_end inclusive (raises ValueError)"""
+    if step_seconds <= 0:
+        raise ValueError('step must be positive')
+    if window_end < window_start:
+        raise ValueError('window_end must not be before window_start')
+    count = int((window_end - window_start) // step_seconds) + 1
+    if count > SWEEP_MAX_STARTS:
+        raise ValueError(f'Too many start times ({count}, at most {SWEEP_MAX_STARTS}); use a longer step')
+    return window_start + step_seconds * np.arange(count, dtype=np.float64)
+
+
+def _sweep_chunk(distance: np.ndarray, segment_time: np.ndarray, calm_time: np.ndarray,
+                 grid: ForecastGrid, starts: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Arrival times and per-start summaries for one block of starts, refined as in
+    estimate_times: each start stops iterating once its own arrival times converge
+    """
+    estimated_time = np.tile(calm_time, (starts.size, 1))
+    active = np.arange(starts.size)
+    for _ in range(WEATHER_MAX_ITERATIONS):
+        current = estimated_time[active]
+        weather_factor = grid.weather_factors(distance, starts[active, None] + current)
+        updated = np.zeros_like(weather_factor)
+        np.cumsum(segment_time * weather_factor[:, 1:], axis=1, out=updated[:, 1:])
+        shift = np.max(np.abs(updated - current), axis=1)
+        estimated_time[active] = updated
+        active = active[shift >= WEATHER_CONVERGENCE_SECONDS]
+        if not active.size:
+            break
+
+    conditions = grid.interpolate(distance, starts[:, None] + estimated_time)
+    weather_factor = weather_factors(conditions['temperature'], conditions['precipitation'],
+                                     conditions['wind_speed'], conditions['snow_depth'])
+    return {
+        'total_time': estimated_time[:, -1],
+        'min_temperature': conditions['temperature'].min(axis=1),
+        'max_temperature': conditions['temperature'].max(axis=1),
+        'max_precipitation': conditions['precipitation'].max(axis=1),
+        'max_wind': conditions['wind_speed'].max(axis=1),
+        'max_snow_depth': conditions['snow_depth'].max(axis=1),
+        # Share of the route's points walked in weather that slows the pace
+        'adverse_fraction': (weather_factor > 1).mean(axis=1),
+    }
+
+
+def sweep_departures(distance: np.ndarray, calm_time: np.ndarray, grid: ForecastGrid,
+                     starts: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Weather-adjusted ETA and summary conditions for every start time.
+
+    calm_time is the route's estimated_time without weather (pace, terrain and profile
+    already applied); weather then scales each segment exactly as pace_arrays does. Starts
+    are evaluated in blocks of at most SWEEP_CHUNK_CELLS matrix cells to bound memory.
+    """
+    distance = np.asarray(distance, dtype=np.float64)
+    calm_time = np.asarray(calm_time, dtype=np.float64)
+    segment_time = np.diff(calm_time)
+    chunk = max(1, SWEEP_CHUNK_CELLS // max(1, calm_time.size))
+
+    blocks = [_sweep_chunk(distance, segment_time, calm_time, grid, starts[i:i + chunk])
+              for i in range(0, starts.size, chunk)]
+    return {name: np.concatenate([block[name] for block in blocks]) for name in blocks[0]}
+
+
+def best_windows(starts: np.ndarray, total_time: np.ndarray,
+                 tolerance: float = WINDOW_TOLERANCE) -> List[Dict[str, Any]]:
+    """
+    Runs of consecutive starts whose ETA is within tolerance of the best one, best run
+    first (ties go to the earlier window)
+    """
+    good = total_time <= total_time.min() * (1 + tolerance)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], good.astype(np.int8), [0]))))
+    windows = []
+    for first, last in zip(edges[::2], edges[1::2] - 1):
+        best = first + int(np.argmin(total_time[first:last + 1]))
+        windows.append({'first': int(first), 'last': int(last), 'best': best})
+    windows.sort(key=lambda w: (float(total_time[w['best']]), w['first']))
+    return windows
+
+
+def ranked_departures(starts: np.ndarray, sweep: Dict[str, np.ndarray], calm_total: float,
+                      forecast_end: Optional[float], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Per-start summaries ordered by weather-adjusted ETA (earlier start first on ties)"""
+    order = np.lexsort((starts, sweep['total_time']))[:limit]
+    departures = []
+    for rank, i in enumerate(order, 1):
+        total_time = float(sweep['total_time'][i])
+        departures.append({
+            'rank': rank,
+            'start': float(starts[i]),
+            'estimated_total_time': total_time,
+            'arrival': float(starts[i]) + total_time,
+            'weather_delay': total_time - calm_total,
+            'min_temperature': round(float(sweep['min_temperature'][i]), 1),
+            'max_temperature': round(float(sweep['max_temperature'][i]), 1),
+            'max_precipitation': round(float(sweep['max_precipitation'][i]), 2),
+            'max_wind': round(float(sweep['max_wind'][i]), 1),
+            'max_snow_depth': round(float(sweep['max_snow_depth'][i]), 1),
+            'adverse_fraction': round(float(sweep['adverse_fraction'][i]), 3),
+            # Past the last forecast hour conditions are held at that hour's values
+            'beyond_forecast': forecast_end is not None and float(starts[i]) + total_time > forecast_end
+        })
+    return departures
@@ -0,0 +1,176 @@
+"""
+SanBernard Elevation Service
+Offline elevation from SRTM-style .hgt tiles on disk, memory-mapped and sampled bilinearly
+"""
+
+import math
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from route import Route
+
+DEM_PATH = os.environ.get('DEM_PATH')  # Directory of .hgt tiles (e.g. N54W004.hgt); unset disables enrichment
+DEM_OPEN_TILES = int(os.environ.get('DEM_OPEN_TILES', 16))  # Tiles kept memory-mapped at once
+DEM_OFF = 'off'
+DEM_MISSING = 'missing'  # Only points the GPX gave no <ele>
+DEM_ALL = 'all'  # Every point, replacing recorded elevations
+DEM_MODES = (DEM_OFF, DEM_MISSING, DEM_ALL)
+DEM_ENRICHMENT = os.environ.get('DEM_ENRICHMENT', DEM_MISSING if DEM_PATH else DEM_OFF)  # Default mode
+HGT_VOID = -32768
+
+
+def tile_name(lat: int, lon: int) -> str:
+    """File name of the tile whose south-west corner is (lat, lon), e.g. N54W004.hgt"""
+    return f"{'N' if lat >= 0 else 'S'}{abs(lat):02d}{'E' if lon >= 0 else 'W'}{abs(lon):03d}.hgt"
+
+
+class DemTile:
+    """
+    One 1x1 degree .hgt tile: a square grid of big-endian int16 meters, rows north to
+    south, edges shared with the neighbouring tiles (1201 samples for 3", 3601 for 1").
+    The grid is memory-mapped, so sampling only pages in the rows it touches.
+    """
+
+    def __init__(self, path: str, lat: int, lon: int):
+        side = math.isqrt(os.path.getsize(path) // 2)
+        if side < 2 or side * side * 2 != os.path.getsize(path):
+            raise ValueError(f'{os.path.basename(path)} is not a square .hgt grid')
+        self.lat = lat
+        self.lon = lon
+        self.side = side
+        self.grid = np.memmap(path, dtype='>i2', mode='r', shape=(side, side))
+
+    def sample(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Bilinear elevation at points inside the tile, NaN where all four neighbours are voids"""
+        n = self.side - 1
+        row = (self.lat + 1 - lat) * n
+        col = (lon - self.lon) * n
+        r0 = np.clip(np.floor(row).astype(np.int64), 0, n - 1)
+        c0 = np.clip(np.floor(col).astype(np.int64), 0, n - 1)
+        fr = np.clip(row - r0, 0, 1)
+        fc = np.clip(col - c0, 0, 1)
+
+        corners = np.stack([self.grid[r0, c0], self.grid[r0, c0 + 1],
+                            self.grid[r0 + 1, c0], self.grid[r0 + 1, c0 + 1]]).astype(np.float64)
+        weights = np.stack([(1 - fr) * (1 - fc), (1 - fr) * fc, fr * (1 - fc), fr * fc])
+        # Voids drop out and the remaining weights are renormalized
+        valid = corners != HGT_VOID
+        weights = np.where(valid, weights, 0.0)
+        total = weights.sum(axis=0)
+        result = np.full(lat.shape, np.nan)
+        np.divide((np.where(valid, corners, 0.0) * weights).sum(axis=0), total, out=result, where=total > 0)
+        return result
+
+
+class ElevationService:
+    """
+    Elevation lookups over a directory of .hgt tiles, keeping the most recently used
+    max_open_tiles memory-mapped (tiles absent from disk are remembered as absent too).
+    Thread-safe; each process opens its own maps.
+    """
+
+    def __init__(self, path: str, max_open_tiles: int = DEM_OPEN_TILES):
+        self.path = path
+        self.max_open_tiles = max_open_tiles
+        self.opened = 0
+        self._tiles: 'OrderedDict[Tuple[int, int], Optional[DemTile]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def tile(self, lat: int, lon: int) -> Optional[DemTile]:
+        key = (lat, lon)
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+        path = os.path.join(self.path, tile_name(lat, lon))
+        tile = DemTile(path, lat, lon) if os.path.isfile(path) else None
+        with self._lock:
+            self._tiles[key] = tile
+            self.opened += tile is not None
+            while len(self._tiles) > self.max_open_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def sample(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Elevation (meters) at every point, NaN where no tile covers it or the data is void"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = (np.asarray(lon, dtype=np.float64) + 180) % 360 - 180
+        result = np.full(lat.shape, np.nan)
+        if not lat.size:
+            return result
+        # Points are grouped by tile so each tile is looked up once
+        keys = np.stack([np.floor(lat), np.floor(lon)], axis=1).astype(np.int64)
+        tiles, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        for i, (tile_lat, tile_lon) in enumerate(tiles):
+            tile = self.tile(int(tile_lat), int(tile_lon))
+            if tile is not None:
+                inside = inverse == i
+                result[inside] = tile.sample(lat[inside], lon[inside])
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'path': self.path,
+                'open_tiles': sum(tile is not None for tile in self._tiles.values()),
+                'max_open_tiles': self.max_open_tiles,
+                'tiles_opened': self.opened
+            }
+
+
+_service: Optional[ElevationService] = None
+_service_lock = threading.Lock()
+
+
+def get_elevation_service() -> Optional[ElevationService]:
+    """Shared service over DEM_PATH (None when it is not configured)"""
+    global _service
+    if not DEM_PATH:
+        return None
+    with _service_lock:
+        if _service is None:
+            _service = ElevationService(DEM_PATH)
+        return _service
+
+
+def configure_elevation_service(service: Optional[ElevationService]):
+    """Replace the shared service (e.g. with one over a test tile directory)"""
+    global _service, DEM_PATH
+    with _service_lock:
+        _service = service
+        DEM_PATH = service.path if service is not None else None
+
+
+def resolve_dem_mode(mode: Optional[str] = None) -> str:
+    """Enrichment mode from a request field, DEM_ENRICHMENT by default (raises ValueError)"""
+    mode = DEM_ENRICHMENT if mode in (None, '') else str(mode).lower()
+    if mode not in DEM_MODES:
+        raise ValueError(f"dem must be one of {', '.join(DEM_MODES)}")
+    if mode != DEM_OFF and get_elevation_service() is None:
+        raise ValueError('DEM elevation is not configured on this server (set DEM_PATH)')
+    return mode
+
+
+def enrich_elevation(route: Route, mode: str = DEM_MISSING,
+                     service: Optional[ElevationService] = None) -> int:
+    """
+    Sample DEM elevation into the route in place, for points without an elevation
+    (mode 'missing') or every point ('all'); points no tile covers are left as they
+    were. Sampled points are marked as having an elevation. Returns how many were set.
+    """
+    service = service or get_elevation_service()
+    if mode == DEM_OFF or service is None or not len(route):
+        return 0
+    target = ~route.has_elevation if mode == DEM_MISSING else np.ones(len(route), dtype=bool)
+    if not target.any():
+        return 0
+    sampled = np.full(len(route), np.nan)
+    sampled[target] = service.sample(route.lat[target], route.lon[target])
+    found = ~np.isnan(sampled)
+    route.elevation = np.where(found, sampled, route.elevation)
+    route.has_elevation = route.has_elevation | found
+    return int(found.sum())
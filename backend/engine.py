@@ -0,0 +1,151 @@
+"""
+SanBernard Route Engine
+Vectorized NumPy equivalents of the per-point estimation helpers
+"""
+
+import numpy as np
+from typing import Dict, Optional
+
+# Constants for time estimation
+BASE_SPEED_KMH = 5.0  # Base walking speed on flat terrain
+NAISMITH_RULE_MINUTES_PER_100M = 10  # Additional minutes per 100m ascent
+EARTH_RADIUS_M = 6371000  # Earth's radius in meters
+
+
+def haversine_distances(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Distances between consecutive points using Haversine formula (meters, length n-1)"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if lat.size < 2:
+        return np.zeros(0, dtype=np.float64)
+
+    phi = np.radians(lat)
+    delta_phi = np.radians(lat[1:] - lat[:-1])
+    delta_lambda = np.radians(lon[1:] - lon[:-1])
+
+    a = np.sin(delta_phi / 2) ** 2 + \
+        np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(delta_lambda / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return EARTH_RADIUS_M * c
+
+
+def cumulative_distance(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Distance from start for every point (meters, length n)"""
+    segment = haversine_distances(lat, lon)
+    # np.cumsum accumulates left to right, matching the scalar running total
+    return np.concatenate(([0.0], np.cumsum(segment)))
+
+
+def running_sum(values: np.ndarray, start: float = 0.0) -> float:
+    """Left-to-right sum onto start, so totals match the scalar accumulation exactly"""
+    if values.size == 0:
+        return start
+    return float(np.cumsum(np.concatenate(([start], values)))[-1])
+
+
+def gradients(elevation_change: np.ndarray, distance: np.ndarray) -> np.ndarray:
+    """Vectorized calculate_gradient: percentage, 0 where distance is 0"""
+    elevation_change = np.asarray(elevation_change, dtype=np.float64)
+    distance = np.asarray(distance, dtype=np.float64)
+    result = np.zeros_like(elevation_change)
+    np.divide(elevation_change, distance, out=result, where=distance != 0)
+    return result * 100
+
+
+def terrain_factors(gradient: np.ndarray) -> np.ndarray:
+    """Vectorized get_terrain_factor, applying the same piecewise rules"""
+    gradient = np.asarray(gradient, dtype=np.float64)
+    return np.select(
+        [gradient > 0, gradient < -15, gradient < 0],
+        [
+            1.0 + (gradient / 10) * 0.5,  # Uphill
+            1.0 + (np.abs(gradient) - 15) / 20,  # Very steep downhill
+            np.maximum(0.85, 1.0 + gradient / 50),  # Moderate downhill
+        ],
+        default=1.0,
+    )
+
+
+def terrain_arrays(distance_from_start: np.ndarray, elevation: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Pace-independent part of the estimate: per-segment distance and elevation change
+    (length n-1) plus per-point gradient and terrain factor (length n, first point flat).
+    """
+    distance_from_start = np.asarray(distance_from_start, dtype=np.float64)
+    elevation = np.asarray(elevation, dtype=np.float64)
+    n = distance_from_start.size
+
+    gradient = np.zeros(n, dtype=np.float64)
+    terrain_factor = np.ones(n, dtype=np.float64)
+    segment_distance = np.diff(distance_from_start)
+    elevation_change = np.diff(elevation)
+
+    if n >= 2:
+        gradient[1:] = gradients(elevation_change, segment_distance)
+        terrain_factor[1:] = terrain_factors(gradient[1:])
+
+    return {
+        'segment_distance': segment_distance,
+        'elevation_change': elevation_change,
+        'gradient': gradient,
+        'terrain_factor': terrain_factor,
+    }
+
+
+def pace_arrays(terrain: Dict[str, np.ndarray], user_pace_factor: float = 1.0,
+                weather_factor: Optional[np.ndarray] = None,
+                profile_factor: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Pace-dependent part of the estimate: cumulative estimated_time and segment_speed.
+    weather_factor and profile_factor (per point, for the segment ending there) scale
+    the whole segment, ascent included.
+    """
+    n = terrain['gradient'].size
+    estimated_time = np.zeros(n, dtype=np.float64)
+    segment_speed = np.full(n, BASE_SPEED_KMH, dtype=np.float64)
+    if n < 2:
+        return {'estimated_time': estimated_time, 'segment_speed': segment_speed}
+
+    segment_distance = terrain['segment_distance']
+    elevation_change = terrain['elevation_change']
+
+    base_speed = BASE_SPEED_KMH / terrain['terrain_factor'][1:] / user_pace_factor
+    segment_time = (segment_distance / 1000) / base_speed * 3600
+
+    # Add extra time for ascent (Naismith's rule: +1 min per 10m ascent)
+    segment_time = np.where(elevation_change > 0,
+                            segment_time + (elevation_change / 10) * 60,
+                            segment_time)
+
+    if profile_factor is not None:
+        profile_factor = np.asarray(profile_factor, dtype=np.float64)[1:]
+        segment_time = segment_time * profile_factor
+        base_speed = base_speed / profile_factor
+
+    if weather_factor is not None:
+        weather_factor = np.asarray(weather_factor, dtype=np.float64)[1:]
+        segment_time = segment_time * weather_factor
+        base_speed = base_speed / weather_factor
+
+    estimated_time[1:] = np.cumsum(segment_time)
+    segment_speed[1:] = base_speed
+
+    return {'estimated_time': estimated_time, 'segment_speed': segment_speed}
+
+
+def estimate_time_arrays(distance_from_start: np.ndarray, elevation: np.ndarray,
+                         user_pace_factor: float = 1.0,
+                         weather_factor: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    Naismith's Rule time estimation over whole arrays.
+
+    Returns estimated_time, segment_speed, gradient and terrain_factor arrays with
+    the first point fixed at time 0, base speed, flat gradient and unit terrain factor.
+    """
+    terrain = terrain_arrays(distance_from_start, elevation)
+    return {
+        **pace_arrays(terrain, user_pace_factor, weather_factor),
+        'gradient': terrain['gradient'],
+        'terrain_factor': terrain['terrain_factor'],
+    }
@@ -0,0 +1,160 @@
+"""
+SanBernard Forecast Cache
+Hourly forecast series cached per snapped grid cell and forecast run
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+WEATHER_CACHE_SIZE = int(os.environ.get('WEATHER_CACHE_SIZE', 4096))  # Max cells held in memory
+WEATHER_CACHE_GRID_DEGREES = float(os.environ.get('WEATHER_CACHE_GRID_DEGREES', 0.02))  # ~2 km cells
+WEATHER_REFRESH_SECONDS = int(os.environ.get('WEATHER_REFRESH_SECONDS', 3600))  # Forecast model update cadence
+WEATHER_CACHE_PATH = os.environ.get('WEATHER_CACHE_PATH')  # Optional sqlite file for on-disk backing
+
+Cell = Tuple[int, int]
+
+
+class ForecastCache:
+    """
+    LRU cache of full hourly forecast series keyed on (grid cell, forecast run).
+
+    A forecast run is the WEATHER_REFRESH_SECONDS window the fetch happened in; entries
+    expire when the next run starts, so a cached series is never older than one model
+    update. Any arrival time within the cached series can be answered from it.
+    With a path, entries are also written to sqlite and survive restarts; callers on an
+    event loop look in memory first (memory_only) and run the sqlite reads and writes
+    (get, persist) in an executor.
+    """
+
+    def __init__(self, max_entries: int = WEATHER_CACHE_SIZE, grid_degrees: float = WEATHER_CACHE_GRID_DEGREES,
+                 refresh_seconds: int = WEATHER_REFRESH_SECONDS, path: Optional[str] = WEATHER_CACHE_PATH):
+        self.max_entries = max_entries
+        self.grid_degrees = grid_degrees
+        self.refresh_seconds = refresh_seconds
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[Tuple[int, int, int], Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()  # Held for sqlite I/O only, so memory lookups never wait on disk
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS forecasts ("
+                "lat_cell INTEGER, lon_cell INTEGER, run INTEGER, expires_at REAL, data TEXT, "
+                "PRIMARY KEY (lat_cell, lon_cell, run))"
+            )
+            self._db.commit()
+
+    def cell(self, lat: float, lon: float) -> Cell:
+        """Snap a coordinate to its grid cell"""
+        return round(lat / self.grid_degrees), round(lon / self.grid_degrees)
+
+    def cell_center(self, cell: Cell) -> Tuple[float, float]:
+        """Coordinate the forecast for a cell is fetched at"""
+        return round(cell[0] * self.grid_degrees, 6), round(cell[1] * self.grid_degrees, 6)
+
+    def run(self, now: Optional[float] = None) -> int:
+        """Forecast run the given time falls in"""
+        return int((now if now is not None else time.time()) // self.refresh_seconds)
+
+    @property
+    def persistent(self) -> bool:
+        return self._db is not None
+
+    def get(self, cell: Cell, now: Optional[float] = None, memory_only: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Cached series for a cell in the current forecast run. Falls back to sqlite (blocking)
+        unless memory_only, in which case a memory miss is not counted until the sqlite lookup.
+        """
+        now = now if now is not None else time.time()
+        key = (cell[0], cell[1], self.run(now))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            if memory_only and self._db is not None:
+                return None
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT expires_at, data FROM forecasts WHERE lat_cell = ? AND lon_cell = ? AND run = ?",
+                    key
+                ).fetchone()
+            if row is not None and row[0] > now:
+                data = json.loads(row[1])
+                with self._lock:
+                    self._store(key, row[0], data)
+                    self.hits += 1
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, cell: Cell, data: Dict[str, Any], now: Optional[float] = None, persist: bool = True):
+        """Cache a cell's series for the current run; persist=False leaves the sqlite write to persist()"""
+        now = now if now is not None else time.time()
+        run = self.run(now)
+        key = (cell[0], cell[1], run)
+        with self._lock:
+            self._store(key, (run + 1) * self.refresh_seconds, data)
+        if persist:
+            self.persist(cell, data, now)
+
+    def persist(self, cell: Cell, data: Dict[str, Any], now: Optional[float] = None):
+        """Write a cell's series to sqlite (blocking; no-op without a path), dropping expired rows"""
+        if self._db is None:
+            return
+        now = now if now is not None else time.time()
+        run = self.run(now)
+        payload = json.dumps(data)
+        with self._db_lock:
+            self._db.execute("DELETE FROM forecasts WHERE expires_at <= ?", (now,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?)",
+                (cell[0], cell[1], run, (run + 1) * self.refresh_seconds, payload)
+            )
+            self._db.commit()
+
+    def _store(self, key: Tuple[int, int, int], expires_at: float, data: Dict[str, Any]):
+        self._entries[key] = (expires_at, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM forecasts")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'grid_degrees': self.grid_degrees,
+                'refresh_seconds': self.refresh_seconds,
+                'persistent': self._db is not None
+            }
@@ -0,0 +1,421 @@
+"""
+SanBernard Garmin Sync
+Reused Garmin Connect sessions, incremental activity sync and a content-addressed GPX store
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+import httpx
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from garth.exc import GarthHTTPError
+
+from telemetry import log_event, span
+from weather import run_async
+
+# Upstream configuration (set GARMIN_API_URL to point at a local stand-in instead of garth's domain)
+GARMIN_API_URL = os.environ.get('GARMIN_API_URL')
+GARMIN_CONCURRENCY = int(os.environ.get('GARMIN_CONCURRENCY', 4))  # GPX downloads in flight per process
+GARMIN_TIMEOUT_SECONDS = float(os.environ.get('GARMIN_TIMEOUT_SECONDS', 30.0))
+GARMIN_SESSION_SECONDS = int(os.environ.get('GARMIN_SESSION_SECONDS', 12 * 3600))  # Idle sessions are dropped
+GARMIN_STORE_PATH = os.environ.get('GARMIN_STORE_PATH') or os.path.join(
+    os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share'), 'sanbernard', 'garmin'
+)  # Owner-only (0700) directories
+GARMIN_SYNC_LIMIT = int(os.environ.get('GARMIN_SYNC_LIMIT', 500))  # New activities downloaded per sync
+GARMIN_PAGE_SIZE = 50
+ACTIVITY_TYPES = 'hiking,walking,running'
+ACTIVITY_LIST_PATH = '/activitylist-service/activities/search/activities'
+GPX_DOWNLOAD_PATH = '/download-service/files/activity/{activity_id}'
+PASSWORD_HASH_ITERATIONS = 100_000
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+# garth.Client's retry policy, applied to the async calls as well
+GARMIN_RETRIES = 3
+RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+RETRY_BACKOFF_SECONDS = 0.5
+
+logger = logging.getLogger('sanbernard.garmin')
+
+
+def user_key(email: str) -> str:
+    """Stable, non-reversible key for a Garmin account (store file names never hold the email)"""
+    return hashlib.sha256(email.strip().lower().encode('utf-8')).hexdigest()
+
+
+def _hash_password(password: str, salt: bytes) -> bytes:
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, PASSWORD_HASH_ITERATIONS)
+
+
+@dataclass
+class GarminAuth:
+    """What a round of API calls needs from a session: garth's API base URL and request headers"""
+    url: str
+    headers: Dict[str, str]
+
+
+@dataclass
+class GarminSession:
+    """An authenticated garth client for one account; garth refreshes its OAuth2 token from the OAuth1 one"""
+    session_id: str
+    user_key: str
+    client: Any  # garth.Client holding the OAuth tokens
+    salt: bytes = field(default_factory=lambda: os.urandom(16))
+    password_hash: Optional[bytes] = None
+    last_used: float = field(default_factory=time.time)
+    lock: threading.Lock = field(default_factory=threading.Lock)  # One sync at a time per account
+
+    def auth(self) -> GarminAuth:
+        """
+        Base URL and headers as garth's own requests send them (its session headers, User-Agent
+        included, plus the Authorization), exchanging for a fresh OAuth2 token when it has expired
+        """
+        token = self.client.oauth2_token
+        if token is None or token.expired:
+            with span('garmin_token_refresh', logger):
+                self.client.refresh_oauth2()
+        headers = dict(self.client.sess.headers)
+        headers['Authorization'] = str(self.client.oauth2_token)
+        return GarminAuth(url=f'https://connectapi.{self.client.domain}', headers=headers)
+
+
+class GarminSessions:
+    """
+    Sessions by account. Connecting again with the same credentials reuses the session
+    (and its tokens) instead of logging in, so Garmin's SSO only sees one login per account.
+    """
+
+    def __init__(self, idle_seconds: int = GARMIN_SESSION_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.logins = 0
+        self._by_user: Dict[str, GarminSession] = {}
+        self._by_id: Dict[str, GarminSession] = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        for session in [s for s in self._by_id.values() if s.last_used + self.idle_seconds <= now]:
+            del self._by_id[session.session_id]
+            self._by_user.pop(session.user_key, None)
+
+    def add(self, email: str, client: Any, password: Optional[str] = None) -> GarminSession:
+        """Register an authenticated garth client for an account, replacing any earlier session"""
+        session = GarminSession(session_id=uuid.uuid4().hex, user_key=user_key(email), client=client)
+        if password is not None:
+            session.password_hash = _hash_password(password, session.salt)
+        with self._lock:
+            previous = self._by_user.pop(session.user_key, None)
+            if previous is not None:
+                self._by_id.pop(previous.session_id, None)
+            self._by_user[session.user_key] = session
+            self._by_id[session.session_id] = session
+        return session
+
+    def login(self, email: str, password: str) -> Tuple[GarminSession, bool]:
+        """Session for the account and whether it was reused; logs in only when there is none"""
+        key = user_key(email)
+        with self._lock:
+            self._expire(time.time())
+            session = self._by_user.get(key)
+        if session is not None and session.password_hash is not None and hmac.compare_digest(
+                session.password_hash, _hash_password(password, session.salt)):
+            session.last_used = time.time()
+            return session, True
+
+        import garth
+        client = garth.Client()
+        with span('garmin_login', logger):
+            client.login(email, password)
+        self.logins += 1
+        return self.add(email, client, password), False
+
+    def get(self, session_id: Optional[str]) -> Optional[GarminSession]:
+        with self._lock:
+            self._expire(time.time())
+            session = self._by_id.get(session_id or '')
+        if session is not None:
+            session.last_used = time.time()
+        return session
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.time())
+            return {'sessions': len(self._by_id), 'logins': self.logins}
+
+
+class ActivityStore:
+    """
+    GPX files on disk keyed by SHA-256 (objects/ab/<hash>.gpx), written once and never
+    changed, so history analysis can read them in place. Each account's sync state
+    (newest synced activity, activity -> hash index, failed downloads) is a JSON file.
+    """
+
+    def __init__(self, path: str = GARMIN_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        # Activity tracks and account state stay readable by this user only
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        for directory in ('objects', 'users', 'tmp'):
+            os.makedirs(os.path.join(path, directory), mode=0o700, exist_ok=True)
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.path, 'objects', digest[:2], f'{digest}.gpx')
+
+    def temp_file(self) -> Tuple[int, str]:
+        return tempfile.mkstemp(dir=os.path.join(self.path, 'tmp'), suffix='.part')
+
+    def commit(self, tmp: str, digest: str) -> str:
+        """Move a fully written temp file to its content address (dropped if already stored)"""
+        target = self.object_path(digest)
+        if os.path.exists(target):
+            os.remove(tmp)
+        else:
+            os.makedirs(os.path.dirname(target), mode=0o700, exist_ok=True)
+            os.replace(tmp, target)
+        return digest
+
+    def _state_file(self, key: str) -> str:
+        return os.path.join(self.path, 'users', f'{key}.json')
+
+    def load_state(self, key: str) -> Dict[str, Any]:
+        try:
+            with open(self._state_file(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'last_activity_id': None, 'activities': {}, 'pending': []}
+
+    def save_state(self, key: str, state: Dict[str, Any]):
+        with self._lock:
+            tmp = self._state_file(key) + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp, self._state_file(key))
+
+    def activity_uploads(self, key: str) -> List[Tuple[str, str]]:
+        """(filename, path) of every synced activity of an account, as analyze_history_files takes them"""
+        state = self.load_state(key)
+        uploads = []
+        for activity_id, activity in sorted(state['activities'].items()):
+            path = self.object_path(activity['sha256'])
+            if os.path.exists(path):
+                uploads.append((f'garmin-{activity_id}.gpx', path))
+        return uploads
+
+
+def activity_summary(activity: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of a Garmin activity list entry kept in the sync state"""
+    return {
+        'name': activity.get('activityName'),
+        'type': (activity.get('activityType') or {}).get('typeKey'),
+        'start_time': activity.get('startTimeGMT'),
+        'distance': activity.get('distance'),
+        'duration': activity.get('duration')
+    }
+
+
+class GarminClient:
+    """
+    Garmin Connect API client sharing one connection pool across requests. At most
+    `concurrency` downloads are in flight; GPX bodies stream straight to the store.
+    Requests carry garth's headers and follow its retry policy, and failed responses
+    raise GarthHTTPError as garth's would.
+    """
+
+    def __init__(self, base_url: Optional[str] = GARMIN_API_URL, concurrency: int = GARMIN_CONCURRENCY,
+                 timeout: float = GARMIN_TIMEOUT_SECONDS):
+        self.base_url = base_url.rstrip('/') if base_url else None  # None: the session's garth domain
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        # Created lazily so the client and semaphore bind to the loop that uses them
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.concurrency + 1)
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._client
+
+    def _url(self, auth: GarminAuth, path: str) -> str:
+        return (self.base_url or auth.url) + path
+
+    async def _with_retries(self, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        """Run one request attempt, retrying transport errors and retryable statuses with backoff"""
+        for retry in range(GARMIN_RETRIES + 1):
+            last = retry == GARMIN_RETRIES
+            try:
+                return await attempt()
+            except httpx.HTTPStatusError as e:
+                if last or e.response.status_code not in RETRY_STATUS_CODES:
+                    raise GarthHTTPError(msg='Error in request', error=e)
+            except httpx.TransportError:
+                if last:
+                    raise
+            await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** retry)
+
+    async def activity_page(self, auth: GarminAuth, start: int,
+                            limit: int = GARMIN_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """One page of the activity list, newest first"""
+        client = self._ensure_client()
+
+        async def attempt():
+            response = await client.get(self._url(auth, ACTIVITY_LIST_PATH), headers=auth.headers,
+                                        params={'start': start, 'limit': limit, 'activityType': ACTIVITY_TYPES})
+            response.raise_for_status()
+            return response.json() or []
+
+        with span('garmin_activities', logger):
+            return await self._with_retries(attempt)
+
+    async def download_gpx(self, auth: GarminAuth, activity_id: Any, store: ActivityStore) -> str:
+        """Stream one activity's GPX into the store, returning its SHA-256"""
+        client = self._ensure_client()
+        url = self._url(auth, GPX_DOWNLOAD_PATH.format(activity_id=quote(str(activity_id), safe='')))
+        async with self._semaphore:
+            with span('garmin_gpx_download', logger):
+                fd, tmp = store.temp_file()
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        async def attempt():
+                            # A retry starts the file over
+                            f.seek(0)
+                            f.truncate()
+                            digest = hashlib.sha256()
+                            async with client.stream('GET', url, headers=auth.headers,
+                                                     params={'format': 'gpx'}) as response:
+                                response.raise_for_status()
+                                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+                                    digest.update(chunk)
+                                    f.write(chunk)
+                            return digest
+
+                        digest = await self._with_retries(attempt)
+                except BaseException:
+                    os.remove(tmp)
+                    raise
+        return store.commit(tmp, digest.hexdigest())
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+async def _new_activities(client: GarminClient, auth: GarminAuth, last_seen: Optional[int],
+                          limit: int) -> List[Dict[str, Any]]:
+    """Activities newer than last_seen (IDs grow over time), paging only as far back as needed"""
+    new = []
+    start = 0
+    while len(new) < limit:
+        page = await client.activity_page(auth, start)
+        fresh = [a for a in page if last_seen is None or a['activityId'] > last_seen]
+        new += fresh
+        if len(page) < GARMIN_PAGE_SIZE or len(fresh) < len(page):
+            break
+        start += GARMIN_PAGE_SIZE
+    return new[:limit]
+
+
+def sync_activities(session: GarminSession, client: GarminClient, store: ActivityStore,
+                    limit: int = GARMIN_SYNC_LIMIT) -> Dict[str, Any]:
+    """
+    Download every activity newer than the last synced one (plus earlier failures) into the
+    store, concurrently. The newest seen ID only moves forward; failed downloads are kept
+    as pending and retried on the next sync.
+    """
+    with session.lock:
+        auth = session.auth()
+        state = store.load_state(session.user_key)
+        new = run_async(_new_activities(client, auth, state['last_activity_id'], limit))
+        wanted = {a['activityId']: a for a in state['pending'] + new}
+
+        async def download_all():
+            return await asyncio.gather(*(client.download_gpx(auth, activity_id, store)
+                                          for activity_id in wanted), return_exceptions=True)
+
+        results = run_async(download_all())
+        pending, failed = [], []
+        for (activity_id, activity), result in zip(wanted.items(), results):
+            if isinstance(result, BaseException):
+                pending.append(activity)
+                failed.append({'activity_id': activity_id, 'error': str(result)})
+                log_event(logger, logging.WARNING, 'garmin_download_failed', activity=activity_id, error=result)
+                continue
+            state['activities'][str(activity_id)] = {'sha256': result, **activity_summary(activity)}
+
+        if new:
+            newest = max(a['activityId'] for a in new)
+            state['last_activity_id'] = max(newest, state['last_activity_id'] or newest)
+        state['pending'] = pending
+        store.save_state(session.user_key, state)
+
+    log_event(logger, logging.INFO, 'garmin_synced', new=len(new), downloaded=len(wanted) - len(failed),
+              failed=len(failed))
+    return {
+        'new_activities': len(new),
+        'downloaded': len(wanted) - len(failed),
+        'failed': failed,
+        'last_activity_id': state['last_activity_id'],
+        'stored_activities': len(state['activities'])
+    }
+
+
+def fetch_activity_gpx(session: GarminSession, client: GarminClient, store: ActivityStore,
+                       activity_id: Any) -> str:
+    """Path of one activity's GPX, downloaded into the store unless it was synced already"""
+    state = store.load_state(session.user_key)
+    known = state['activities'].get(str(activity_id))
+    if known is not None and os.path.exists(store.object_path(known['sha256'])):
+        return store.object_path(known['sha256'])
+    digest = run_async(client.download_gpx(session.auth(), activity_id, store))
+    return store.object_path(digest)
+
+
+_client: Optional[GarminClient] = None
+_client_lock = threading.Lock()
+_store: Optional[ActivityStore] = None
+
+
+def get_garmin_client() -> GarminClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GarminClient()
+        return _client
+
+
+def configure_garmin_client(**kwargs) -> GarminClient:
+    """Replace the process-wide client (e.g. base_url of a local stand-in, concurrency)"""
+    global _client
+    with _client_lock:
+        old_client, _client = _client, GarminClient(**kwargs)
+    if old_client is not None:
+        run_async(old_client.aclose())
+    return _client
+
+
+def get_activity_store() -> ActivityStore:
+    """Process-wide activity store, its directories created on first use"""
+    global _store
+    with _client_lock:
+        if _store is None:
+            _store = ActivityStore()
+        return _store
+
+
+def configure_activity_store(path: str = GARMIN_STORE_PATH) -> ActivityStore:
+    """Replace the process-wide activity store (e.g. a temporary directory)"""
+    global _store
+    with _client_lock:
+        _store = ActivityStore(path)
+        return _store
@@ -0,0 +1,219 @@
+"""
+SanBernard Streaming GPX Parser
+Incremental trkpt/rtept parsing straight from the upload stream
+"""
+
+import io
+import numpy as np
+import xml.etree.ElementTree as ET
+from gpxpy.gpx import GPXBounds
+from gpxpy.gpxfield import parse_time
+from typing import Any, BinaryIO, Dict, Iterator, Optional, TextIO, Tuple, Union
+
+from engine import haversine_distances, running_sum
+from route import NAIVE_OFFSET, Route, to_datetime64, utc_offset
+
+READ_CHUNK_BYTES = 64 * 1024
+FLUSH_POINTS = 4096  # Points buffered before distances/ascent are computed in one pass
+POINT_TAGS = ('trkpt', 'rtept')
+SEGMENT_TAG = 'trkseg'
+
+
+def _local_name(tag: str) -> str:
+    """Strip the XML namespace so GPX 1.0 and 1.1 files parse alike"""
+    return tag.rsplit('}', 1)[-1]
+
+
+class _PointColumns:
+    """
+    Growable column arrays for one point sequence (all track points, or all route points).
+    Segment distances, ascent/descent and bounds are computed every FLUSH_POINTS points.
+    """
+
+    def __init__(self, count_elevation: bool, capacity: int = FLUSH_POINTS):
+        self.count_elevation = count_elevation
+        self.size = 0
+        self.flushed = 0
+        self.lat = np.empty(capacity, dtype=np.float64)
+        self.lon = np.empty(capacity, dtype=np.float64)
+        self.elevation = np.empty(capacity, dtype=np.float64)
+        self.has_elevation = np.empty(capacity, dtype=bool)
+        self.timestamps = np.empty(capacity, dtype='datetime64[us]')
+        self.utc_offsets = np.empty(capacity, dtype=np.int32)
+        self.segment_distance = np.zeros(capacity, dtype=np.float64)
+        self.has_time = False
+        self.total_distance = 0.0
+        self.total_ascent = 0.0
+        self.total_descent = 0.0
+        self.bounds = [np.inf, -np.inf, np.inf, -np.inf]  # min_lat, max_lat, min_lon, max_lon
+
+    def _grow(self):
+        capacity = self.lat.size * 2
+        for name in ('lat', 'lon', 'elevation', 'has_elevation', 'timestamps', 'utc_offsets',
+                     'segment_distance'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype) if name == 'segment_distance' else np.empty(capacity, dtype=old.dtype)
+            new[:old.size] = old
+            setattr(self, name, new)
+
+    def append(self, lat: float, lon: float, elevation: Optional[float], time: Optional[str]):
+        if self.size == self.lat.size:
+            self._grow()
+        i = self.size
+        self.lat[i] = lat
+        self.lon[i] = lon
+        self.elevation[i] = elevation or 0
+        self.has_elevation[i] = elevation is not None
+        if time:
+            parsed = parse_time(time)
+            self.timestamps[i] = to_datetime64(parsed)
+            self.utc_offsets[i] = utc_offset(parsed)
+            self.has_time = True
+        else:
+            self.timestamps[i] = np.datetime64('NaT', 'us')
+            self.utc_offsets[i] = NAIVE_OFFSET
+        self.size += 1
+        if self.size - self.flushed >= FLUSH_POINTS:
+            self.flush()
+
+    def flush(self):
+        """Measure the points added since the last flush (plus the previous point as carry)"""
+        if self.size == self.flushed:
+            return
+        start = max(self.flushed - 1, 0)
+        end = self.size
+
+        segment = haversine_distances(self.lat[start:end], self.lon[start:end])
+        self.segment_distance[start + 1:end] = segment
+        self.total_distance = running_sum(segment, self.total_distance)
+
+        if self.count_elevation:
+            has_elevation = self.has_elevation[start:end]
+            counted = has_elevation[:-1] & has_elevation[1:]
+            elev_change = np.diff(self.elevation[start:end])[counted]
+            self.total_ascent = running_sum(elev_change[elev_change > 0], self.total_ascent)
+            self.total_descent = running_sum(np.abs(elev_change[elev_change <= 0]), self.total_descent)
+
+        lat = self.lat[self.flushed:end]
+        lon = self.lon[self.flushed:end]
+        self.bounds = [
+            min(self.bounds[0], float(lat.min())),
+            max(self.bounds[1], float(lat.max())),
+            min(self.bounds[2], float(lon.min())),
+            max(self.bounds[3], float(lon.max())),
+        ]
+        self.flushed = end
+
+    def column(self, name: str) -> np.ndarray:
+        return getattr(self, name)[:self.size]
+
+
+def _iter_points(source: Union[BinaryIO, TextIO]) -> Iterator[Tuple[str, Optional[str], Optional[str], ET.Element]]:
+    """
+    Yield (tag, ele, time, element) for every trkpt/rtept while reading the source in chunks,
+    plus ('trkseg', None, None, element) when a track segment opens.
+    Finished elements are detached from their parent so the tree never grows.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    stack = []
+
+    def drain():
+        for event, elem in parser.read_events():
+            if event == 'start':
+                stack.append(elem)
+                if _local_name(elem.tag) == SEGMENT_TAG:
+                    yield SEGMENT_TAG, None, None, elem
+                continue
+            stack.pop()
+            tag = _local_name(elem.tag)
+            if tag in POINT_TAGS:
+                ele = time = None
+                for child in elem:
+                    name = _local_name(child.tag)
+                    if name == 'ele':
+                        ele = child.text
+                    elif name == 'time':
+                        time = child.text
+                yield tag, ele, time, elem
+            # Children of a point are read when the point closes; everything else can go now
+            if stack and _local_name(stack[-1].tag) not in POINT_TAGS:
+                del stack[-1][-1]
+
+    while True:
+        chunk = source.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
+
+
+def parse_gpx_stream(source: Union[str, bytes, BinaryIO, TextIO]) -> Dict[str, Any]:
+    """
+    Parse GPX incrementally from a string, bytes or readable stream.
+
+    Matches parse_gpx semantics: track points first, then route points; ascent/descent
+    only between consecutive track points that both have an elevation; route points carry
+    no time; bounds cover track points only (as gpxpy's GPX.get_bounds does).
+    track_segments lists the (start, end) point index range of every track segment.
+    """
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    elif isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    tracks = _PointColumns(count_elevation=True)
+    routes = _PointColumns(count_elevation=False)
+    segment_starts = []
+
+    for tag, ele, time, elem in _iter_points(source):
+        if tag == SEGMENT_TAG:
+            segment_starts.append(tracks.size)
+            continue
+        elevation = float(ele) if ele and ele.strip() else None
+        if tag == 'trkpt':
+            tracks.append(float(elem.get('lat')), float(elem.get('lon')), elevation, time)
+        else:
+            routes.append(float(elem.get('lat')), float(elem.get('lon')), elevation, None)
+
+    tracks.flush()
+    routes.flush()
+
+    if tracks.size and routes.size:
+        # Join the route onto the end of the tracks
+        routes.segment_distance[0] = haversine_distances(
+            [tracks.lat[tracks.size - 1], routes.lat[0]],
+            [tracks.lon[tracks.size - 1], routes.lon[0]]
+        )[0]
+
+    def joined(name: str) -> np.ndarray:
+        if not routes.size:
+            return tracks.column(name)
+        if not tracks.size:
+            return routes.column(name)
+        return np.concatenate((tracks.column(name), routes.column(name)))
+
+    segment_distance = joined('segment_distance')
+    route = Route(
+        lat=joined('lat'),
+        lon=joined('lon'),
+        elevation=joined('elevation'),
+        distance_from_start=np.cumsum(segment_distance),
+        has_elevation=joined('has_elevation'),
+        timestamps=joined('timestamps') if tracks.has_time else None,
+        utc_offsets=joined('utc_offsets') if tracks.has_time else None
+    )
+
+    bounds = None
+    if tracks.size:
+        bounds = GPXBounds(*tracks.bounds)
+
+    return {
+        'route': route,
+        'total_distance': route.total_distance,
+        'total_ascent': tracks.total_ascent,
+        'total_descent': tracks.total_descent,
+        'bounds': bounds,
+        'track_segments': list(zip(segment_starts, segment_starts[1:] + [tracks.size]))
+    }
@@ -0,0 +1,143 @@
+"""
+SanBernard History Analysis
+Personal pace factors from past activities, one GPX file per worker process
+"""
+
+import hashlib
+import multiprocessing
+import os
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from engine import cumulative_distance, pace_arrays, terrain_arrays
+from gpx_stream import parse_gpx_stream
+from pace_profile import ActivitySums, activity_sums
+from uploads import mapped_file
+
+HISTORY_WORKERS = int(os.environ.get('HISTORY_WORKERS', os.cpu_count() or 1))  # Files parsed in parallel
+HASH_CHUNK_BYTES = 1024 * 1024
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def segment_pace_factors(parsed: Dict[str, Any]) -> List[float]:
+    """Actual over estimated duration for every timed track segment of a parse_gpx_stream result"""
+    route = parsed['route']
+    if route.timestamps is None:
+        return []
+
+    pace_factors = []
+    for start, end in parsed['track_segments']:
+        if end - start < 2:
+            continue
+
+        start_time = route.timestamps[start]
+        end_time = route.timestamps[end - 1]
+        if np.isnat(start_time) or np.isnat(end_time):
+            continue
+
+        actual_duration = (end_time - start_time) / np.timedelta64(1, 's')
+
+        # Distances restart at the beginning of each segment
+        lat = route.lat[start:end]
+        lon = route.lon[start:end]
+        terrain = terrain_arrays(cumulative_distance(lat, lon), route.elevation[start:end])
+        estimated_duration = float(pace_arrays(terrain)['estimated_time'][-1])
+
+        if estimated_duration > 0:
+            pace_factors.append(float(actual_duration / estimated_duration))
+
+    return pace_factors
+
+
+def analyze_activity_file(path: str) -> Dict[str, Any]:
+    """
+    Worker entry point: pace factors for one spooled GPX file, read through a memory map,
+    plus its pace profile bin sums keyed by the file's SHA-256 (so re-uploads are not recounted)
+    """
+    digest = hashlib.sha256()
+    with mapped_file(path) as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+        f.seek(0)
+        parsed = parse_gpx_stream(f)
+    actual, estimated = activity_sums(parsed['route'], parsed['track_segments'])
+    return {
+        'pace_factors': segment_pace_factors(parsed),
+        'profile': (digest.hexdigest(), actual, estimated)
+    }
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Process pool shared by history and batch requests; recreated after a fork or a crashed worker"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn: forking a process that runs the weather event loop thread is unsafe
+            _pool = ProcessPoolExecutor(max_workers=HISTORY_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def reset_pool(pool: ProcessPoolExecutor):
+    """Drop a pool whose worker died so the next request starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def analyze_history_files(uploads: List[Tuple[str, str]],
+                          progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Analyze (filename, path) uploads in parallel, aggregating pace factors as each file
+    finishes. A file that fails to parse is reported in 'files' without failing the rest.
+    'profile_sums' holds the pace profile contribution of every file that parsed.
+    progress(done, total) is called after each file.
+    """
+    pool = get_pool()
+    futures = {pool.submit(analyze_activity_file, path): i for i, (_, path) in enumerate(uploads)}
+
+    files: List[Dict[str, Any]] = [{'filename': filename} for filename, _ in uploads]
+    profile_sums: List[ActivitySums] = []
+    pace_factor_total = 0.0
+    activities = 0
+    broken = False
+
+    for done, future in enumerate(as_completed(futures), 1):
+        if progress is not None:
+            progress(done, len(uploads))
+        report = files[futures[future]]
+        try:
+            analysis = future.result()
+        except BrokenProcessPool as e:
+            broken = True
+            report['error'] = f'Worker process failed: {e}'
+            continue
+        except Exception as e:
+            report['error'] = str(e)
+            continue
+        pace_factors = analysis['pace_factors']
+        pace_factor_total += sum(pace_factors)
+        activities += len(pace_factors)
+        report['activities'] = len(pace_factors)
+        if analysis['profile'][2].any():
+            profile_sums.append(analysis['profile'])
+
+    if broken:
+        reset_pool(pool)
+
+    return {
+        'pace_factor': pace_factor_total / activities if activities else None,
+        'activities_analyzed': activities,
+        'files': files,
+        'failed_files': sum(1 for report in files if 'error' in report),
+        'profile_sums': profile_sums
+    }
@@ -0,0 +1,142 @@
+"""
+SanBernard Jobs
+In-process background job queue for long-running analyses (no external broker)
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))  # Jobs run at the same time
+JOB_QUEUE_DEPTH = int(os.environ.get('JOB_QUEUE_DEPTH', 32))  # Queued + running jobs before rejecting
+JOB_RESULT_SECONDS = int(os.environ.get('JOB_RESULT_SECONDS', 600))  # How long finished jobs are kept
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """Raised by JobQueue.submit when JOB_QUEUE_DEPTH jobs are already pending"""
+
+
+@dataclass
+class Job:
+    """One submitted job; fn reports progress through report()"""
+    id: str
+    kind: str
+    status: str = QUEUED
+    progress: float = 0.0
+    message: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def report(self, progress: float, message: Optional[str] = None):
+        """Record progress (0-1) and an optional stage description"""
+        self.progress = min(max(progress, 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Status without the result"""
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': round(self.progress, 3),
+            'message': self.message,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error
+        }
+
+
+class JobQueue:
+    """
+    Bounded queue of jobs run by a thread pool. Finished jobs (and their results) are
+    dropped JOB_RESULT_SECONDS after they finish. The pool is recreated after a fork.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_depth: int = JOB_QUEUE_DEPTH,
+                 result_seconds: int = JOB_RESULT_SECONDS):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.result_seconds = result_seconds
+        self.rejected = 0
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='sanbernard-job')
+            self._pid = os.getpid()
+        return self._executor
+
+    def _expire(self, now: float):
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.done and job.finished_at + self.result_seconds <= now]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.done)
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args) -> Job:
+        """Queue fn(job, *args); raises QueueFullError when too many jobs are pending"""
+        with self._lock:
+            self._expire(time.time())
+            if self._pending() >= self.max_depth:
+                self.rejected += 1
+                raise QueueFullError(f'Job queue is full ({self.max_depth} pending jobs), try again later')
+            job = Job(id=uuid.uuid4().hex, kind=kind)
+            self._jobs[job.id] = job
+            self._get_executor().submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = fn(job, *args)
+            job.progress = 1.0
+            status = SUCCEEDED
+        except Exception as e:
+            job.error = str(e)
+            status = FAILED
+        # finished_at first: expiry reads it as soon as the job counts as done
+        job.finished_at = time.time()
+        job.status = status
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._expire(time.time())
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.time())
+            counts = {status: 0 for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return {
+                **counts,
+                'rejected': self.rejected,
+                'workers': self.workers,
+                'max_depth': self.max_depth,
+                'result_seconds': self.result_seconds
+            }
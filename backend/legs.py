@@ -0,0 +1,136 @@
+"""
+SanBernard Legs and Splits
+Prefix sums over an estimated route, so leg, split and time-to-position queries are binary searches
+"""
+
+import os
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from route import Route
+
+LEGS_MAX_QUERIES = int(os.environ.get('LEGS_MAX_QUERIES', 1000))  # Legs plus positions per request
+LEGS_MAX_SPLITS = int(os.environ.get('LEGS_MAX_SPLITS', 1000))  # Splits per request
+
+
+def climb_prefix(elevation: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Cumulative ascent and descent (meters, both positive) at every point, 0 at the start"""
+    change = np.diff(np.asarray(elevation, dtype=np.float64))
+    ascent = np.zeros(change.size + 1, dtype=np.float64)
+    descent = np.zeros(change.size + 1, dtype=np.float64)
+    np.cumsum(np.maximum(change, 0), out=ascent[1:])
+    np.cumsum(np.maximum(-change, 0), out=descent[1:])
+    return ascent, descent
+
+
+class RoutePrefix:
+    """
+    Distance, time, ascent and descent accumulated from the start to every point. Any
+    quantity between two positions is a difference of two prefix values, and a position
+    (by distance or time) is a binary search plus interpolation within one segment, so
+    each query is O(log n) however long the route. Arrays are shared, never modified.
+    """
+
+    def __init__(self, route: Route, estimated_time: np.ndarray, ascent: np.ndarray, descent: np.ndarray):
+        self.lat = route.lat
+        self.lon = route.lon
+        self.elevation = route.elevation
+        self.distance = route.distance_from_start
+        self.time = estimated_time
+        self.ascent = ascent
+        self.descent = descent
+
+    def __len__(self) -> int:
+        return self.distance.size
+
+    @property
+    def total_distance(self) -> float:
+        return float(self.distance[-1]) if len(self) else 0.0
+
+    @property
+    def total_time(self) -> float:
+        return float(self.time[-1]) if len(self) else 0.0
+
+    def _locate(self, key: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Segment index and fraction along it for each value of a non-decreasing key (clamped to the route)"""
+        values = np.clip(np.asarray(values, dtype=np.float64), key[0], key[-1])
+        index = np.clip(np.searchsorted(key, values, side='right') - 1, 0, max(key.size - 2, 0))
+        following = np.minimum(index + 1, key.size - 1)
+        span = key[following] - key[index]
+        fraction = np.zeros(values.shape)
+        np.divide(values - key[index], span, out=fraction, where=span > 0)
+        return index, fraction
+
+    def _interpolate(self, values: np.ndarray, index: np.ndarray, fraction: np.ndarray) -> np.ndarray:
+        following = np.minimum(index + 1, values.size - 1)
+        return values[index] + fraction * (values[following] - values[index])
+
+    def _positions(self, index: np.ndarray, fraction: np.ndarray) -> Dict[str, np.ndarray]:
+        following = np.minimum(index + 1, len(self) - 1)
+        lon_change = (self.lon[following] - self.lon[index] + 180) % 360 - 180
+        return {
+            'index': index,
+            'fraction': fraction,
+            'lat': self._interpolate(self.lat, index, fraction),
+            'lon': (self.lon[index] + fraction * lon_change + 180) % 360 - 180,
+            'elevation': self._interpolate(self.elevation, index, fraction),
+            'distance': self._interpolate(self.distance, index, fraction),
+            'time': self._interpolate(self.time, index, fraction),
+            'ascent': self._interpolate(self.ascent, index, fraction),
+            'descent': self._interpolate(self.descent, index, fraction),
+        }
+
+    def at_distance(self, distance: np.ndarray) -> Dict[str, np.ndarray]:
+        """Position, elapsed time and climb so far at each distance from the start (meters)"""
+        return self._positions(*self._locate(self.distance, distance))
+
+    def at_time(self, elapsed: np.ndarray) -> Dict[str, np.ndarray]:
+        """Where the estimate puts the walker after each elapsed time (seconds from the start)"""
+        return self._positions(*self._locate(self.time, elapsed))
+
+    def at_index(self, index: np.ndarray) -> Dict[str, np.ndarray]:
+        """Prefix values at waypoint indices (raises ValueError when out of range)"""
+        index = np.asarray(index, dtype=np.int64)
+        if index.size and (index.min() < 0 or index.max() >= len(self)):
+            raise ValueError(f'Point index out of range (route has {len(self)} points)')
+        return self._positions(index, np.zeros(index.shape))
+
+    def legs(self, start: Dict[str, np.ndarray], end: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Distance, time, ascent and descent between two sets of positions from at_*()"""
+        distance = end['distance'] - start['distance']
+        time = end['time'] - start['time']
+        speed = np.zeros(distance.shape)
+        np.divide(distance * 3.6, time, out=speed, where=time > 0)
+        return {
+            'from_distance': start['distance'],
+            'to_distance': end['distance'],
+            'from_time': start['time'],
+            'to_time': end['time'],
+            'distance': distance,
+            'time': time,
+            'ascent': end['ascent'] - start['ascent'],
+            'descent': end['descent'] - start['descent'],
+            'average_speed': speed,  # km/h
+        }
+
+    def splits(self, every_distance: Optional[float] = None,
+               every_time: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """
+        Consecutive legs every so many meters or seconds (the last one shorter), e.g. km
+        or hourly splits. Raises ValueError for a non-positive interval or too many splits.
+        """
+        if (every_distance is None) == (every_time is None):
+            raise ValueError('Give either a split distance or a split time')
+        every = every_distance if every_distance is not None else every_time
+        total = self.total_distance if every_distance is not None else self.total_time
+        if not every > 0:
+            raise ValueError('Split interval must be positive')
+        count = max(int(np.ceil(total / every)), 1)
+        if count > LEGS_MAX_SPLITS:
+            raise ValueError(f'Too many splits ({count}, at most {LEGS_MAX_SPLITS}); use a longer interval')
+        boundaries = np.minimum(every * np.arange(count + 1, dtype=np.float64), total)
+        locate = self.at_distance if every_distance is not None else self.at_time
+        positions = locate(boundaries)
+        start = {name: values[:-1] for name, values in positions.items()}
+        end = {name: values[1:] for name, values in positions.items()}
+        return self.legs(start, end)
@@ -0,0 +1,230 @@
+"""
+SanBernard Pace Profile
+Per-user pace learned per gradient and elapsed-time bin, updated one activity at a time
+"""
+
+import json
+import os
+import re
+import threading
+import numpy as np
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Sequence, Set, Tuple
+
+from engine import cumulative_distance, pace_arrays, terrain_arrays
+from route import Route
+
+# Bin edges; values beyond the outermost edges fall into open-ended bins
+GRADIENT_BIN_EDGES = np.arange(-30.0, 31.0, 5.0)  # percent
+ELAPSED_BIN_EDGES_HOURS = np.array([1.0, 2.0, 4.0, 6.0, 8.0])  # hours since the start (fatigue)
+PROFILE_PRIOR_SECONDS = 600  # Estimated seconds of data a bin needs to outweigh its fallback
+MAX_SEGMENT_SECONDS = 600  # Longer gaps between fixes are breaks or recording gaps, not pace
+PACE_PROFILE_PATH = os.environ.get('PACE_PROFILE_PATH')  # Optional directory for on-disk profiles
+USER_ID_PATTERN = re.compile(r'[A-Za-z0-9_.-]{1,64}')
+
+PROFILE_SHAPE = (ELAPSED_BIN_EDGES_HOURS.size + 1, GRADIENT_BIN_EDGES.size + 1)
+
+# (activity_id, actual_seconds, estimated_seconds) for one analyzed activity
+ActivitySums = Tuple[str, np.ndarray, np.ndarray]
+
+
+def gradient_bins(gradient: np.ndarray) -> np.ndarray:
+    return np.digitize(gradient, GRADIENT_BIN_EDGES)
+
+
+def elapsed_bins(elapsed_seconds: np.ndarray) -> np.ndarray:
+    return np.digitize(np.asarray(elapsed_seconds) / 3600, ELAPSED_BIN_EDGES_HOURS)
+
+
+def activity_sums(route: Route, track_segments: Sequence[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Actual and estimated (pace factor 1) seconds per (elapsed, gradient) bin over every
+    timed pair of consecutive points in the activity's track segments, in one O(points) pass.
+    """
+    actual = np.zeros(PROFILE_SHAPE, dtype=np.float64)
+    estimated = np.zeros(PROFILE_SHAPE, dtype=np.float64)
+    if route.timestamps is None:
+        return actual, estimated
+
+    for start, end in track_segments:
+        if end - start < 2:
+            continue
+
+        timestamps = route.timestamps[start:end]
+        timed = ~np.isnat(timestamps)
+        if not timed.any():
+            continue
+
+        lat = route.lat[start:end]
+        lon = route.lon[start:end]
+        terrain = terrain_arrays(cumulative_distance(lat, lon), route.elevation[start:end])
+        segment_estimate = np.diff(pace_arrays(terrain)['estimated_time'])
+
+        seconds = (timestamps - timestamps[timed][0]) / np.timedelta64(1, 's')
+        segment_actual = np.diff(seconds)
+        valid = (timed[:-1] & timed[1:] & (segment_actual > 0) &
+                 (segment_actual <= MAX_SEGMENT_SECONDS) & (segment_estimate > 0))
+
+        cells = (elapsed_bins(seconds[:-1][valid]) * PROFILE_SHAPE[1] +
+                 gradient_bins(terrain['gradient'][1:][valid]))
+        size = actual.size
+        actual += np.bincount(cells, segment_actual[valid], minlength=size).reshape(PROFILE_SHAPE)
+        estimated += np.bincount(cells, segment_estimate[valid], minlength=size).reshape(PROFILE_SHAPE)
+
+    return actual, estimated
+
+
+@dataclass
+class PaceProfile:
+    """
+    Running actual/estimated seconds per (elapsed, gradient) bin for one user.
+
+    A bin's factor is its actual over estimated time, shrunk towards the user's factor for
+    that gradient over all elapsed times, which in turn is shrunk towards their overall
+    factor (and that towards 1.0), so sparse bins borrow from better-sampled ones.
+    """
+    user_id: str
+    actual_seconds: np.ndarray = field(default_factory=lambda: np.zeros(PROFILE_SHAPE))
+    estimated_seconds: np.ndarray = field(default_factory=lambda: np.zeros(PROFILE_SHAPE))
+    activity_ids: Set[str] = field(default_factory=set)  # Activities already folded in
+    updated_at: Optional[str] = None
+
+    def add(self, activity_id: str, actual: np.ndarray, estimated: np.ndarray) -> bool:
+        """Fold one activity into the running sums; False if it was already counted"""
+        if activity_id in self.activity_ids:
+            return False
+        self.actual_seconds = self.actual_seconds + actual
+        self.estimated_seconds = self.estimated_seconds + estimated
+        self.activity_ids.add(activity_id)
+        self.updated_at = datetime.now(timezone.utc).isoformat()
+        return True
+
+    @property
+    def overall_factor(self) -> float:
+        return float((self.actual_seconds.sum() + PROFILE_PRIOR_SECONDS) /
+                     (self.estimated_seconds.sum() + PROFILE_PRIOR_SECONDS))
+
+    def gradient_factors(self) -> np.ndarray:
+        """Factor per gradient bin over all elapsed times"""
+        return ((self.actual_seconds.sum(axis=0) + PROFILE_PRIOR_SECONDS * self.overall_factor) /
+                (self.estimated_seconds.sum(axis=0) + PROFILE_PRIOR_SECONDS))
+
+    def factor_table(self) -> np.ndarray:
+        """Factor per (elapsed, gradient) bin"""
+        prior = self.gradient_factors()
+        return ((self.actual_seconds + PROFILE_PRIOR_SECONDS * prior) /
+                (self.estimated_seconds + PROFILE_PRIOR_SECONDS))
+
+    def factors(self, gradient: np.ndarray, elapsed_seconds: Optional[np.ndarray] = None) -> np.ndarray:
+        """Per-point pace factors looked up from the table (gradient only without elapsed times)"""
+        columns = gradient_bins(gradient)
+        if elapsed_seconds is None:
+            return self.gradient_factors()[columns]
+        return self.factor_table()[elapsed_bins(elapsed_seconds), columns]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'user_id': self.user_id,
+            'activities': len(self.activity_ids),
+            'pace_factor': round(self.overall_factor, 3),
+            'moving_hours': round(float(self.actual_seconds.sum()) / 3600, 2),
+            'updated_at': self.updated_at
+        }
+
+    def to_table(self) -> Dict[str, Any]:
+        """Summary plus the lookup tables, for the API"""
+        return {
+            **self.summary(),
+            'gradient_bin_edges': GRADIENT_BIN_EDGES.tolist(),
+            'elapsed_bin_edges_hours': ELAPSED_BIN_EDGES_HOURS.tolist(),
+            'gradient_factors': np.round(self.gradient_factors(), 3).tolist(),
+            'factors': np.round(self.factor_table(), 3).tolist(),
+            'estimated_hours': np.round(self.estimated_seconds / 3600, 2).tolist()
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'user_id': self.user_id,
+            'gradient_bin_edges': GRADIENT_BIN_EDGES.tolist(),
+            'elapsed_bin_edges_hours': ELAPSED_BIN_EDGES_HOURS.tolist(),
+            'actual_seconds': self.actual_seconds.tolist(),
+            'estimated_seconds': self.estimated_seconds.tolist(),
+            'activity_ids': sorted(self.activity_ids),
+            'updated_at': self.updated_at
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Optional['PaceProfile']:
+        """None when the profile was binned with different edges than the current ones"""
+        if (data.get('gradient_bin_edges') != GRADIENT_BIN_EDGES.tolist() or
+                data.get('elapsed_bin_edges_hours') != ELAPSED_BIN_EDGES_HOURS.tolist()):
+            return None
+        return cls(
+            user_id=data['user_id'],
+            actual_seconds=np.array(data['actual_seconds'], dtype=np.float64),
+            estimated_seconds=np.array(data['estimated_seconds'], dtype=np.float64),
+            activity_ids=set(data['activity_ids']),
+            updated_at=data.get('updated_at')
+        )
+
+
+def validate_user_id(user_id: Any) -> str:
+    """Raises ValueError unless user_id is 1-64 letters, digits, '_', '-' or '.'"""
+    if not isinstance(user_id, str) or not USER_ID_PATTERN.fullmatch(user_id):
+        raise ValueError('user_id must be 1-64 letters, digits, underscores, hyphens or dots')
+    return user_id
+
+
+class PaceProfileStore:
+    """Pace profiles by user ID, optionally backed by one JSON file per user in a directory"""
+
+    def __init__(self, path: Optional[str] = PACE_PROFILE_PATH):
+        self.path = path
+        self._profiles: Dict[str, PaceProfile] = {}
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, user_id: str) -> str:
+        return os.path.join(self.path, f'{user_id}.json')
+
+    def _lookup(self, user_id: str) -> Optional[PaceProfile]:
+        profile = self._profiles.get(user_id)
+        if profile is None and self.path:
+            try:
+                with open(self._file(user_id)) as f:
+                    profile = PaceProfile.from_dict(json.load(f))
+            except (OSError, KeyError, ValueError):
+                profile = None
+            if profile is not None:
+                self._profiles[user_id] = profile
+        return profile
+
+    def get(self, user_id: str) -> Optional[PaceProfile]:
+        with self._lock:
+            return self._lookup(user_id)
+
+    def update(self, user_id: str, activities: Sequence[ActivitySums]) -> Tuple[PaceProfile, int]:
+        """Add new activities to a user's profile; returns it and how many were new"""
+        with self._lock:
+            profile = self._lookup(user_id) or PaceProfile(user_id)
+            added = sum(profile.add(*activity) for activity in activities)
+            self._profiles[user_id] = profile
+            if self.path and added:
+                tmp = self._file(user_id) + '.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump(profile.to_dict(), f)
+                os.replace(tmp, self._file(user_id))
+            return profile, added
+
+    def delete(self, user_id: str) -> bool:
+        with self._lock:
+            existed = self._lookup(user_id) is not None
+            self._profiles.pop(user_id, None)
+            if self.path:
+                try:
+                    os.remove(self._file(user_id))
+                except FileNotFoundError:
+                    pass
+            return existed
@@ -0,0 +1,182 @@
+"""
+SanBernard Route Preprocessing
+DEM elevation, gap filling, distance-window smoothing and uniform-distance resampling
+"""
+
+import os
+import numpy as np
+from typing import Any, Dict, Optional, Tuple, Union
+
+from elevation import DEM_OFF, enrich_elevation, resolve_dem_mode
+from engine import running_sum
+from route import Route
+
+RESAMPLE_SPACING_M = float(os.environ.get('RESAMPLE_SPACING_M', 0))  # Default point spacing, 0 keeps the source points
+ELEVATION_SMOOTHING_M = float(os.environ.get('ELEVATION_SMOOTHING_M', 0))  # Default smoothing window, 0 is off
+MIN_RESAMPLE_SPACING_M = 1.0  # Finer spacing only multiplies points without adding detail
+MAX_SMOOTHING_M = 5000.0
+
+
+def fill_elevation_gaps(distance: np.ndarray, elevation: np.ndarray, has_elevation: np.ndarray) -> np.ndarray:
+    """
+    Elevation with points that had no <ele> interpolated by distance from their neighbours
+    (held flat before the first and after the last known point). Unchanged when every
+    point or no point has an elevation.
+    """
+    if has_elevation.all() or not has_elevation.any():
+        return elevation
+    return np.interp(distance, distance[has_elevation], elevation[has_elevation])
+
+
+def _profile_integral(distance: np.ndarray, elevation: np.ndarray, cumulative: np.ndarray,
+                      x: np.ndarray) -> np.ndarray:
+    """Integral of the piecewise-linear elevation profile from the start to each x"""
+    k = np.clip(np.searchsorted(distance, x, side='right') - 1, 0, distance.size - 2)
+    length = distance[k + 1] - distance[k]
+    slope = np.zeros_like(length)
+    np.divide(elevation[k + 1] - elevation[k], length, out=slope, where=length > 0)
+    t = x - distance[k]
+    return cumulative[k] + elevation[k] * t + 0.5 * slope * t * t
+
+
+def smooth_elevation(distance: np.ndarray, elevation: np.ndarray, window: float) -> np.ndarray:
+    """
+    Mean elevation over a window of the given length (meters) centred on every point,
+    weighted by distance rather than point count so uneven spacing does not bias it.
+    The window is cut short at both ends of the route.
+    """
+    if window <= 0 or distance.size < 3:
+        return elevation
+    segment_area = (elevation[:-1] + elevation[1:]) / 2 * np.diff(distance)
+    cumulative = np.concatenate(([0.0], np.cumsum(segment_area)))
+
+    lo = np.maximum(distance - window / 2, distance[0])
+    hi = np.minimum(distance + window / 2, distance[-1])
+    width = hi - lo
+    area = _profile_integral(distance, elevation, cumulative, hi) - \
+        _profile_integral(distance, elevation, cumulative, lo)
+    smoothed = elevation.copy()
+    np.divide(area, width, out=smoothed, where=width > 0)
+    return smoothed
+
+
+def _interp_timestamps(targets: np.ndarray, distance: np.ndarray, timestamps: np.ndarray) -> Optional[np.ndarray]:
+    """Timestamps at target distances, NaT outside the span of known times"""
+    known = ~np.isnat(timestamps)
+    if not known.any():
+        return None
+    known_distance = distance[known]
+    micros = np.interp(targets, known_distance, timestamps[known].astype('int64')).round().astype('int64')
+    result = micros.astype('datetime64[us]')
+    result[(targets < known_distance[0]) | (targets > known_distance[-1])] = np.datetime64('NaT', 'us')
+    return result
+
+
+def resample_route(route: Route, spacing: float) -> Route:
+    """
+    Points every `spacing` meters along the route (plus its last point), placed by linear
+    interpolation over distance from start. Distances stay those of the source route, so
+    the total distance is unchanged.
+    """
+    distance = route.distance_from_start
+    if len(route) < 2 or spacing <= 0:
+        return route
+    targets = np.arange(distance[0], distance[-1], spacing)
+    targets = np.append(targets, distance[-1])
+
+    # Unwrap longitude so segments crossing the antimeridian interpolate the short way round
+    lon = np.unwrap(route.lon, period=360)
+    resampled_lon = (np.interp(targets, distance, lon) + 180) % 360 - 180
+
+    return Route(
+        lat=np.interp(targets, distance, route.lat),
+        lon=resampled_lon,
+        elevation=np.interp(targets, distance, route.elevation),
+        distance_from_start=targets,
+        has_elevation=np.interp(targets, distance, route.has_elevation.astype(np.float64)) >= 0.5,
+        timestamps=_interp_timestamps(targets, distance, route.timestamps) if route.timestamps is not None else None,
+        # Each resampled point keeps the offset of the source point it follows
+        utc_offsets=route.utc_offsets[np.clip(np.searchsorted(distance, targets, side='right') - 1, 0, len(route) - 1)]
+        if route.timestamps is not None else None
+    )
+
+
+def elevation_totals(elevation: np.ndarray) -> Tuple[float, float]:
+    """Total ascent and descent (meters) over consecutive points"""
+    change = np.diff(elevation)
+    return running_sum(change[change > 0]), running_sum(np.abs(change[change < 0]))
+
+
+def enrich_route(parsed: Dict[str, Any], dem: str) -> Dict[str, Any]:
+    """
+    A parse_gpx_stream() result with DEM elevation sampled in (see enrich_elevation); ascent
+    and descent are recounted over every point when any elevation was added
+    """
+    route = parsed['route']
+    if dem == DEM_OFF or not enrich_elevation(route, dem):
+        return parsed
+    route.elevation = fill_elevation_gaps(route.distance_from_start, route.elevation, route.has_elevation)
+    total_ascent, total_descent = elevation_totals(route.elevation)
+    return {**parsed, 'total_ascent': total_ascent, 'total_descent': total_descent}
+
+
+def resolve_preprocess(spacing: Union[str, float, None] = None,
+                       smoothing: Union[str, float, None] = None,
+                       dem: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Resampling spacing and smoothing window in meters (0 is off) and DEM enrichment mode,
+    defaults from the environment (raises ValueError)
+    """
+    spacing = RESAMPLE_SPACING_M if spacing in (None, '') else float(spacing)
+    smoothing = ELEVATION_SMOOTHING_M if smoothing in (None, '') else float(smoothing)
+    if spacing < 0 or smoothing < 0:
+        raise ValueError('spacing and smoothing must be non-negative')
+    if 0 < spacing < MIN_RESAMPLE_SPACING_M:
+        raise ValueError(f'spacing must be 0 (off) or at least {MIN_RESAMPLE_SPACING_M:g} m')
+    if smoothing > MAX_SMOOTHING_M:
+        raise ValueError(f'smoothing must be at most {MAX_SMOOTHING_M:g} m')
+    return {'spacing': spacing, 'smoothing': smoothing, 'dem': resolve_dem_mode(dem)}
+
+
+def preprocess_key(options: Dict[str, Any]) -> str:
+    """Stable text for the options, mixed into the route ID so each variant is stored apart"""
+    # v2: totals are recounted after gap filling, so routes stored by v1 are parsed afresh
+    key = f"preprocess:v2:spacing={options['spacing']:g}:smoothing={options['smoothing']:g}"
+    # Without DEM enrichment the key (and so existing route IDs) is unchanged
+    if options.get('dem', DEM_OFF) != DEM_OFF:
+        key += f":dem={options['dem']}"
+    return key
+
+
+def preprocess_route(parsed: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Sample DEM elevation, fill elevation gaps, smooth, then resample a parse_gpx_stream()
+    result. Ascent and descent are recounted over the processed profile whenever any
+    elevation changed (DEM points, filled gaps, smoothing or resampling), so they agree
+    with the gradients the estimate uses; otherwise the parser's totals are kept.
+    """
+    if not len(parsed['route']):
+        return parsed
+    parsed = enrich_route(parsed, options.get('dem', DEM_OFF))
+    route = parsed['route']
+    filled = fill_elevation_gaps(route.distance_from_start, route.elevation, route.has_elevation)
+    gaps_filled = filled is not route.elevation
+    route.elevation = filled
+
+    spacing, smoothing = options['spacing'], options['smoothing']
+    if smoothing > 0:
+        route.elevation = smooth_elevation(route.distance_from_start, route.elevation, smoothing)
+    if spacing > 0:
+        route = resample_route(route, spacing)
+    if (gaps_filled or spacing > 0 or smoothing > 0) and route.has_elevation.any():
+        total_ascent, total_descent = elevation_totals(route.elevation)
+    else:
+        total_ascent, total_descent = parsed['total_ascent'], parsed['total_descent']
+
+    return {
+        **parsed,
+        'route': route,
+        'total_ascent': total_ascent,
+        'total_descent': total_descent,
+        'track_segments': None if spacing > 0 else parsed['track_segments']
+    }
@@ -0,0 +1,179 @@
+"""
+SanBernard Response Formats
+Content-negotiated route payloads: JSON points, columnar binary, NDJSON streams, gzip/brotli
+"""
+
+import gzip
+import json
+import os
+import struct
+import numpy as np
+from flask import Response, jsonify, request, stream_with_context
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from route import Route
+from telemetry import span
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only without it
+    brotli = None
+
+ROUTE_COLUMNS_MIMETYPE = 'application/vnd.sanbernard.route-columns'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_CHUNK_POINTS = int(os.environ.get('STREAM_CHUNK_POINTS', 2000))  # Points per NDJSON record
+COLUMNS_MAGIC = b'SBRC'
+COLUMNS_VERSION = 1
+COLUMN_ALIGNMENT = 8  # Every column starts on a multiple of 8 so Float64Array views need no copy
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))  # Smaller bodies are sent as is
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 5))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+
+
+def route_columns(route: Route) -> List[Tuple[str, np.ndarray]]:
+    """The per-point fields of Route.to_points() as little-endian arrays, in the same order"""
+    columns = [
+        ('lat', route.lat.astype('<f8', copy=False)),
+        ('lon', route.lon.astype('<f8', copy=False)),
+        ('elevation', route.elevation.astype('<f8', copy=False)),
+    ]
+    if route.timestamps is not None:
+        # Epoch milliseconds (what JS Date takes), NaN where a point has no time
+        time = route.timestamps.astype('int64').astype('<f8') / 1000
+        time[np.isnat(route.timestamps)] = np.nan
+        columns.append(('time', time))
+    columns.append(('distance_from_start', route.distance_from_start.astype('<f8', copy=False)))
+    if route.estimated:
+        columns += [
+            ('estimated_time', route.estimated_time.astype('<f8', copy=False)),
+            ('segment_speed', route.segment_speed.astype('<f4', copy=False)),
+            ('gradient', route.gradient.astype('<f4', copy=False)),
+            ('terrain_factor', route.terrain_factor.astype('<f4', copy=False)),
+        ]
+    if route.weather_applied:
+        columns.append(('weather_factor', route.weather_factor.astype('<f4', copy=False)))
+    return columns
+
+
+def _padding(size: int) -> int:
+    return -size % COLUMN_ALIGNMENT
+
+
+def encode_route_columns(route_data: Dict[str, Any], route: Route) -> bytes:
+    """
+    Columnar binary encoding of a route response.
+
+    Layout: 'SBRC', uint32 version, uint32 header length (little-endian), UTF-8 JSON header,
+    zero padding to 8 bytes, then each column's raw values padded to 8 bytes. The header
+    holds the non-point response fields under 'route' plus {name, dtype, offset, length}
+    per column, with offsets relative to the start of the column data.
+    """
+    columns = route_columns(route)
+    descriptors = []
+    offset = 0
+    for name, values in columns:
+        descriptors.append({
+            'name': name,
+            'dtype': 'float64' if values.dtype.itemsize == 8 else 'float32',
+            'offset': offset,
+            'length': int(values.size)
+        })
+        offset += values.nbytes + _padding(values.nbytes)
+
+    header = json.dumps({
+        'count': len(route),
+        'columns': descriptors,
+        'route': route_data
+    }, separators=(',', ':')).encode('utf-8')
+
+    parts = [COLUMNS_MAGIC, struct.pack('<II', COLUMNS_VERSION, len(header)), header]
+    parts.append(b'\0' * _padding(len(COLUMNS_MAGIC) + 8 + len(header)))
+    for _, values in columns:
+        parts.append(memoryview(np.ascontiguousarray(values)).cast('B'))
+        parts.append(b'\0' * _padding(values.nbytes))
+    return b''.join(parts)
+
+
+def wants_route_columns() -> bool:
+    """True when the client prefers the columnar binary format over JSON"""
+    best = request.accept_mimetypes.best_match(['application/json', ROUTE_COLUMNS_MIMETYPE])
+    return best == ROUTE_COLUMNS_MIMETYPE
+
+
+def wants_route_stream() -> bool:
+    """True when the client asks for NDJSON (by Accept header, or a stream field for plain forms)"""
+    if str(request.values.get('stream', '')).lower() in ('1', 'true', 'yes'):
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', ROUTE_COLUMNS_MIMETYPE, NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def ndjson_record(record: Dict[str, Any]) -> str:
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def route_point_records(route: Route, chunk_points: int = STREAM_CHUNK_POINTS) -> Iterator[str]:
+    """
+    The route's points as NDJSON 'points' records of chunk_points each, in order. Each chunk
+    is built from views of the route's arrays, so only one chunk is ever materialized.
+    """
+    for offset in range(0, len(route), chunk_points):
+        chunk = route.take(slice(offset, offset + chunk_points))
+        yield ndjson_record({'type': 'points', 'offset': offset, 'points': chunk.to_points()})
+
+
+def stream_response(records: Iterator[str]) -> Response:
+    """
+    NDJSON streamed as the records are produced (never compressed or buffered here, and
+    with proxy buffering turned off) so the client can render each one on arrival
+    """
+    response = Response(stream_with_context(records), mimetype=NDJSON_MIMETYPE)
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept')
+    return response
+
+
+def route_response(route_data: Dict[str, Any], route: Route) -> Response:
+    """The route as JSON points (default) or columnar binary, per the Accept header"""
+    if wants_route_columns():
+        with span('serialize', format='columns'):
+            response = Response(encode_route_columns(route_data, route), mimetype=ROUTE_COLUMNS_MIMETYPE)
+    else:
+        with span('serialize', format='json'):
+            response = jsonify({**route_data, 'points': route.to_points()})
+    response.vary.add('Accept')
+    return response
+
+
+def choose_encoding() -> Optional[str]:
+    """Best content coding both sides support, or None for identity"""
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response: Response) -> Response:
+    """after_request hook: gzip/brotli-compress sizeable bodies when the client accepts it"""
+    if (response.direct_passthrough or response.is_streamed or
+            'Content-Encoding' in response.headers or response.status_code < 200 or
+            response.status_code in (204, 304)):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    with span('compress', encoding=encoding, bytes=len(data)):
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
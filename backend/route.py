@@ -0,0 +1,213 @@
+"""
+SanBernard Route Representation
+Columnar (struct-of-arrays) storage for route points
+"""
+
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional
+
+from engine import BASE_SPEED_KMH
+
+# Served values keep full precision so the JSON matches the per-point estimate exactly;
+# only the columnar binary format narrows the per-segment descriptors to float32
+POSITION_DTYPE = np.float64
+FACTOR_DTYPE = np.float64
+NAIVE_OFFSET = np.iinfo(np.int32).min  # utc_offsets value for a time written without a zone
+
+
+@dataclass
+class RoutePoint:
+    """Represents a point on the route with all relevant data"""
+    lat: float
+    lon: float
+    elevation: float
+    distance_from_start: float  # meters
+    estimated_time: float  # seconds from start
+    segment_speed: float  # km/h for this segment
+    gradient: float  # percentage
+    terrain_factor: float
+    weather_factor: float
+
+
+def _zeros(n: int, dtype=POSITION_DTYPE) -> np.ndarray:
+    return np.zeros(n, dtype=dtype)
+
+
+@dataclass
+class Route:
+    """
+    A route stored as one array per field rather than one dict per point.
+
+    Every numeric column is float64. Timestamps are optional UTC datetime64[us]
+    values (NaT where a point has no time), with the UTC offset each was written
+    in kept alongside so they are served back as they appeared in the GPX.
+    """
+    lat: np.ndarray
+    lon: np.ndarray
+    elevation: np.ndarray
+    distance_from_start: np.ndarray  # meters
+    has_elevation: Optional[np.ndarray] = None  # bool, False where the source had no <ele>
+    estimated_time: Optional[np.ndarray] = None  # seconds from start
+    segment_speed: Optional[np.ndarray] = None  # km/h for the segment ending at each point
+    gradient: Optional[np.ndarray] = None  # percentage
+    terrain_factor: Optional[np.ndarray] = None
+    weather_factor: Optional[np.ndarray] = None
+    timestamps: Optional[np.ndarray] = None
+    utc_offsets: Optional[np.ndarray] = None  # int32 seconds east of UTC per timestamp (NAIVE_OFFSET: no zone)
+    estimated: bool = field(default=False)
+    weather_applied: bool = field(default=False)
+
+    def __post_init__(self):
+        n = len(self.lat)
+        self.lat = np.asarray(self.lat, dtype=POSITION_DTYPE)
+        self.lon = np.asarray(self.lon, dtype=POSITION_DTYPE)
+        self.elevation = np.asarray(self.elevation, dtype=POSITION_DTYPE)
+        self.distance_from_start = np.asarray(self.distance_from_start, dtype=POSITION_DTYPE)
+        if self.has_elevation is None:
+            self.has_elevation = np.ones(n, dtype=bool)
+        if self.estimated_time is None:
+            self.estimated_time = _zeros(n)
+        if self.segment_speed is None:
+            self.segment_speed = np.full(n, BASE_SPEED_KMH, dtype=FACTOR_DTYPE)
+        if self.gradient is None:
+            self.gradient = _zeros(n, FACTOR_DTYPE)
+        if self.terrain_factor is None:
+            self.terrain_factor = np.ones(n, dtype=FACTOR_DTYPE)
+        if self.weather_factor is None:
+            self.weather_factor = np.ones(n, dtype=FACTOR_DTYPE)
+        if self.timestamps is not None and self.utc_offsets is None:
+            self.utc_offsets = np.zeros(n, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return self.lat.size
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the point arrays"""
+        arrays = [self.lat, self.lon, self.elevation, self.distance_from_start, self.has_elevation,
+                  self.estimated_time, self.segment_speed, self.gradient, self.terrain_factor,
+                  self.weather_factor]
+        if self.timestamps is not None:
+            arrays += [self.timestamps, self.utc_offsets]
+        return sum(a.nbytes for a in arrays)
+
+    @property
+    def total_distance(self) -> float:
+        return float(self.distance_from_start[-1]) if len(self) else 0
+
+    @property
+    def total_time(self) -> float:
+        return float(self.estimated_time[-1]) if len(self) else 0
+
+    def point(self, i: int) -> RoutePoint:
+        """Materialize a single point"""
+        return RoutePoint(
+            lat=float(self.lat[i]),
+            lon=float(self.lon[i]),
+            elevation=float(self.elevation[i]),
+            distance_from_start=float(self.distance_from_start[i]),
+            estimated_time=float(self.estimated_time[i]),
+            segment_speed=float(self.segment_speed[i]),
+            gradient=float(self.gradient[i]),
+            terrain_factor=float(self.terrain_factor[i]),
+            weather_factor=float(self.weather_factor[i]),
+        )
+
+    def take(self, indices: np.ndarray) -> 'Route':
+        """Subset of points (e.g. weather samples), keeping every column aligned"""
+        return Route(
+            lat=self.lat[indices],
+            lon=self.lon[indices],
+            elevation=self.elevation[indices],
+            distance_from_start=self.distance_from_start[indices],
+            has_elevation=self.has_elevation[indices],
+            estimated_time=self.estimated_time[indices],
+            segment_speed=self.segment_speed[indices],
+            gradient=self.gradient[indices],
+            terrain_factor=self.terrain_factor[indices],
+            weather_factor=self.weather_factor[indices],
+            timestamps=self.timestamps[indices] if self.timestamps is not None else None,
+            utc_offsets=self.utc_offsets[indices] if self.timestamps is not None else None,
+            estimated=self.estimated,
+            weather_applied=self.weather_applied,
+        )
+
+    def time_strings(self) -> List[Optional[str]]:
+        """ISO-8601 timestamps per point in the offset they were written in (None where missing)"""
+        if self.timestamps is None:
+            return [None] * len(self)
+        zones = {}
+        strings = []
+        for ts, offset in zip(self.timestamps, self.utc_offsets.tolist()):
+            if np.isnat(ts):
+                strings.append(None)
+                continue
+            utc = EPOCH + timedelta(microseconds=int(ts.astype('int64')))
+            if offset == NAIVE_OFFSET:
+                strings.append(utc.replace(tzinfo=None).isoformat())
+                continue
+            if offset not in zones:
+                zones[offset] = timezone(timedelta(seconds=offset))
+            strings.append(utc.astimezone(zones[offset]).isoformat())
+        return strings
+
+    def to_points(self) -> List[Dict[str, Any]]:
+        """Convert to the list-of-dicts JSON shape served by the API"""
+        columns = {
+            'lat': self.lat.tolist(),
+            'lon': self.lon.tolist(),
+            'elevation': self.elevation.tolist(),
+            'time': self.time_strings(),
+            'distance_from_start': self.distance_from_start.tolist(),
+        }
+        if self.estimated:
+            columns.update({
+                'estimated_time': self.estimated_time.tolist(),
+                'segment_speed': self.segment_speed.tolist(),
+                'gradient': self.gradient.tolist(),
+                'terrain_factor': self.terrain_factor.tolist(),
+            })
+        if self.weather_applied:
+            columns['weather_factor'] = self.weather_factor.tolist()
+        keys = list(columns)
+        return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+    @classmethod
+    def from_points(cls, points: List[Dict[str, Any]]) -> 'Route':
+        """Build from the JSON point shape sent back by the frontend"""
+        return cls(
+            lat=[p['lat'] for p in points],
+            lon=[p['lon'] for p in points],
+            elevation=[p.get('elevation') or 0 for p in points],
+            distance_from_start=[p.get('distance_from_start', 0) for p in points],
+            estimated_time=np.array([p.get('estimated_time', 0) for p in points], dtype=POSITION_DTYPE),
+            estimated='estimated_time' in points[0] if points else False,
+        )
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def utc_offset(t: Optional[datetime]) -> int:
+    """Seconds east of UTC a datetime was written in, NAIVE_OFFSET without a zone (or for None)"""
+    if t is None or t.utcoffset() is None:
+        return NAIVE_OFFSET
+    return int(t.utcoffset().total_seconds())
+
+
+def to_datetime64(t: Optional[datetime]) -> np.datetime64:
+    """Convert a (possibly timezone-aware) datetime into a UTC datetime64[us], NaT for None"""
+    if t is None:
+        return np.datetime64('NaT', 'us')
+    if t.tzinfo is not None:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(t, 'us')
+
+
+def parse_timestamps(times: List[Optional[datetime]]) -> Optional[np.ndarray]:
+    """Convert per-point datetimes into a UTC datetime64[us] array, or None if there are none"""
+    if not any(times):
+        return None
+    return np.array([to_datetime64(t) for t in times], dtype='datetime64[us]')
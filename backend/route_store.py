@@ -0,0 +1,272 @@
+"""
+SanBernard Route Store
+Content-addressed cache of parsed routes, so pace changes skip re-parsing
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Callable, Dict, Optional, Tuple
+
+from engine import pace_arrays, terrain_arrays
+from legs import RoutePrefix, climb_prefix
+from route import Route
+from simplify import RouteLOD
+from spatial import SegmentIndex
+
+ROUTE_STORE_SIZE = int(os.environ.get('ROUTE_STORE_SIZE', 64))  # Max routes held in memory
+ROUTE_STORE_MAX_BYTES = int(os.environ.get('ROUTE_STORE_MAX_BYTES', 512 * 1024 * 1024))
+ROUTE_STORE_PATH = os.environ.get('ROUTE_STORE_PATH')  # Optional directory for on-disk copies
+HASH_CHUNK_BYTES = 1024 * 1024
+ESTIMATE_CACHE_SIZE = 8  # Pace factors whose no-weather estimate is kept per route (progress and leg queries)
+ROUTE_ID_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+
+@dataclass
+class StoredRoute:
+    """
+    A parsed route plus everything in its estimate that does not depend on pace. The
+    lazily built parts are built once under the route's lock, then reported through
+    on_resize so the store can count them against its byte budget.
+    """
+    route_id: str
+    route: Route
+    terrain: Dict[str, np.ndarray]  # terrain_arrays() output, float64
+    total_distance: float
+    total_ascent: float
+    total_descent: float
+    bounds: Optional[Dict[str, float]]
+    lod: Optional[RouteLOD] = None  # Computed on first level-of-detail request
+    spatial: Optional[SegmentIndex] = None  # Computed on first progress query
+    climb: Optional[Tuple[np.ndarray, np.ndarray]] = None  # Ascent and descent prefixes, on first leg query
+    estimates: 'OrderedDict[float, np.ndarray]' = field(default_factory=OrderedDict)  # estimated_time by pace
+    on_resize: Optional[Callable[['StoredRoute'], None]] = field(default=None, repr=False)  # Set by RouteStore
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)  # Estimate cache
+    _build_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)  # Lazy builds
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the route, its terrain arrays and whatever has been built lazily so far"""
+        total = self.route.nbytes + sum(a.nbytes for a in self.terrain.values())
+        if self.lod is not None:
+            total += self.lod.nbytes
+        if self.spatial is not None:
+            total += self.spatial.nbytes
+        if self.climb is not None:
+            total += sum(a.nbytes for a in self.climb)
+        with self._lock:
+            total += sum(a.nbytes for a in self.estimates.values())
+        return total
+
+    def _resized(self):
+        if self.on_resize is not None:
+            self.on_resize(self)
+
+    def _build(self, name: str, build: Callable[[], Any]) -> Any:
+        """A lazily built attribute, built by the first caller while concurrent callers wait for it"""
+        value = getattr(self, name)
+        if value is not None:
+            return value
+        with self._build_lock:
+            value = getattr(self, name)
+            if value is None:
+                value = build()
+                setattr(self, name, value)
+                built = True
+            else:
+                built = False
+        if built:
+            self._resized()
+        return value
+
+    def level_of_detail(self) -> RouteLOD:
+        return self._build('lod', lambda: RouteLOD(self.route))
+
+    def spatial_index(self) -> SegmentIndex:
+        return self._build('spatial', lambda: SegmentIndex(self.route))
+
+    def estimated_time(self, user_pace_factor: float = 1.0) -> np.ndarray:
+        """Cumulative no-weather estimate for a pace factor, kept for the most recent few factors"""
+        with self._lock:
+            estimated_time = self.estimates.get(user_pace_factor)
+        if estimated_time is None:
+            estimated_time = pace_arrays(self.terrain, user_pace_factor)['estimated_time']
+            with self._lock:
+                self.estimates[user_pace_factor] = estimated_time
+                self.estimates.move_to_end(user_pace_factor)
+                while len(self.estimates) > ESTIMATE_CACHE_SIZE:
+                    self.estimates.popitem(last=False)
+            self._resized()
+        return estimated_time
+
+    def climb_prefix(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self._build('climb', lambda: climb_prefix(self.route.elevation))
+
+    def route_prefix(self, user_pace_factor: float = 1.0,
+                     estimated_time: Optional[np.ndarray] = None) -> RoutePrefix:
+        """Prefix arrays for leg queries: the cached no-weather estimate unless one is given"""
+        if estimated_time is None:
+            estimated_time = self.estimated_time(user_pace_factor)
+        return RoutePrefix(self.route, estimated_time, *self.climb_prefix())
+
+
+def hash_upload(stream: BinaryIO, variant: str = '') -> str:
+    """
+    SHA-256 of the upload bytes followed by variant (the route ID), so one file prepared
+    two ways is stored twice; the stream is rewound afterwards
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_BYTES), b''):
+        digest.update(chunk)
+    digest.update(variant.encode('utf-8'))
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class RouteStore:
+    """
+    Bounded LRU of StoredRoutes keyed by upload hash (by count and by bytes), optionally
+    backed by .npz files in a directory so routes outlive eviction and restarts.
+    """
+
+    def __init__(self, max_entries: int = ROUTE_STORE_SIZE, max_bytes: int = ROUTE_STORE_MAX_BYTES,
+                 path: Optional[str] = ROUTE_STORE_PATH):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[str, StoredRoute]' = OrderedDict()
+        self._sizes: Dict[str, int] = {}  # Bytes each entry was last counted at
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, route_id: str) -> str:
+        return os.path.join(self.path, f'{route_id}.npz')
+
+    def get(self, route_id: str) -> Optional[StoredRoute]:
+        if not ROUTE_ID_PATTERN.fullmatch(route_id):
+            return None
+        with self._lock:
+            stored = self._entries.get(route_id)
+            if stored is not None:
+                self._entries.move_to_end(route_id)
+                self.hits += 1
+                return stored
+        stored = self._load(route_id) if self.path else None
+        with self._lock:
+            if stored is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(stored)
+        return stored
+
+    def put(self, stored: StoredRoute):
+        with self._lock:
+            self._insert(stored)
+        if self.path:
+            self._save(stored)
+
+    def _insert(self, stored: StoredRoute):
+        previous = self._entries.pop(stored.route_id, None)
+        if previous is not None:
+            self._bytes -= self._sizes.pop(stored.route_id)
+            previous.on_resize = None
+        stored.on_resize = self.resized
+        self._entries[stored.route_id] = stored
+        self._sizes[stored.route_id] = stored.nbytes
+        self._bytes += self._sizes[stored.route_id]
+        self._evict()
+
+    def _evict(self):
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            route_id, evicted = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(route_id)
+            evicted.on_resize = None
+
+    def resized(self, stored: StoredRoute):
+        """Recount an entry after it built a lazy part (level of detail, spatial index, estimates)"""
+        nbytes = stored.nbytes
+        with self._lock:
+            if self._entries.get(stored.route_id) is not stored:
+                return
+            self._bytes += nbytes - self._sizes[stored.route_id]
+            self._sizes[stored.route_id] = nbytes
+            self._evict()
+
+    def _save(self, stored: StoredRoute):
+        route = stored.route
+        arrays = {
+            'lat': route.lat,
+            'lon': route.lon,
+            'elevation': route.elevation,
+            'distance_from_start': route.distance_from_start,
+            'has_elevation': route.has_elevation,
+        }
+        if route.timestamps is not None:
+            arrays['timestamps'] = route.timestamps
+            arrays['utc_offsets'] = route.utc_offsets
+        summary = {
+            'total_distance': stored.total_distance,
+            'total_ascent': stored.total_ascent,
+            'total_descent': stored.total_descent,
+            'bounds': stored.bounds,
+        }
+        tmp = self._file(stored.route_id) + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, summary=np.array(json.dumps(summary)), **arrays)
+        os.replace(tmp, self._file(stored.route_id))
+
+    def _load(self, route_id: str) -> Optional[StoredRoute]:
+        try:
+            with np.load(self._file(route_id)) as data:
+                summary = json.loads(str(data['summary']))
+                route = Route(
+                    lat=data['lat'],
+                    lon=data['lon'],
+                    elevation=data['elevation'],
+                    distance_from_start=data['distance_from_start'],
+                    has_elevation=data['has_elevation'],
+                    timestamps=data['timestamps'] if 'timestamps' in data.files else None,
+                    utc_offsets=data['utc_offsets'] if 'utc_offsets' in data.files else None
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+        return make_stored_route(route_id, route, summary['total_distance'], summary['total_ascent'],
+                                 summary['total_descent'], summary['bounds'])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'persistent': self.path is not None
+            }
+
+
+def make_stored_route(route_id: str, route: Route, total_distance: float, total_ascent: float,
+                      total_descent: float, bounds: Optional[Dict[str, float]]) -> StoredRoute:
+    """Precompute the pace-independent terrain arrays for a freshly parsed route"""
+    return StoredRoute(
+        route_id=route_id,
+        route=route,
+        terrain=terrain_arrays(route.distance_from_start, route.elevation),
+        total_distance=total_distance,
+        total_ascent=total_ascent,
+        total_descent=total_descent,
+        bounds=bounds
+    )
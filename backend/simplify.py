@@ -0,0 +1,135 @@
+"""
+SanBernard Route Simplification
+Douglas-Peucker level-of-detail tiers for globe rendering
+"""
+
+import numpy as np
+from typing import Dict, Optional, Union
+
+from engine import EARTH_RADIUS_M
+from route import Route
+
+# Named tiers: maximum deviation (meters, elevation included) from the full-resolution route
+LOD_TIERS = {
+    'high': 1.0,
+    'medium': 5.0,
+    'low': 20.0,
+    'overview': 100.0,
+}
+ELEVATION_WEIGHT = 1.0  # Vertical meters count the same as horizontal meters
+SIGNIFICANCE_FLOOR = 0.1  # Stop refining spans whose deviation is below this (meters); also the finest tolerance
+
+
+def _project(route: Route) -> np.ndarray:
+    """Local equirectangular projection to meters, with weighted elevation as z"""
+    lat0 = np.radians(route.lat.mean())
+    x = np.radians(route.lon - route.lon.mean()) * EARTH_RADIUS_M * np.cos(lat0)
+    y = np.radians(route.lat - route.lat.mean()) * EARTH_RADIUS_M
+    z = route.elevation * ELEVATION_WEIGHT
+    return np.column_stack((x, y, z))
+
+
+def _point_segment_distances(p: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Row-wise distance from points p to segments a-b (all shaped (k, 3))"""
+    ab = b - a
+    length_sq = np.einsum('ij,ij->i', ab, ab)
+    t = np.zeros(length_sq.shape)
+    np.divide(np.einsum('ij,ij->i', p - a, ab), length_sq, out=t, where=length_sq > 0)
+    closest = a + np.clip(t, 0, 1)[:, None] * ab
+    return np.linalg.norm(p - closest, axis=1)
+
+
+def dp_significance(route: Route) -> np.ndarray:
+    """
+    Douglas-Peucker significance of every point: the largest tolerance at which the
+    point survives simplification (endpoints are infinite). Simplifying at tolerance t
+    keeps exactly the points with significance > t, so every tier comes from one pass.
+
+    All spans at the same recursion depth are split together in one vectorized step.
+    """
+    n = len(route)
+    significance = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return significance
+    significance[0] = significance[-1] = np.inf
+    if n < 3:
+        return significance
+
+    points = _project(route)
+    starts = np.array([0])
+    ends = np.array([n - 1])
+    limits = np.array([np.inf])
+
+    while starts.size:
+        lengths = ends - starts - 1
+        active = lengths > 0
+        starts, ends, limits, lengths = starts[active], ends[active], limits[active], lengths[active]
+        if not starts.size:
+            break
+
+        # Interior point indices of every span, laid out span after span
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        span = np.repeat(np.arange(starts.size), lengths)
+        interior = np.arange(lengths.sum()) - offsets[span] + starts[span] + 1
+
+        distances = _point_segment_distances(points[interior], points[starts[span]], points[ends[span]])
+
+        # Farthest point per span (first one on ties)
+        max_distance = np.maximum.reduceat(distances, offsets)
+        candidates = np.where(distances == max_distance[span], np.arange(distances.size), distances.size)
+        split = interior[np.minimum.reduceat(candidates, offsets)]
+
+        # A point can never be more significant than the split that exposed it
+        split_significance = np.minimum(max_distance, limits)
+        significance[split] = split_significance
+
+        refine = split_significance > SIGNIFICANCE_FLOOR
+        starts, split, ends, limits = starts[refine], split[refine], ends[refine], split_significance[refine]
+        starts, ends, limits = (np.concatenate((starts, split)), np.concatenate((split, ends)),
+                                np.concatenate((limits, limits)))
+
+    return significance
+
+
+class RouteLOD:
+    """Precomputed level-of-detail tiers for one route"""
+
+    def __init__(self, route: Route):
+        self.significance = dp_significance(route)
+
+    @property
+    def nbytes(self) -> int:
+        return self.significance.nbytes
+
+    def indices(self, tolerance: float) -> np.ndarray:
+        """
+        Indices of the points kept at the given tolerance (meters); 0 keeps every point.
+        Positive tolerances below SIGNIFICANCE_FLOOR simplify at the floor, since spans
+        are not refined further and their interior points have no significance.
+        """
+        if tolerance <= 0:
+            return np.arange(self.significance.size)
+        return np.flatnonzero(self.significance > max(tolerance, SIGNIFICANCE_FLOOR))
+
+    def tier_sizes(self) -> Dict[str, int]:
+        sizes = {'full': int(self.significance.size)}
+        sizes.update({name: int(np.count_nonzero(self.significance > tolerance))
+                      for name, tolerance in LOD_TIERS.items()})
+        return sizes
+
+
+def resolve_tolerance(tier: Optional[str], tolerance: Union[str, float, None]) -> Optional[float]:
+    """
+    Tolerance in meters from a tier name or explicit value; None for full resolution.
+    0 keeps every point; other explicit values are raised to SIGNIFICANCE_FLOOR.
+    """
+    if tolerance not in (None, ''):
+        value = float(tolerance)
+        if value < 0:
+            raise ValueError('tolerance must be non-negative')
+        return max(value, SIGNIFICANCE_FLOOR) if value > 0 else value
+    if tier in (None, '', 'full'):
+        return None
+    if tier not in LOD_TIERS:
+        raise ValueError(f"Unknown level of detail '{tier}' (expected full, {', '.join(LOD_TIERS)})")
+    return LOD_TIERS[tier]
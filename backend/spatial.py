@@ -0,0 +1,167 @@
+"""
+SanBernard Spatial Index
+Uniform grid over route segments for matching live GPS fixes to a route position
+"""
+
+import numpy as np
+from typing import Any, Dict, Optional
+
+from engine import EARTH_RADIUS_M
+from route import Route
+
+MIN_CELL_M = 10.0
+MAX_CELL_M = 2000.0
+MATCH_TOLERANCE_M = 25.0  # Segments this much farther than the nearest one still count as candidates
+BACKTRACK_PENALTY = 2.0  # Moving backwards from the last known position costs double
+
+
+class SegmentIndex:
+    """
+    Grid over a route's segments in a local equirectangular projection (meters). Each
+    segment is sampled every half cell and listed under the cells of its samples; cells
+    are kept as sorted keys with CSR offsets, so a cell lookup is a binary search.
+    Built once per route and read-only afterwards, so queries can run concurrently.
+    """
+
+    def __init__(self, route: Route):
+        self.lat = route.lat
+        self.lon = route.lon
+        self.distance = route.distance_from_start
+        self.lat0 = float(route.lat.mean()) if len(route) else 0.0
+        self.lon0 = float(route.lon.mean()) if len(route) else 0.0
+        self.x, self.y = self.project(route.lat, route.lon)
+
+        n = len(route)
+        if n < 2:
+            self.cell = MIN_CELL_M
+            self.keys = self.offsets = self.segments = self.cell_ix = self.cell_iy = np.zeros(0, dtype=np.int64)
+            return
+
+        dx, dy = np.diff(self.x), np.diff(self.y)
+        length = np.hypot(dx, dy)
+        self.cell = float(np.clip(2 * np.median(length), MIN_CELL_M, MAX_CELL_M))
+        self.min_x, self.min_y = self.x.min(), self.y.min()
+        self.nx = int((self.x.max() - self.min_x) // self.cell) + 1
+        self.ny = int((self.y.max() - self.min_y) // self.cell) + 1
+
+        # Samples every half cell along each segment (both ends included)
+        samples = np.ceil(length / (self.cell / 2)).astype(np.int64) + 1
+        segment = np.repeat(np.arange(n - 1), samples)
+        offsets = np.concatenate(([0], np.cumsum(samples)[:-1]))
+        t = (np.arange(samples.sum()) - offsets[segment]) / np.maximum(samples[segment] - 1, 1)
+        keys = self._key(self.x[segment] + t * dx[segment], self.y[segment] + t * dy[segment])
+
+        pairs = np.unique(keys * (n - 1) + segment)
+        cell_keys, self.segments = np.divmod(pairs, n - 1)
+        self.keys, starts = np.unique(cell_keys, return_index=True)
+        self.offsets = np.append(starts, cell_keys.size)
+        self.cell_ix, self.cell_iy = np.divmod(self.keys, self.ny)
+
+    def project(self, lat, lon):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        x = np.radians((lon - self.lon0 + 180) % 360 - 180) * EARTH_RADIUS_M * np.cos(np.radians(self.lat0))
+        y = np.radians(lat - self.lat0) * EARTH_RADIUS_M
+        return x, y
+
+    def _cell_xy(self, x, y):
+        return (np.floor((x - self.min_x) / self.cell).astype(np.int64),
+                np.floor((y - self.min_y) / self.cell).astype(np.int64))
+
+    def _key(self, x, y):
+        ix, iy = self._cell_xy(x, y)
+        return ix * self.ny + iy
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.x, self.y, self.keys, self.offsets, self.segments,
+                                      self.cell_ix, self.cell_iy))
+
+    def _candidates(self, ix: int, iy: int, radius: int) -> np.ndarray:
+        """Segments listed under the cells within `radius` cells of (ix, iy)"""
+        xs = np.arange(max(ix - radius, 0), min(ix + radius, self.nx - 1) + 1)
+        ys = np.arange(max(iy - radius, 0), min(iy + radius, self.ny - 1) + 1)
+        if not xs.size or not ys.size:
+            return np.zeros(0, dtype=np.int64)
+        if xs.size * ys.size <= self.keys.size:
+            # Binary search for each cell of the square
+            wanted = (xs[:, None] * self.ny + ys[None, :]).ravel()
+            position = np.searchsorted(self.keys, wanted)
+            found = position < self.keys.size
+            found[found] = self.keys[position[found]] == wanted[found]
+            position = position[found]
+        else:
+            # Far from the route the square is mostly empty: filter the occupied cells instead
+            position = np.flatnonzero((self.cell_ix >= xs[0]) & (self.cell_ix <= xs[-1]) &
+                                      (self.cell_iy >= ys[0]) & (self.cell_iy <= ys[-1]))
+        if not position.size:
+            return np.zeros(0, dtype=np.int64)
+        lengths = self.offsets[position + 1] - self.offsets[position]
+        starts = np.repeat(self.offsets[position] - np.cumsum(lengths) + lengths, lengths)
+        return np.unique(self.segments[starts + np.arange(lengths.sum())])
+
+    def _distances(self, segments: np.ndarray, x: float, y: float):
+        ax, ay = self.x[segments], self.y[segments]
+        dx, dy = self.x[segments + 1] - ax, self.y[segments + 1] - ay
+        length_sq = dx * dx + dy * dy
+        t = np.zeros(segments.size)
+        np.divide((x - ax) * dx + (y - ay) * dy, length_sq, out=t, where=length_sq > 0)
+        t = np.clip(t, 0, 1)
+        return np.hypot(ax + t * dx - x, ay + t * dy - y), t, np.degrees(np.arctan2(dx, dy)) % 360
+
+    def match(self, lat: float, lon: float, heading: Optional[float] = None,
+              last_index: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Nearest position on the route to a GPS fix. Where the route passes the same place
+        more than once (out-and-back, loops), candidates within MATCH_TOLERANCE_M of the
+        nearest are told apart by closeness to last_index, else by heading (degrees from north).
+        """
+        n = self.distance.size
+        if n == 0:
+            return None
+        x, y = self.project(lat, lon)
+        x, y = float(x), float(y)
+        if n == 1:
+            return self._position(0, 0.0, float(np.hypot(self.x[0] - x, self.y[0] - y)))
+
+        ix, iy = self._cell_xy(x, y)
+        ix, iy = int(ix), int(iy)
+        # Samples sit at most a quarter cell from any point of their segment, so once the
+        # square reaches past the tolerance band nothing outside it can be a candidate
+        max_radius = max(abs(ix), abs(ix - self.nx + 1), abs(iy), abs(iy - self.ny + 1), 1)
+        radius = 1
+        while True:
+            segments = self._candidates(ix, iy, radius)
+            if segments.size:
+                distance, t, bearing = self._distances(segments, x, y)
+                reach = radius * self.cell - self.cell / 4
+                if distance.min() + MATCH_TOLERANCE_M <= reach or radius >= max_radius:
+                    break
+            elif radius >= max_radius:
+                return None
+            radius *= 2
+
+        near = distance <= distance.min() + MATCH_TOLERANCE_M
+        segments, distance, t, bearing = segments[near], distance[near], t[near], bearing[near]
+        if last_index is not None and segments.size > 1:
+            last = self.distance[int(np.clip(last_index, 0, n - 1))]
+            along = self.distance[segments] + t * (self.distance[segments + 1] - self.distance[segments])
+            cost = np.where(along >= last, along - last, (last - along) * BACKTRACK_PENALTY)
+        elif heading is not None and segments.size > 1:
+            cost = np.abs((bearing - heading + 180) % 360 - 180)
+        else:
+            cost = distance
+        best = int(np.argmin(cost))
+        return self._position(int(segments[best]), float(t[best]), float(distance[best]))
+
+    def _position(self, segment: int, t: float, off_route: float) -> Dict[str, Any]:
+        following = min(segment + 1, self.distance.size - 1)
+        return {
+            'index': segment,
+            'fraction': t,
+            'lat': float(self.lat[segment] + t * (self.lat[following] - self.lat[segment])),
+            'lon': float((self.lon[segment] + t * ((self.lon[following] - self.lon[segment] + 180) % 360 - 180)
+                          + 180) % 360 - 180),
+            'distance_along': float(self.distance[segment] + t * (self.distance[following] - self.distance[segment])),
+            'off_route_distance': off_route
+        }
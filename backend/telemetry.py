@@ -0,0 +1,215 @@
+"""
+SanBernard Telemetry
+Timing spans, counters and histograms in Prometheus text format, plus structured logging
+"""
+
+import abc
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()  # DEBUG adds per-segment and per-span lines
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+POINT_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+Labels = Tuple[str, ...]
+Sample = Tuple[Dict[str, str], float]
+
+logger = logging.getLogger('sanbernard')
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    """Send 'sanbernard.*' loggers to stderr at the given level (once per process)"""
+    logger.setLevel(level)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+        logger.propagate = False
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, float):
+        value = round(value, 6)
+    text = str(value)
+    if not text or any(c in text for c in ' ="'):
+        return '"' + text.replace('"', '\\"') + '"'
+    return text
+
+
+def log_event(log: logging.Logger, level: int, event: str, **fields):
+    """
+    Log 'event key=value ...' at the given level. The level check comes first, so a
+    disabled level costs one call and no formatting.
+    """
+    if log.isEnabledFor(level):
+        log.log(level, '%s %s', event, ' '.join(f'{k}={_format_value(v)}' for k, v in fields.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + '}'
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(abc.ABC):
+    """One named metric family; subclasses yield its (sample name, labels, value) samples"""
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Labels:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """Current samples, e.g. name_bucket/name_sum/name_count for a histogram"""
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines += [f'{name}{_label_text(labels)} {_number(value)}' for name, labels, value in self.samples()]
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label combination"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    """Bucketed observations per label combination"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Labels, List[float]] = {}  # per-bucket counts, then +Inf count, then sum
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        for key, counts in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts[:-1]):
+                cumulative += count
+                yield f'{self.name}_bucket', {**labels, 'le': _number(bound)}, cumulative
+            yield f'{self.name}_sum', labels, counts[-1]
+            yield f'{self.name}_count', labels, cumulative
+
+
+class CallbackMetric(_Metric):
+    """Values read at scrape time (e.g. cache statistics kept by their owner)"""
+
+    def __init__(self, name: str, documentation: str, kind: str, callback: Callable[[], List[Sample]]):
+        super().__init__(name, documentation)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self):
+        for labels, value in self.callback():
+            if value is not None:
+                yield self.name, labels, value
+
+
+class Registry:
+    """All metrics of the process, rendered together for /api/metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, kind: str,
+                 callback: Callable[[], List[Sample]]) -> CallbackMetric:
+        return self._register(CallbackMetric(name, documentation, kind, callback))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines += metric.render()
+            except Exception as e:  # A failing callback must not take the whole scrape down
+                log_event(logger, logging.WARNING, 'metric_render_failed', metric=metric.name, error=e)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'sanbernard_stage_duration_seconds', 'Time spent in each processing stage', ['stage']
+)
+ROUTE_POINTS = REGISTRY.histogram(
+    'sanbernard_route_points', 'Points per route, as parsed and as served', ['stage'], POINT_BUCKETS
+)
+
+
+@contextmanager
+def span(stage: str, log: Optional[logging.Logger] = None, **fields):
+    """Time a block into sanbernard_stage_duration_seconds{stage=...} (and a DEBUG log line)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        log_event(log or logger, logging.DEBUG, 'span', stage=stage, seconds=elapsed, **fields)
@@ -0,0 +1,8 @@
+"""
+Test setup: backend modules are imported flat (from engine import ...), as the app does
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,117 @@
+"""
+Departure sweep matrix against one plain estimate per start time
+"""
+
+from dataclasses import replace
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+import departure
+from benchmarks.synthetic import synthetic_gpx
+from departure import departure_starts, sweep_departures
+from engine import pace_arrays, terrain_arrays
+from gpx_stream import parse_gpx_stream
+from weather import ForecastGrid
+
+HOUR = 3600.0
+T0 = datetime(2024, 6, 1, tzinfo=timezone.utc).timestamp()
+
+
+def forecast_grid(distance: np.ndarray, hours: int = 72, wind=0.0, precipitation=0.0) -> ForecastGrid:
+    """Grid at five points along the route; wind and precipitation are constants or (hours,) series"""
+    locations = np.linspace(0, distance[-1], 5)
+    shape = (locations.size, hours)
+    return ForecastGrid(
+        distance=locations,
+        times=T0 + HOUR * np.arange(hours),
+        temperature=np.full(shape, 12.0),
+        precipitation=np.broadcast_to(precipitation, shape).astype(np.float64),
+        wind_speed=np.broadcast_to(wind, shape).astype(np.float64),
+        snow_depth=np.zeros(shape)
+    )
+
+
+@pytest.fixture(scope='module')
+def route():
+    return parse_gpx_stream(synthetic_gpx(1500, seed=13))['route']
+
+
+@pytest.fixture(scope='module')
+def calm_time(route):
+    return pace_arrays(terrain_arrays(route.distance_from_start, route.elevation), 1.1)['estimated_time']
+
+
+def plain_estimate(route, grid, start: float) -> float:
+    from app import estimate_times
+    return estimate_times(replace(route), 1.1, weather_grid=grid,
+                          start_time=datetime.fromtimestamp(start, timezone.utc)).total_time
+
+
+@pytest.mark.parametrize('wind', [0.0, 60.0])
+def test_constant_forecast_matches_plain_estimate(route, calm_time, wind):
+    grid = forecast_grid(route.distance_from_start, wind=wind)
+    starts = departure_starts(T0, T0 + 12 * HOUR, 1800)
+    sweep = sweep_departures(route.distance_from_start, calm_time, grid, starts)
+
+    expected = [plain_estimate(route, grid, start) for start in starts]
+    np.testing.assert_allclose(sweep['total_time'], expected, rtol=1e-9)
+    # The same weather all day: every slot takes the calm time scaled by the one factor
+    np.testing.assert_allclose(sweep['total_time'], calm_time[-1] * (1.4 if wind else 1.0), rtol=1e-9)
+
+
+def test_changing_forecast_matches_plain_estimate(route, calm_time, monkeypatch):
+    hours = np.arange(72)
+    grid = forecast_grid(route.distance_from_start, wind=np.where(hours % 9 < 4, 55.0, 5.0),
+                         precipitation=np.where(hours % 7 < 2, 6.0, 0.0))
+    starts = departure_starts(T0, T0 + 24 * HOUR, 2700)
+    # Several blocks of starts, so the chunk boundaries are covered too
+    monkeypatch.setattr(departure, 'SWEEP_CHUNK_CELLS', len(route) * 4)
+    sweep = sweep_departures(route.distance_from_start, calm_time, grid, starts)
+
+    expected = [plain_estimate(route, grid, start) for start in starts]
+    np.testing.assert_allclose(sweep['total_time'], expected, rtol=1e-9)
+    assert np.ptp(sweep['total_time']) > 60
+
+
+@pytest.mark.parametrize('hours,step_minutes', [(0, 30), (6, 30), (24, 45), (24, 7)])
+def test_sweep_shape_matches_window(route, calm_time, hours, step_minutes):
+    starts = departure_starts(T0, T0 + hours * HOUR, step_minutes * 60)
+    assert starts.size == hours * 60 // step_minutes + 1
+    assert starts[0] == T0 and starts[-1] <= T0 + hours * HOUR
+
+    sweep = sweep_departures(route.distance_from_start, calm_time, forecast_grid(route.distance_from_start), starts)
+    assert all(values.shape == starts.shape for values in sweep.values())
+
+
+def test_window_limits():
+    with pytest.raises(ValueError):
+        departure_starts(T0, T0 - 1, 1800)
+    with pytest.raises(ValueError):
+        departure_starts(T0, T0 + HOUR, 0)
+    with pytest.raises(ValueError):
+        departure_starts(T0, T0 + departure.SWEEP_MAX_STARTS * 60, 60)
+
+
+def test_endpoint_covers_requested_window(route, monkeypatch):
+    import app as api
+
+    async def constant_grid(route):
+        return forecast_grid(route.distance_from_start, wind=60.0)
+
+    monkeypatch.setattr(api, 'fetch_forecast_grid', constant_grid)
+    points = [{'lat': float(lat), 'lon': float(lon), 'elevation': float(ele)}
+              for lat, lon, ele in zip(route.lat[:300], route.lon[:300], route.elevation[:300])]
+    response = api.app.test_client().post('/api/departure-sweep', json={
+        'points': points, 'window_start': '2024-06-01T06:00:00Z', 'window_end': '2024-06-01T10:00:00Z',
+        'step_minutes': 20, 'top': 100
+    })
+    report = response.get_json()
+
+    assert response.status_code == 200
+    assert report['candidates'] == 13 and len(report['departures']) == 13
+    assert report['window_start'].startswith('2024-06-01T06:00')
+    assert report['window_end'].startswith('2024-06-01T10:00')
+    total = report['calm_total_time'] * 1.4
+    assert all(d['estimated_total_time'] == pytest.approx(total) for d in report['departures'])
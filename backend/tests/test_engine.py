@@ -0,0 +1,72 @@
+"""
+Vectorized engine against the original per-point helpers
+"""
+
+import numpy as np
+import pytest
+
+from benchmarks import reference
+from benchmarks.synthetic import synthetic_gpx
+from engine import cumulative_distance, gradients, haversine_distances, pace_arrays, terrain_arrays, terrain_factors
+
+
+@pytest.fixture(scope='module')
+def points():
+    return reference.parse_gpx(synthetic_gpx(2000, seed=3))['points']
+
+
+def columns(points):
+    return (np.array([p['lat'] for p in points]), np.array([p['lon'] for p in points]),
+            np.array([p['elevation'] for p in points]))
+
+
+def test_haversine_matches_scalar(points):
+    lat, lon, _ = columns(points)
+    expected = [reference.calculate_distance(lat[i], lon[i], lat[i + 1], lon[i + 1]) for i in range(lat.size - 1)]
+    np.testing.assert_allclose(haversine_distances(lat, lon), expected, rtol=1e-12)
+
+
+def test_cumulative_distance_matches_running_total(points):
+    lat, lon, _ = columns(points)
+    np.testing.assert_allclose(cumulative_distance(lat, lon), [p['distance_from_start'] for p in points], rtol=1e-12)
+
+
+@pytest.mark.parametrize('gradient', [-40.0, -15.0, -14.9, -10.0, -5.0, 0.0, 0.1, 8.0, 35.0])
+def test_terrain_factor_rules(gradient):
+    assert terrain_factors(np.array([gradient]))[0] == pytest.approx(reference.get_terrain_factor(gradient))
+
+
+def test_gradient_zero_distance():
+    np.testing.assert_array_equal(gradients(np.array([5.0, -3.0, 2.0]), np.array([0.0, 10.0, 4.0])),
+                                  [reference.calculate_gradient(5.0, 0.0), reference.calculate_gradient(-3.0, 10.0),
+                                   reference.calculate_gradient(2.0, 4.0)])
+
+
+@pytest.mark.parametrize('pace_factor', [1.0, 0.8, 1.35])
+def test_pace_arrays_match_scalar_estimate(points, pace_factor):
+    expected = reference.estimate_times([dict(p) for p in points], pace_factor)
+    distance = np.array([p['distance_from_start'] for p in points])
+    _, _, elevation = columns(points)
+    terrain = terrain_arrays(distance, elevation)
+    estimates = pace_arrays(terrain, pace_factor)
+
+    np.testing.assert_allclose(terrain['gradient'], [p['gradient'] for p in expected], rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(terrain['terrain_factor'], [p['terrain_factor'] for p in expected], rtol=1e-12)
+    np.testing.assert_allclose(estimates['estimated_time'], [p['estimated_time'] for p in expected], rtol=1e-12)
+    np.testing.assert_allclose(estimates['segment_speed'], [p['segment_speed'] for p in expected], rtol=1e-12)
+
+
+def test_short_routes():
+    assert pace_arrays(terrain_arrays(np.zeros(1), np.zeros(1)))['estimated_time'].tolist() == [0.0]
+    assert haversine_distances(np.zeros(1), np.zeros(1)).size == 0
+
+
+@pytest.mark.parametrize('elevation', [True, False])
+def test_estimate_times_matches_scalar_estimate(elevation):
+    from app import estimate_times
+    from gpx_stream import parse_gpx_stream
+
+    gpx = synthetic_gpx(500, seed=5, elevation=elevation)
+    expected = reference.estimate_times(reference.parse_gpx(gpx)['points'], 1.1)
+    route = estimate_times(parse_gpx_stream(gpx)['route'], 1.1)
+    np.testing.assert_allclose(route.estimated_time, [p['estimated_time'] for p in expected], rtol=1e-12)
@@ -0,0 +1,70 @@
+"""
+Forecast cache: LRU eviction, expiry at the next forecast run and the sqlite backing
+"""
+
+from forecast_cache import ForecastCache
+
+RUN = 3600
+NOW = 1_717_200_000 // RUN * RUN + 60  # A minute into a forecast run
+
+
+def forecast(value: float):
+    return {'hourly': {'time': ['2024-06-01T00:00'], 'temperature_2m': [value]}}
+
+
+def test_cells_snap_to_the_grid():
+    cache = ForecastCache(grid_degrees=0.02, path=None)
+    assert cache.cell(46.009, 7.009) == cache.cell(45.991, 6.991) == (2300, 350)
+    assert cache.cell(46.011, 7.0) != cache.cell(46.009, 7.0)
+    assert cache.cell_center((2300, 350)) == (46.0, 7.0)
+
+
+def test_lru_eviction():
+    cache = ForecastCache(max_entries=2, refresh_seconds=RUN, path=None)
+    cache.put((1, 1), forecast(1), now=NOW)
+    cache.put((2, 2), forecast(2), now=NOW)
+    assert cache.get((1, 1), now=NOW) == forecast(1)  # Now the most recently used
+    cache.put((3, 3), forecast(3), now=NOW)
+
+    assert cache.get((2, 2), now=NOW) is None
+    assert cache.get((1, 1), now=NOW) == forecast(1) and cache.get((3, 3), now=NOW) == forecast(3)
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['entries'] == 2
+    assert (stats['hits'], stats['misses']) == (3, 1)
+
+
+def test_entries_expire_with_the_forecast_run():
+    cache = ForecastCache(refresh_seconds=RUN, path=None)
+    cache.put((1, 1), forecast(1), now=NOW)
+    assert cache.get((1, 1), now=NOW + RUN - 61) == forecast(1)
+    assert cache.get((1, 1), now=NOW + RUN - 60) is None  # The next run has started
+
+
+def test_sqlite_backing(tmp_path):
+    path = str(tmp_path / 'forecasts.sqlite')
+    writer = ForecastCache(refresh_seconds=RUN, path=path)
+    writer.put((1, 1), forecast(1), now=NOW)
+    writer.put((2, 2), forecast(2), now=NOW, persist=False)
+    writer.persist((2, 2), forecast(2), now=NOW)
+    writer.put((3, 3), forecast(3), now=NOW - RUN)  # Previous run, already expired
+
+    # A new process finds the current run's entries on disk
+    reader = ForecastCache(refresh_seconds=RUN, path=path)
+    assert reader.persistent
+    assert reader.get((1, 1), now=NOW, memory_only=True) is None
+    assert reader.stats()['misses'] == 0  # Not a miss until sqlite has been asked
+    assert reader.get((1, 1), now=NOW) == forecast(1)
+    assert reader.get((2, 2), now=NOW) == forecast(2)
+    assert reader.get((3, 3), now=NOW) is None
+    assert reader.get((1, 1), now=NOW, memory_only=True) == forecast(1)  # Loaded into memory
+    assert reader.get((1, 1), now=NOW + RUN) is None
+
+    reader.clear()
+    assert ForecastCache(refresh_seconds=RUN, path=path).get((2, 2), now=NOW) is None
+
+
+def test_memory_only_without_sqlite_counts_misses():
+    cache = ForecastCache(path=None)
+    assert not cache.persistent
+    assert cache.get((1, 1), memory_only=True) is None
+    assert cache.stats()['misses'] == 1
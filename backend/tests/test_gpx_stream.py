@@ -0,0 +1,121 @@
+"""
+Incremental GPX parser against gpxpy on track, route and mixed documents
+"""
+
+import io
+
+import gpxpy
+import numpy as np
+import pytest
+
+from benchmarks.reference import calculate_distance
+from benchmarks.synthetic import synthetic_gpx
+from gpx_stream import FLUSH_POINTS, parse_gpx_stream
+
+HEADER = '<?xml version="1.0"?>\n<gpx version="1.1" creator="tests" xmlns="http://www.topografix.com/GPX/1/1">\n'
+OFFSETS = ['Z', '+02:00', '-05:30', '']
+
+
+def _points(tag: str, n: int, rng: np.random.Generator, times: bool) -> str:
+    lat = 46.0 + np.cumsum(rng.normal(0, 1e-4, n))
+    lon = 7.0 + np.cumsum(rng.normal(0, 1e-4, n))
+    ele = np.round(np.abs(np.cumsum(rng.normal(0, 2, n))), 1)
+    ele[rng.random(n) < 0.1] = 0.0  # Sea level is a real elevation
+    has_ele = rng.random(n) > 0.15
+    lines = []
+    for i in range(n):
+        children = f'<ele>{ele[i]}</ele>' if has_ele[i] else ''
+        if times and i % 7:
+            children += f'<time>2024-06-01T{8 + i // 3600 % 12:02d}:{i // 60 % 60:02d}:{i % 60:02d}{OFFSETS[i % 4]}</time>'
+        lines.append(f'<{tag} lat="{lat[i]:.7f}" lon="{lon[i]:.7f}">{children}</{tag}>')
+    return '\n'.join(lines)
+
+
+def mixed_gpx(track_segments=(1500, 5000), route_points=800, seed=0) -> str:
+    rng = np.random.default_rng(seed)
+    body = ''
+    if track_segments:
+        segments = ''.join(f'<trkseg>\n{_points("trkpt", n, rng, True)}\n</trkseg>' for n in track_segments)
+        body += f'<trk><name>t</name>{segments}</trk>\n'
+    if route_points:
+        body += f'<rte><name>r</name>\n{_points("rtept", route_points, rng, False)}\n</rte>\n'
+    return HEADER + body + '</gpx>\n'
+
+
+def gpxpy_points(gpx_content: str):
+    """Track points then route points, with whether each is a track point"""
+    gpx = gpxpy.parse(gpx_content)
+    points = [(p, True) for t in gpx.tracks for s in t.segments for p in s.points]
+    points += [(p, False) for r in gpx.routes for p in r.points]
+    return gpx, points
+
+
+DOCUMENTS = {
+    'track': lambda: mixed_gpx(route_points=0),
+    'route': lambda: mixed_gpx(track_segments=(), route_points=FLUSH_POINTS + 10),
+    'mixed': lambda: mixed_gpx(),
+    'synthetic': lambda: synthetic_gpx(FLUSH_POINTS * 2 + 1, seed=1),
+    'synthetic-route': lambda: synthetic_gpx(3000, seed=2, kind='route', elevation=False),
+}
+
+
+@pytest.fixture(params=list(DOCUMENTS), scope='module')
+def document(request):
+    gpx_content = DOCUMENTS[request.param]()
+    return gpx_content, parse_gpx_stream(io.BytesIO(gpx_content.encode('utf-8')))
+
+
+def test_points_match_gpxpy(document):
+    gpx_content, parsed = document
+    _, points = gpxpy_points(gpx_content)
+    route = parsed['route']
+
+    assert len(route) == len(points)
+    np.testing.assert_array_equal(route.lat, [p.latitude for p, _ in points])
+    np.testing.assert_array_equal(route.lon, [p.longitude for p, _ in points])
+    np.testing.assert_array_equal(route.has_elevation, [p.elevation is not None for p, _ in points])
+    np.testing.assert_array_equal(route.elevation, [p.elevation if p.elevation is not None else 0 for p, _ in points])
+    expected_times = [p.time.isoformat() if track and p.time else None for p, track in points]
+    # Times come back in the offset they were written in (none when written without a zone)
+    assert route.time_strings() == expected_times
+
+
+def test_distances_and_totals_match_gpxpy(document):
+    gpx_content, parsed = document
+    gpx, points = gpxpy_points(gpx_content)
+
+    distance = [0.0]
+    for (a, _), (b, _) in zip(points, points[1:]):
+        distance.append(distance[-1] + calculate_distance(a.latitude, a.longitude, b.latitude, b.longitude))
+    np.testing.assert_allclose(parsed['route'].distance_from_start, distance, rtol=1e-9, atol=1e-6)
+    assert parsed['total_distance'] == pytest.approx(distance[-1], rel=1e-9)
+
+    # Ascent and descent only between consecutive track points that both have an elevation
+    track = [p for p, is_track in points if is_track]
+    changes = [b.elevation - a.elevation for a, b in zip(track, track[1:])
+               if a.elevation is not None and b.elevation is not None]
+    assert parsed['total_ascent'] == pytest.approx(sum(c for c in changes if c > 0), abs=1e-6)
+    assert parsed['total_descent'] == pytest.approx(sum(-c for c in changes if c <= 0), abs=1e-6)
+
+
+def test_bounds_and_segments_match_gpxpy(document):
+    gpx_content, parsed = document
+    gpx, _ = gpxpy_points(gpx_content)
+
+    bounds = gpx.get_bounds() if gpx.tracks else None
+    if bounds is None:
+        assert parsed['bounds'] is None
+    else:
+        assert (parsed['bounds'].min_latitude, parsed['bounds'].max_latitude,
+                parsed['bounds'].min_longitude, parsed['bounds'].max_longitude) == \
+            (bounds.min_latitude, bounds.max_latitude, bounds.min_longitude, bounds.max_longitude)
+
+    sizes = [len(s.points) for t in gpx.tracks for s in t.segments]
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(int).tolist()
+    assert parsed['track_segments'] == list(zip(starts, np.cumsum(sizes).astype(int).tolist()))
+
+
+def test_empty_document():
+    parsed = parse_gpx_stream(HEADER + '</gpx>')
+    assert len(parsed['route']) == 0
+    assert parsed['total_distance'] == 0 and parsed['bounds'] is None
@@ -0,0 +1,112 @@
+"""
+Background job queue: submit, poll and fetch results, directly and through the job endpoints
+"""
+
+import io
+import threading
+import time
+
+import pytest
+
+from benchmarks.synthetic import synthetic_gpx
+from jobs import FAILED, SUCCEEDED, JobQueue, QueueFullError
+
+
+def wait(poll, timeout: float = 30.0):
+    """Poll until it returns something truthy"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = poll()
+        if value:
+            return value
+        time.sleep(0.01)
+    raise AssertionError('Timed out waiting for the job')
+
+
+def test_submit_poll_result():
+    queue = JobQueue(workers=1)
+
+    def work(job, a, b):
+        job.report(0.5, 'Adding')
+        return a + b
+
+    job = queue.submit('add', work, 2, 3)
+    done = wait(lambda: queue.get(job.id).done and queue.get(job.id))
+    assert done.status == SUCCEEDED and done.result == 5
+    assert done.to_dict()['progress'] == 1.0 and done.to_dict()['message'] == 'Adding'
+    assert queue.get('missing') is None
+
+
+def test_failing_job_reports_error():
+    queue = JobQueue(workers=1)
+
+    def work(job):
+        raise ValueError('bad input')
+
+    job = queue.submit('fail', work)
+    wait(lambda: job.done)
+    assert job.status == FAILED and job.to_dict()['error'] == 'bad input'
+    assert queue.stats()[FAILED] == 1
+
+
+def test_full_queue_rejects_and_results_expire():
+    queue = JobQueue(workers=1, max_depth=1, result_seconds=0)
+    release = threading.Event()
+    job = queue.submit('block', lambda job: release.wait(10))
+    with pytest.raises(QueueFullError):
+        queue.submit('block', lambda job: None)
+    assert queue.stats()['rejected'] == 1
+
+    release.set()
+    wait(lambda: job.done)
+    assert queue.get(job.id) is None
+
+
+@pytest.fixture
+def client():
+    import app as api
+    return api.app.test_client()
+
+
+def submit(client, gpx: bytes):
+    response = client.post('/api/jobs/parse-gpx', data={'file': (io.BytesIO(gpx), 'a.gpx')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 202
+    assert response.headers['Location'] == f"/api/jobs/{response.get_json()['job_id']}"
+    return response.get_json()['job_id']
+
+
+def finished(client, job_id: str):
+    """Poll the status endpoint until the job is done"""
+    def poll():
+        status = client.get(f'/api/jobs/{job_id}').get_json()
+        return status if status['status'] in (SUCCEEDED, FAILED) else None
+    return wait(poll)
+
+
+def test_parse_job_endpoints(client):
+    gpx = synthetic_gpx(500, seed=7).encode('utf-8')
+    job_id = submit(client, gpx)
+    status = finished(client, job_id)
+    assert status['status'] == SUCCEEDED and status['error'] is None
+
+    result = client.get(f'/api/jobs/{job_id}/result')
+    direct = client.post('/api/parse-gpx', data={'file': (io.BytesIO(gpx), 'a.gpx')},
+                         content_type='multipart/form-data')
+    assert result.status_code == 200
+    assert result.get_json() == direct.get_json()
+
+
+def test_failed_job_endpoints(client):
+    job_id = submit(client, b'<gpx><trk><trkseg><trkpt lat="x"')
+    status = finished(client, job_id)
+    assert status['status'] == FAILED and status['error']
+
+    result = client.get(f'/api/jobs/{job_id}/result')
+    assert result.status_code == 500 and result.get_json()['error'] == status['error']
+
+
+def test_unknown_job_ids(client):
+    for path in ('/api/jobs/0123456789abcdef', '/api/jobs/0123456789abcdef/result'):
+        response = client.get(path)
+        assert response.status_code == 404 and 'error' in response.get_json()
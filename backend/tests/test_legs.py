@@ -0,0 +1,116 @@
+"""
+Prefix-sum leg, split and position queries against a linear scan of the route
+"""
+
+import io
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import synthetic_gpx
+from gpx_stream import parse_gpx_stream
+from legs import LEGS_MAX_SPLITS, RoutePrefix
+from route_store import make_stored_route
+
+FIELDS = ['lat', 'elevation', 'distance', 'time', 'ascent', 'descent']
+
+
+@pytest.fixture(scope='module')
+def prefix() -> RoutePrefix:
+    parsed = parse_gpx_stream(synthetic_gpx(3000, seed=21))
+    stored = make_stored_route('test', parsed['route'], parsed['total_distance'], parsed['total_ascent'],
+                               parsed['total_descent'], parsed['bounds'])
+    return stored.route_prefix(1.2)
+
+
+def scan(prefix: RoutePrefix, key: np.ndarray, value: float) -> dict:
+    """Walk the points to the last segment starting at or before value, accumulating the climb on the way"""
+    value = min(max(value, key[0]), key[-1])
+    ascent = descent = 0.0
+    i = 0
+    while i + 2 < key.size and key[i + 1] <= value:
+        change = prefix.elevation[i + 1] - prefix.elevation[i]
+        ascent += max(change, 0.0)
+        descent += max(-change, 0.0)
+        i += 1
+    change = prefix.elevation[i + 1] - prefix.elevation[i]
+    span = key[i + 1] - key[i]
+    t = (value - key[i]) / span if span > 0 else 0.0
+    return {
+        'lat': prefix.lat[i] + t * (prefix.lat[i + 1] - prefix.lat[i]),
+        'elevation': prefix.elevation[i] + t * change,
+        'distance': prefix.distance[i] + t * (prefix.distance[i + 1] - prefix.distance[i]),
+        'time': prefix.time[i] + t * (prefix.time[i + 1] - prefix.time[i]),
+        'ascent': ascent + t * max(change, 0.0),
+        'descent': descent + t * max(-change, 0.0),
+    }
+
+
+def assert_matches(positions: dict, expected: list):
+    for name in FIELDS:
+        np.testing.assert_allclose(positions[name], [e[name] for e in expected], rtol=1e-9, atol=1e-6,
+                                   err_msg=name)
+
+
+def test_at_distance_matches_scan(prefix):
+    rng = np.random.default_rng(1)
+    distances = np.concatenate((rng.uniform(0, prefix.total_distance, 200),
+                                [-50.0, 0.0, prefix.total_distance, prefix.total_distance + 50]))
+    assert_matches(prefix.at_distance(distances), [scan(prefix, prefix.distance, d) for d in distances])
+
+
+def test_at_time_matches_scan(prefix):
+    rng = np.random.default_rng(2)
+    times = np.concatenate((rng.uniform(0, prefix.total_time, 200), [0.0, prefix.total_time + 60]))
+    assert_matches(prefix.at_time(times), [scan(prefix, prefix.time, t) for t in times])
+
+
+def test_legs_between_waypoints_match_scan(prefix):
+    rng = np.random.default_rng(3)
+    start, end = np.sort(rng.integers(0, len(prefix), (2, 100)), axis=0)
+    legs = prefix.legs(prefix.at_index(start), prefix.at_index(end))
+    for i, (a, b) in enumerate(zip(start, end)):
+        change = np.diff(prefix.elevation[a:b + 1])
+        assert legs['distance'][i] == pytest.approx(prefix.distance[b] - prefix.distance[a], abs=1e-6)
+        assert legs['time'][i] == pytest.approx(prefix.time[b] - prefix.time[a], abs=1e-6)
+        assert legs['ascent'][i] == pytest.approx(change[change > 0].sum(), abs=1e-6)
+        assert legs['descent'][i] == pytest.approx(-change[change < 0].sum(), abs=1e-6)
+
+    with pytest.raises(ValueError):
+        prefix.at_index([len(prefix)])
+
+
+@pytest.mark.parametrize('every', [{'every_distance': 1000.0}, {'every_time': 3600.0}])
+def test_splits_cover_the_route(prefix, every):
+    splits = prefix.splits(**every)
+    interval = next(iter(every.values()))
+    spans = splits['distance'] if 'every_distance' in every else splits['time']
+
+    np.testing.assert_allclose(spans[:-1], interval, rtol=1e-9)
+    assert 0 < spans[-1] <= interval + 1e-6
+    assert splits['distance'].sum() == pytest.approx(prefix.total_distance, rel=1e-9)
+    assert splits['time'].sum() == pytest.approx(prefix.total_time, rel=1e-9)
+    assert splits['ascent'].sum() == pytest.approx(prefix.ascent[-1], rel=1e-9)
+    assert splits['descent'].sum() == pytest.approx(prefix.descent[-1], rel=1e-9)
+
+
+def test_split_limits(prefix):
+    with pytest.raises(ValueError):
+        prefix.splits()
+    with pytest.raises(ValueError):
+        prefix.splits(every_distance=0)
+    with pytest.raises(ValueError):
+        prefix.splits(every_distance=prefix.total_distance / (LEGS_MAX_SPLITS + 1) * 0.99)
+
+
+@pytest.mark.parametrize('body', [{'legs': [1, 'x']}, {'legs': [{'to_distance': 500}, None]}, {'at_times': [[60]]}])
+def test_endpoint_rejects_malformed_queries(body):
+    import app as api
+
+    client = api.app.test_client()
+    gpx = io.BytesIO(synthetic_gpx(300, seed=4).encode('utf-8'))
+    uploaded = client.post('/api/parse-gpx', data={'file': (gpx, 'a.gpx')},
+                           content_type='multipart/form-data').get_json()
+    response = client.post(f"/api/routes/{uploaded['route_id']}/legs", json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
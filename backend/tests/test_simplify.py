@@ -0,0 +1,69 @@
+"""
+Vectorized Douglas-Peucker significance against a reference per-span DP
+"""
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import synthetic_gpx
+from gpx_stream import parse_gpx_stream
+from route import Route
+from simplify import SIGNIFICANCE_FLOOR, RouteLOD, _project, dp_significance, resolve_tolerance
+
+
+def reference_dp(points: np.ndarray, tolerance: float) -> list:
+    """Textbook Douglas-Peucker: split each span at its farthest point while that is beyond tolerance"""
+    keep = {0, len(points) - 1}
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = points[start], points[end]
+        ab = b - a
+        best, best_distance = None, -1.0
+        for i in range(start + 1, end):
+            length_sq = float(ab @ ab)
+            t = float((points[i] - a) @ ab) / length_sq if length_sq > 0 else 0.0
+            distance = float(np.linalg.norm(points[i] - (a + min(max(t, 0.0), 1.0) * ab)))
+            if distance > best_distance:
+                best, best_distance = i, distance
+        if best_distance > tolerance:
+            keep.add(best)
+            stack += [(start, best), (best, end)]
+    return sorted(keep)
+
+
+@pytest.fixture(scope='module')
+def route():
+    return parse_gpx_stream(synthetic_gpx(1500, seed=11))['route']
+
+
+@pytest.mark.parametrize('tolerance', [SIGNIFICANCE_FLOOR, 0.5, 1.0, 5.0, 20.0, 100.0])
+def test_matches_reference_dp(route, tolerance):
+    kept = RouteLOD(route).indices(tolerance)
+    assert kept.tolist() == reference_dp(_project(route), tolerance)
+
+
+def test_significance_orders_tiers(route):
+    lod = RouteLOD(route)
+    sizes = lod.tier_sizes()
+    assert sizes['full'] == len(route) > sizes['high'] >= sizes['medium'] >= sizes['low'] >= sizes['overview'] >= 2
+    assert set(lod.indices(20.0)) <= set(lod.indices(5.0))
+
+
+def test_tolerance_floor(route):
+    lod = RouteLOD(route)
+    assert resolve_tolerance(None, '0.01') == SIGNIFICANCE_FLOOR
+    assert resolve_tolerance(None, '0') == 0
+    assert lod.indices(0.01).tolist() == lod.indices(SIGNIFICANCE_FLOOR).tolist()
+    assert lod.indices(0).size == len(route)
+    with pytest.raises(ValueError):
+        resolve_tolerance('coarse', None)
+
+
+@pytest.mark.parametrize('n', [0, 1, 2])
+def test_short_routes(n):
+    route = Route(lat=np.linspace(54, 54.01, n), lon=np.zeros(n), elevation=np.zeros(n),
+                  distance_from_start=np.zeros(n))
+    assert np.isinf(dp_significance(route)).sum() == n
@@ -0,0 +1,91 @@
+"""
+Grid segment matching against a brute-force scan of every segment
+"""
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import synthetic_gpx
+from engine import haversine_distances
+from gpx_stream import parse_gpx_stream
+from route import Route
+from spatial import MATCH_TOLERANCE_M, SegmentIndex
+
+
+def brute_force(index: SegmentIndex, lat: float, lon: float):
+    """Distance from a fix to every segment, in the index's own projection"""
+    x, y = (float(v) for v in index.project(lat, lon))
+    ax, ay, bx, by = index.x[:-1], index.y[:-1], index.x[1:], index.y[1:]
+    dx, dy = bx - ax, by - ay
+    distances = []
+    for i in range(dx.size):
+        length_sq = dx[i] ** 2 + dy[i] ** 2
+        t = ((x - ax[i]) * dx[i] + (y - ay[i]) * dy[i]) / length_sq if length_sq > 0 else 0.0
+        t = min(max(t, 0.0), 1.0)
+        distances.append(float(np.hypot(ax[i] + t * dx[i] - x, ay[i] + t * dy[i] - y)))
+    return np.array(distances)
+
+
+def make_route(lat, lon) -> Route:
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    distance = np.concatenate(([0.0], np.cumsum(haversine_distances(lat, lon))))[:lat.size]
+    return Route(lat=lat, lon=lon, elevation=np.zeros(lat.size), distance_from_start=distance,
+                 has_elevation=np.zeros(lat.size, dtype=bool))
+
+
+@pytest.fixture(scope='module')
+def route():
+    return parse_gpx_stream(synthetic_gpx(2000, seed=5))['route']
+
+
+@pytest.fixture(scope='module')
+def index(route):
+    return SegmentIndex(route)
+
+
+def fixes(route: Route, count: int, spread: float, seed: int):
+    """Random points around the route, from right on it to `spread` degrees away"""
+    rng = np.random.default_rng(seed)
+    at = rng.integers(0, len(route), count)
+    return route.lat[at] + rng.normal(0, spread, count), route.lon[at] + rng.normal(0, spread, count)
+
+
+@pytest.mark.parametrize('spread', [1e-5, 1e-3, 0.05])
+def test_nearest_matches_brute_force(route, index, spread):
+    for lat, lon in zip(*fixes(route, 60, spread, seed=int(spread * 1e6))):
+        distances = brute_force(index, lat, lon)
+        match = index.match(lat, lon)
+        assert match['off_route_distance'] == pytest.approx(distances.min(), abs=1e-6)
+        assert distances[match['index']] == pytest.approx(distances.min(), abs=1e-6)
+        assert 0.0 <= match['fraction'] <= 1.0
+
+
+def test_hints_stay_within_tolerance(route, index):
+    rng = np.random.default_rng(3)
+    for lat, lon in zip(*fixes(route, 60, 2e-4, seed=4)):
+        distances = brute_force(index, lat, lon)
+        for match in (index.match(lat, lon, heading=float(rng.uniform(0, 360))),
+                      index.match(lat, lon, last_index=int(rng.integers(0, len(route))))):
+            assert match['off_route_distance'] == pytest.approx(distances[match['index']], abs=1e-6)
+            assert match['off_route_distance'] <= distances.min() + MATCH_TOLERANCE_M + 1e-6
+
+
+def test_out_and_back_is_told_apart():
+    # Out along a line and back 5 m to the side
+    out_lon = np.linspace(7.0, 7.02, 200)
+    route = make_route(np.concatenate((np.full(200, 46.0), np.full(200, 46.0 + 5 / 111_195))),
+                       np.concatenate((out_lon, out_lon[::-1])))
+    index = SegmentIndex(route)
+    lat, lon = 46.0 + 2.5 / 111_195, 7.01
+
+    assert index.match(lat, lon, last_index=50)['index'] < 199
+    assert index.match(lat, lon, last_index=300)['index'] >= 200
+    assert index.match(lat, lon, heading=90.0)['index'] < 199
+    assert index.match(lat, lon, heading=270.0)['index'] >= 200
+
+
+def test_tiny_routes():
+    assert SegmentIndex(make_route([], [])).match(46.0, 7.0) is None
+    single = SegmentIndex(make_route([46.0], [7.0])).match(46.001, 7.0)
+    assert single['index'] == 0 and single['off_route_distance'] == pytest.approx(111.2, abs=0.5)
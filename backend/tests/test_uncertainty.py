@@ -0,0 +1,67 @@
+"""
+Start-day sunsets against published times, and the finish-before-dark probability over a day
+"""
+
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks.synthetic import synthetic_gpx
+from uncertainty import day_sunset
+
+# (lat, lon, start late in the local day, published sunset in UTC)
+SUNSETS = [
+    (51.5072, -0.1276, '2024-06-21T20:00:00+00:00', '2024-06-21T20:21:00+00:00'),  # London, 21:21 BST
+    (21.3069, -157.8583, '2024-06-22T04:00:00+00:00', '2024-06-22T05:16:00+00:00'),  # Honolulu, 19:16 HST
+    (-36.8485, 174.7633, '2024-06-21T04:30:00+00:00', '2024-06-21T05:11:00+00:00'),  # Auckland, 17:11 NZST
+    (59.3293, 18.0686, '2024-12-21T14:00:00+01:00', '2024-12-21T13:48:00+00:00'),  # Stockholm, 14:48 CET
+]
+
+
+@pytest.mark.parametrize('lat,lon,start,sunset', SUNSETS)
+def test_sunset_on_the_start_day(lat, lon, start, sunset):
+    start = datetime.fromisoformat(start)
+    found = day_sunset(lat, lon, start)
+    assert abs(found - datetime.fromisoformat(sunset)) < timedelta(minutes=2)
+    # Starting after dark keeps that day's sunset rather than moving on to tomorrow's
+    assert day_sunset(lat, lon, found + timedelta(hours=2)) == found
+
+
+def test_polar_day_has_no_sunset():
+    assert day_sunset(78.2232, 15.6267, datetime(2024, 6, 21, 12, tzinfo=timezone.utc)) is None
+
+
+@pytest.fixture(scope='module')
+def route_id():
+    import app as api
+
+    response = api.app.test_client().post(
+        '/api/parse-gpx', data={'file': (io.BytesIO(synthetic_gpx(2000, seed=9).encode('utf-8')), 'a.gpx')},
+        content_type='multipart/form-data'
+    )
+    return response.get_json()['route_id']
+
+
+def uncertainty(route_id: str, start: datetime):
+    import app as api
+
+    response = api.app.test_client().post(f'/api/routes/{route_id}/uncertainty', json={
+        'start_time': start.isoformat(), 'samples': 500, 'seed': 1
+    })
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_p_before_dark_falls_through_the_day(route_id):
+    # The synthetic routes are in the Lake District, about 12 minutes behind UTC
+    starts = [datetime(2024, 6, 21, 0, 30, tzinfo=timezone.utc) + timedelta(minutes=30 * i) for i in range(47)]
+    reports = [uncertainty(route_id, start) for start in starts]
+    chances = [report['p_before_dark'] for report in reports]
+
+    assert all(later <= earlier for earlier, later in zip(chances, chances[1:]))
+    assert chances[0] == 1.0 and chances[-1] == 0.0
+    assert len({report['sunset'] for report in reports}) == 1
+    # Once the start is past sunset there is no chance at all
+    sunset = datetime.fromisoformat(reports[0]['sunset'])
+    assert all(p == 0.0 for start, p in zip(starts, chances) if start >= sunset)
@@ -0,0 +1,85 @@
+"""
+Size limits on plain, gzip and zip uploads, through the endpoints and the spooling helpers
+"""
+
+import gzip
+import io
+import zipfile
+
+import pytest
+
+import uploads
+from benchmarks.synthetic import synthetic_gpx
+
+LIMIT = 256 * 1024
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import app as api
+
+    monkeypatch.setattr(uploads, 'UPLOAD_MAX_FILE_BYTES', LIMIT)
+    return api.app.test_client()
+
+
+def padded_gpx(size: int) -> bytes:
+    """A valid GPX document grown to about size bytes with whitespace (compresses to almost nothing)"""
+    gpx = synthetic_gpx(50, seed=1).encode('utf-8')
+    return gpx.replace(b'</gpx>', b' ' * max(size - len(gpx), 0) + b'</gpx>')
+
+
+def zipped(*entries) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in entries:
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def post(client, path: str, content: bytes, filename: str, field: str = 'file'):
+    return client.post(path, data={field: (io.BytesIO(content), filename)}, content_type='multipart/form-data')
+
+
+def assert_too_large(response):
+    assert response.status_code == 413
+    assert 'larger than' in response.get_json()['error']
+
+
+def test_small_uploads_pass(client):
+    content = padded_gpx(LIMIT // 2)
+    for body, name in [(content, 'a.gpx'), (gzip.compress(content), 'a.gpx.gz'), (zipped(('a.gpx', content)), 'a.zip')]:
+        assert post(client, '/api/parse-gpx', body, name).status_code == 200
+
+
+def test_oversized_plain_upload(client):
+    assert_too_large(post(client, '/api/parse-gpx', padded_gpx(LIMIT + 1), 'big.gpx'))
+
+
+def test_gzip_bomb(client):
+    bomb = gzip.compress(padded_gpx(LIMIT * 64))
+    assert len(bomb) < LIMIT
+    assert_too_large(post(client, '/api/parse-gpx', bomb, 'bomb.gpx.gz'))
+    assert_too_large(post(client, '/api/batch-estimate', bomb, 'bomb.gpx.gz', field='files'))
+
+
+def test_oversized_zip_member(client):
+    archive = zipped(('small.gpx', padded_gpx(1024)), ('big.gpx', padded_gpx(LIMIT * 4)))
+    assert len(archive) < LIMIT
+    assert_too_large(post(client, '/api/batch-estimate', archive, 'routes.zip', field='files'))
+    assert_too_large(post(client, '/api/parse-gpx', zipped(('big.gpx', padded_gpx(LIMIT * 4))), 'big.zip'))
+
+
+def test_request_budget_spans_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(uploads, 'UPLOAD_MAX_FILE_BYTES', LIMIT)
+    monkeypatch.setattr(uploads, 'UPLOAD_MAX_REQUEST_BYTES', LIMIT * 2)
+
+    class Upload:
+        def __init__(self, filename: str, content: bytes):
+            self.filename, self.stream = filename, io.BytesIO(content)
+
+    files = [Upload(f'{i}.gpx.gz', gzip.compress(padded_gpx(LIMIT - 1024))) for i in range(3)]
+    spooled = []
+    with pytest.raises(uploads.UploadTooLargeError, match='in total'):
+        for name, _ in uploads.spool_uploads(files, str(tmp_path)):
+            spooled.append(name)
+    assert spooled == ['0.gpx', '1.gpx']
@@ -0,0 +1,163 @@
+"""
+Weather client against a stubbed Open-Meteo: batching, caching, sqlite reuse and retries,
+plus the forecast grid's alignment and bilinear interpolation
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+import httpx
+import numpy as np
+import pytest
+
+import weather
+from benchmarks.mock_weather import hourly_forecast
+from forecast_cache import ForecastCache
+from weather import ForecastGrid, WeatherClient
+
+URL = 'http://open-meteo.test/v1/forecast'
+
+
+class StubOpenMeteo:
+    """Answers forecast calls like Open-Meteo (a list for several locations) and records each call"""
+
+    def __init__(self, failures: int = 0):
+        self.calls = []
+        self.failures = failures
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        query = parse_qs(request.url.query.decode())
+        lats = [float(v) for v in query['latitude'][0].split(',')]
+        lons = [float(v) for v in query['longitude'][0].split(',')]
+        self.calls.append(list(zip(lats, lons)))
+        if self.failures:
+            self.failures -= 1
+            return httpx.Response(503)
+        forecasts = [{'latitude': lat, 'longitude': lon, 'utc_offset_seconds': 0,
+                      'hourly': hourly_forecast(lat, lon)} for lat, lon in zip(lats, lons)]
+        return httpx.Response(200, content=json.dumps(forecasts[0] if len(forecasts) == 1 else forecasts))
+
+
+def run(stub: StubOpenMeteo, fetch, **kwargs):
+    """Run fetch(client) on a fresh loop with a WeatherClient whose HTTP calls go to the stub"""
+    async def main():
+        client = WeatherClient(base_url=URL, **kwargs)
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(stub))
+        client._semaphore = asyncio.Semaphore(client.concurrency)
+        try:
+            return await fetch(client)
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def gather(*locations):
+    async def fetch(client):
+        return await asyncio.gather(*(client.fetch_forecast(lat, lon) for lat, lon in locations))
+    return fetch
+
+
+LOCATIONS = [(46.0, 7.0), (46.1, 7.1), (46.2, 7.2), (46.3, 7.3), (46.4, 7.4)]
+
+
+def test_batches_locations_into_one_call():
+    stub = StubOpenMeteo()
+    results = run(stub, gather(*LOCATIONS, LOCATIONS[0]), batch_size=50, batch_delay=0.05)
+
+    assert stub.calls == [LOCATIONS]  # The repeated location is asked for once
+    for (lat, lon), result in zip(LOCATIONS + [LOCATIONS[0]], results):
+        assert (result['latitude'], result['longitude']) == (lat, lon)
+        assert result['hourly'] == hourly_forecast(lat, lon)
+
+
+def test_full_batches_are_sent_at_once():
+    stub = StubOpenMeteo()
+    run(stub, gather(*LOCATIONS), batch_size=2, batch_delay=0.2)
+    assert sorted(len(call) for call in stub.calls) == [1, 2, 2]
+    assert sorted(location for call in stub.calls for location in call) == LOCATIONS
+
+
+def test_without_batching_each_location_is_its_own_call():
+    stub = StubOpenMeteo()
+    run(stub, gather(*LOCATIONS), batch_size=1)
+    assert sorted(stub.calls) == [[location] for location in LOCATIONS]
+
+
+def test_cache_serves_repeats_and_shares_inflight_fetches():
+    stub = StubOpenMeteo()
+    cache = ForecastCache(path=None)
+
+    async def fetch(client):
+        # Two fixes in one grid cell at once, then the same cell again
+        first = await asyncio.gather(client.fetch_forecast(46.001, 7.001), client.fetch_forecast(46.002, 7.002))
+        return first + [await client.fetch_forecast(46.0, 7.0)]
+
+    results = run(stub, fetch, cache=cache, batch_size=50, batch_delay=0.01)
+    assert stub.calls == [[cache.cell_center(cache.cell(46.0, 7.0))]]
+    assert results[0] == results[1] == results[2]
+    assert cache.stats()['hits'] == 1
+
+
+def test_sqlite_cache_is_reused_by_a_new_client(tmp_path):
+    path = str(tmp_path / 'forecasts.sqlite')
+    stub = StubOpenMeteo()
+    first = run(stub, gather(*LOCATIONS[:3]), cache=ForecastCache(path=path), batch_size=50, batch_delay=0.01)
+    assert len(stub.calls) == 1
+
+    second = run(stub, gather(*LOCATIONS[:3]), cache=ForecastCache(path=path), batch_size=50, batch_delay=0.01)
+    assert len(stub.calls) == 1
+    assert second == first
+
+
+def test_retries_unavailable_upstream(monkeypatch):
+    monkeypatch.setattr(weather, 'WEATHER_RETRY_BACKOFF_SECONDS', 0.0)
+    stub = StubOpenMeteo(failures=2)
+    result = run(stub, gather(LOCATIONS[0]), retries=2, batch_size=1)[0]
+    assert len(stub.calls) == 3 and result['latitude'] == LOCATIONS[0][0]
+
+    stub = StubOpenMeteo(failures=3)
+    with pytest.raises(httpx.HTTPStatusError):
+        run(stub, gather(LOCATIONS[0]), retries=2, batch_size=1)
+
+
+def series(times, values, offset=0):
+    return {'utc_offset_seconds': offset, 'hourly': {
+        'time': times, 'temperature_2m': values, 'precipitation': values,
+        'wind_speed_10m': values, 'snow_depth': [v / 100 for v in values]
+    }}
+
+
+def test_grid_aligns_local_times_and_drops_empty_forecasts():
+    utc = series(['2024-06-01T00:00', '2024-06-01T01:00', '2024-06-01T02:00'], [0.0, 10.0, 20.0])
+    # The same instants in UTC+2 local time, with hourly values 5 higher
+    local = series(['2024-06-01T02:00', '2024-06-01T03:00', '2024-06-01T04:00'], [5.0, 15.0, 25.0], offset=7200)
+    grid = ForecastGrid.from_forecasts([0.0, 500.0, 1000.0], [utc, {'hourly': {'time': []}}, local])
+
+    np.testing.assert_array_equal(grid.distance, [0.0, 1000.0])
+    np.testing.assert_array_equal(grid.temperature, [[0, 10, 20], [5, 15, 25]])
+    np.testing.assert_array_equal(grid.snow_depth, [[0, 10, 20], [5, 15, 25]])  # Meters to cm
+    with pytest.raises(ValueError):
+        ForecastGrid.from_forecasts([0.0], [{'hourly': {}}])
+
+
+def test_bilinear_interpolation():
+    distance = np.array([0.0, 1000.0, 3000.0])
+    times = np.array([0.0, 3600.0, 7200.0, 10800.0])
+
+    def field(d, t):
+        # Bilinear in (distance, time) within each cell, so interpolation reproduces it exactly
+        return 2.0 + 0.01 * d + 0.001 * t + 1e-6 * d * t
+
+    values = field(distance[:, None], times[None, :])
+    grid = ForecastGrid(distance=distance, times=times, temperature=values, precipitation=values,
+                        wind_speed=values, snow_depth=values)
+    rng = np.random.default_rng(0)
+    d = rng.uniform(0, 3000, 200)
+    t = rng.uniform(0, 10800, 200)
+    for name, result in grid.interpolate(d, t).items():
+        np.testing.assert_allclose(result, field(d, t), rtol=1e-12, err_msg=name)
+
+    # Outside the grid the nearest edge holds
+    edges = grid.interpolate(np.array([-50.0, 5000.0]), np.array([-600.0, 20000.0]))['temperature']
+    np.testing.assert_allclose(edges, [field(0.0, 0.0), field(3000.0, 10800.0)])
@@ -0,0 +1,169 @@
+"""
+SanBernard ETA Uncertainty
+Monte Carlo finish-time percentiles: thousands of pace, terrain and weather scenarios in one broadcast
+"""
+
+import math
+import os
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from engine import BASE_SPEED_KMH
+
+UNCERTAINTY_SAMPLES = int(os.environ.get('UNCERTAINTY_SAMPLES', 2000))  # Scenarios per request by default
+UNCERTAINTY_MAX_SAMPLES = int(os.environ.get('UNCERTAINTY_MAX_SAMPLES', 20000))
+UNCERTAINTY_MAX_CELLS = int(os.environ.get('UNCERTAINTY_MAX_CELLS', 2_000_000))  # Scenarios x blocks per run
+UNCERTAINTY_CURVE_POINTS = int(os.environ.get('UNCERTAINTY_CURVE_POINTS', 500))  # Curve points returned by default
+NOISE_BLOCK_M = float(os.environ.get('NOISE_BLOCK_M', 1000))  # Distance over which terrain noise is shared
+PACE_SIGMA = float(os.environ.get('PACE_SIGMA', 0.12))  # Log-sd of the whole-route pace multiplier
+TERRAIN_SIGMA = float(os.environ.get('TERRAIN_SIGMA', 0.15))  # Log-sd of each block's terrain factor
+WEATHER_SIGMA = float(os.environ.get('WEATHER_SIGMA', 0.5))  # Log-sd of the forecast's effect on pace
+DEFAULT_PERCENTILES = (10, 50, 90)
+SUNSET_ZENITH = 90.833  # Degrees: refraction plus the sun's radius
+
+
+def segment_times(terrain: Dict[str, np.ndarray], user_pace_factor: float = 1.0,
+                  profile_factor: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    No-weather segment time (seconds, length n-1) split as pace_arrays computes it: the
+    horizontal part, which the terrain factor scales, and the Naismith ascent allowance
+    """
+    horizontal = (terrain['segment_distance'] / 1000) / BASE_SPEED_KMH * 3600 * \
+        terrain['terrain_factor'][1:] * user_pace_factor
+    vertical = np.maximum(terrain['elevation_change'], 0) / 10 * 60
+    if profile_factor is not None:
+        profile_factor = np.asarray(profile_factor, dtype=np.float64)[1:]
+        horizontal = horizontal * profile_factor
+        vertical = vertical * profile_factor
+    return {'horizontal': horizontal, 'vertical': vertical}
+
+
+def noise_blocks(distance: np.ndarray, samples: int) -> np.ndarray:
+    """
+    Block of every segment: NOISE_BLOCK_M of route each, lengthened on long routes so
+    samples x blocks stays within UNCERTAINTY_MAX_CELLS
+    """
+    total = float(distance[-1] - distance[0])
+    max_blocks = max(1, UNCERTAINTY_MAX_CELLS // samples)
+    length = max(NOISE_BLOCK_M, total / max_blocks, 1e-9)
+    count = min(max(1, math.ceil(total / length)), max_blocks)
+    return np.minimum(((distance[:-1] - distance[0]) / length).astype(np.int64), count - 1)
+
+
+def simulate_arrivals(segments: Dict[str, np.ndarray], weather_factor: Optional[np.ndarray],
+                      blocks: np.ndarray, samples: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Arrival time (seconds) at the end of every block in every scenario, (samples x blocks).
+
+    A scenario draws one pace multiplier for the whole route, one terrain multiplier per
+    block for the horizontal part, and one multiplier on the forecast's departure from
+    calm (weather factor - 1). Segments are summed into blocks first, since every
+    segment of a block shares its draws, so the broadcast is over blocks, not points.
+    """
+    count = int(blocks[-1]) + 1 if blocks.size else 1
+    horizontal, vertical = segments['horizontal'], segments['vertical']
+    excess = np.zeros_like(horizontal) if weather_factor is None else np.asarray(weather_factor)[1:] - 1.0
+
+    def block_sum(values: np.ndarray) -> np.ndarray:
+        return np.bincount(blocks, weights=values, minlength=count)
+
+    horizontal_calm, horizontal_weather = block_sum(horizontal), block_sum(horizontal * excess)
+    vertical_calm, vertical_weather = block_sum(vertical), block_sum(vertical * excess)
+
+    # Multipliers have median 1, so the deterministic estimate stays the typical scenario
+    pace = rng.lognormal(0.0, PACE_SIGMA, (samples, 1))
+    weather = rng.lognormal(0.0, WEATHER_SIGMA, (samples, 1)) if weather_factor is not None else 1.0
+    terrain = rng.lognormal(0.0, TERRAIN_SIGMA, (samples, count))
+
+    block_time = pace * (terrain * (horizontal_calm + weather * horizontal_weather) +
+                         vertical_calm + weather * vertical_weather)
+    return np.cumsum(block_time, axis=1)
+
+
+def percentile_curves(arrivals: np.ndarray, blocks: np.ndarray, estimated_time: np.ndarray,
+                      percentiles: Sequence[float]) -> np.ndarray:
+    """
+    Percentile arrival time at every point, (percentiles x n). Exact at block ends; within
+    a block, points are placed by their share of the block's deterministic estimated time.
+    """
+    at_block_end = np.percentile(arrivals, percentiles, axis=0)
+    at_block_start = np.concatenate((np.zeros((len(percentiles), 1)), at_block_end[:, :-1]), axis=1)
+
+    count = at_block_end.shape[1]
+    # Deterministic time at each block's first and last point
+    first = np.searchsorted(blocks, np.arange(count))
+    last = np.searchsorted(blocks, np.arange(count), side='right')
+    start_time, end_time = estimated_time[first], estimated_time[last]
+    span = (end_time - start_time)[blocks]
+    fraction = np.ones(blocks.size)
+    np.divide(estimated_time[1:] - start_time[blocks], span, out=fraction, where=span > 0)
+
+    curves = np.zeros((len(percentiles), estimated_time.size))
+    curves[:, 1:] = at_block_start[:, blocks] + fraction * (at_block_end[:, blocks] - at_block_start[:, blocks])
+    return curves
+
+
+def _sunset(lat: float, lon: float, day: datetime) -> Optional[datetime]:
+    """Sunset (UTC) on the UTC date of day by the NOAA solar equations; None in polar day or night"""
+    gamma = 2 * math.pi / 365 * (day.timetuple().tm_yday - 1)
+    eqtime = 229.18 * (0.000075 + 0.001868 * math.cos(gamma) - 0.032077 * math.sin(gamma) -
+                       0.014615 * math.cos(2 * gamma) - 0.040849 * math.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * math.cos(gamma) + 0.070257 * math.sin(gamma) -
+            0.006758 * math.cos(2 * gamma) + 0.000907 * math.sin(2 * gamma) -
+            0.002697 * math.cos(3 * gamma) + 0.00148 * math.sin(3 * gamma))
+    phi = math.radians(lat)
+    cos_hour_angle = (math.cos(math.radians(SUNSET_ZENITH)) / (math.cos(phi) * math.cos(decl)) -
+                      math.tan(phi) * math.tan(decl))
+    if abs(cos_hour_angle) > 1:
+        return None
+    hour_angle = math.degrees(math.acos(cos_hour_angle))
+    minutes = 720 - 4 * (lon - hour_angle) - eqtime
+    midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return midnight + timedelta(minutes=minutes)
+
+
+def day_sunset(lat: float, lon: float, when: datetime) -> Optional[datetime]:
+    """
+    Sunset at (lat, lon) on the local solar day of the given time, which is already past
+    for a start after dark; None in polar day or night
+    """
+    # _sunset() takes the day as a UTC date; the local date is the UTC one shifted by lon / 15 hours
+    return _sunset(lat, lon, when.astimezone(timezone.utc) + timedelta(hours=lon / 15))
+
+
+def resolve_samples(samples: Any = None) -> int:
+    """Scenario count from a request field, UNCERTAINTY_SAMPLES by default (raises ValueError)"""
+    samples = UNCERTAINTY_SAMPLES if samples in (None, '') else int(samples)
+    if not 1 <= samples <= UNCERTAINTY_MAX_SAMPLES:
+        raise ValueError(f'samples must be between 1 and {UNCERTAINTY_MAX_SAMPLES}')
+    return samples
+
+
+def resolve_percentiles(percentiles: Any = None) -> List[float]:
+    """Percentiles from a request field (list or comma-separated), P10/P50/P90 by default (raises ValueError)"""
+    if percentiles in (None, '', []):
+        return list(DEFAULT_PERCENTILES)
+    if isinstance(percentiles, str):
+        percentiles = percentiles.split(',')
+    percentiles = sorted({float(p) for p in percentiles})
+    if not all(0 <= p <= 100 for p in percentiles) or len(percentiles) > 20:
+        raise ValueError('percentiles must be at most 20 values between 0 and 100')
+    return percentiles
+
+
+def simulate_eta(distance: np.ndarray, estimated_time: np.ndarray, segments: Dict[str, np.ndarray],
+                 weather_factor: Optional[np.ndarray], samples: int, percentiles: Sequence[float],
+                 seed: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Finish-time distribution for a route with at least two points: the total time of every
+    scenario, and the percentile arrival curves along the route
+    """
+    rng = np.random.default_rng(seed)
+    blocks = noise_blocks(distance, samples)
+    arrivals = simulate_arrivals(segments, weather_factor, blocks, samples, rng)
+    return {
+        'total_time': arrivals[:, -1],
+        'curves': percentile_curves(arrivals, blocks, estimated_time, percentiles),
+        'blocks': int(blocks[-1]) + 1
+    }
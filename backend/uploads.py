@@ -0,0 +1,165 @@
+"""
+SanBernard Uploads
+Size-limited, transparently decompressed GPX uploads, spooled to disk and parsed from memory maps
+"""
+
+import gzip
+import mmap
+import os
+import tempfile
+import zipfile
+import zlib
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Iterator, List, Optional, Tuple
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+UPLOAD_MAX_FILE_BYTES = int(os.environ.get('UPLOAD_MAX_FILE_BYTES', 64 * 1024 * 1024))  # Per GPX file, decompressed
+UPLOAD_MAX_REQUEST_BYTES = int(os.environ.get('UPLOAD_MAX_REQUEST_BYTES', 256 * 1024 * 1024))  # Per request, as sent and decompressed
+UPLOAD_SPOOL_BYTES = int(os.environ.get('UPLOAD_SPOOL_BYTES', 1024 * 1024))  # Uploads past this go to a temporary file
+COPY_CHUNK_BYTES = 1024 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class UploadTooLargeError(RequestEntityTooLarge):
+    """An upload, once decompressed, is past UPLOAD_MAX_FILE_BYTES or UPLOAD_MAX_REQUEST_BYTES"""
+
+
+def spool_file() -> BinaryIO:
+    """In-memory buffer that moves to a temporary file past UPLOAD_SPOOL_BYTES"""
+    return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode='w+b')
+
+
+def _is_gzip(stream: BinaryIO) -> bool:
+    stream.seek(0)
+    magic = stream.read(len(GZIP_MAGIC))
+    stream.seek(0)
+    return magic == GZIP_MAGIC
+
+
+def _is_gpx_entry(info: zipfile.ZipInfo) -> bool:
+    name = info.filename
+    return (not info.is_dir() and name.lower().endswith('.gpx') and
+            not name.startswith('__MACOSX/') and not os.path.basename(name).startswith('.'))
+
+
+def _gpx_name(filename: str) -> str:
+    """Upload name without a .gz suffix"""
+    return filename[:-3] if filename.lower().endswith('.gz') else filename
+
+
+def iter_gpx_sources(filename: str, stream: BinaryIO) -> Iterator[Tuple[str, BinaryIO]]:
+    """
+    (name, readable GPX bytes) for one upload: each GPX entry of a zip archive, the
+    decompressed content of a gzip file, or the upload itself. Raises ValueError for a
+    corrupt archive.
+    """
+    if zipfile.is_zipfile(stream):
+        stream.seek(0)
+        try:
+            archive = zipfile.ZipFile(stream)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f'{filename}: {e}')
+        with archive:
+            for info in filter(_is_gpx_entry, archive.infolist()):
+                if info.file_size > UPLOAD_MAX_FILE_BYTES:
+                    raise UploadTooLargeError(f'{filename}/{info.filename}: larger than {UPLOAD_MAX_FILE_BYTES} bytes')
+                with archive.open(info) as source:
+                    yield f'{filename}/{info.filename}', source
+    elif _is_gzip(stream):
+        with gzip.GzipFile(fileobj=stream, mode='rb') as source:
+            yield _gpx_name(filename), source
+    else:
+        stream.seek(0)
+        yield filename, stream
+
+
+def copy_limited(name: str, source: BinaryIO, target: BinaryIO, budget: Optional[List[int]] = None) -> int:
+    """
+    Copy source to target, raising UploadTooLargeError past UPLOAD_MAX_FILE_BYTES (or past
+    what is left of budget, a one-item list of bytes the request may still use; updated)
+    and ValueError for corrupt compressed data. Returns the bytes copied.
+    """
+    limit = UPLOAD_MAX_FILE_BYTES if budget is None else min(UPLOAD_MAX_FILE_BYTES, budget[0])
+    copied = 0
+    try:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_BYTES), b''):
+            copied += len(chunk)
+            if copied > limit:
+                if budget is not None and budget[0] < UPLOAD_MAX_FILE_BYTES:
+                    raise UploadTooLargeError(f'Uploads larger than {UPLOAD_MAX_REQUEST_BYTES} bytes in total')
+                raise UploadTooLargeError(f'{name}: larger than {UPLOAD_MAX_FILE_BYTES} bytes')
+            target.write(chunk)
+    except (OSError, EOFError, zlib.error, zipfile.BadZipFile) as e:
+        raise ValueError(f'{name}: {e}')
+    if budget is not None:
+        budget[0] -= copied
+    return copied
+
+
+def open_gpx_upload(filename: str, stream: BinaryIO) -> BinaryIO:
+    """
+    Seekable plain GPX bytes for a single-route upload. A plain upload is returned as is
+    (after its size check); gzip and zip uploads are decompressed into a spooled buffer.
+    Raises ValueError for a corrupt or empty archive, or one holding several GPX files.
+    """
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    sources = iter_gpx_sources(filename, stream)
+    try:
+        name, source = next(sources, (None, None))
+        if source is None:
+            raise ValueError(f'{filename}: no GPX file in the archive')
+        if source is stream:
+            if size > UPLOAD_MAX_FILE_BYTES:
+                raise UploadTooLargeError(f'{filename}: larger than {UPLOAD_MAX_FILE_BYTES} bytes')
+            return stream
+        spooled = spool_file()
+        try:
+            copy_limited(name, source, spooled)
+        except Exception:
+            spooled.close()
+            raise
+        if next(sources, None) is not None:
+            spooled.close()
+            raise ValueError(f'{filename}: archive holds more than one GPX file, use the batch endpoint')
+        spooled.seek(0)
+        return spooled
+    finally:
+        sources.close()
+
+
+def spool_uploads(files: List[Any], workdir: str, max_files: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Spool uploads into workdir one at a time, yielding (filename, path). Zip archives are
+    expanded entry by entry and gzip files decompressed on the way, so only the file being
+    copied is ever read. Raises ValueError for a corrupt archive or more than max_files
+    files, UploadTooLargeError past the per-file or per-request decompressed size.
+    """
+    budget = [UPLOAD_MAX_REQUEST_BYTES]
+    count = 0
+    for file in files:
+        for name, source in iter_gpx_sources(file.filename, file.stream):
+            count += 1
+            if max_files is not None and count > max_files:
+                raise ValueError(f'Too many routes (at most {max_files} per request)')
+            path = os.path.join(workdir, f'{count}.gpx')
+            with open(path, 'wb') as target:
+                copy_limited(name, source, target, budget)
+            yield name, path
+
+
+@contextmanager
+def mapped_file(path: str) -> Iterator[Any]:
+    """
+    Read-only memory map of a spooled file for the parser: pages come straight from the
+    page cache, with no buffered read copy (an empty file yields an empty stream)
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield f
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
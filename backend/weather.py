@@ -0,0 +1,571 @@
+"""
+SanBernard Weather Service
+Open-Meteo forecasts fetched concurrently over one pooled, process-wide HTTP client
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import httpx
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+
+from forecast_cache import Cell, ForecastCache
+from route import Route
+from telemetry import REGISTRY, log_event, span
+
+# Upstream configuration (override OPEN_METEO_URL to point at a local mock server)
+OPEN_METEO_URL = os.environ.get('OPEN_METEO_URL', 'https://api.open-meteo.com/v1/forecast')
+WEATHER_CONCURRENCY = int(os.environ.get('WEATHER_CONCURRENCY', 8))  # Max in-flight upstream calls
+WEATHER_TIMEOUT_SECONDS = float(os.environ.get('WEATHER_TIMEOUT_SECONDS', 10.0))  # Per upstream call
+WEATHER_RETRIES = int(os.environ.get('WEATHER_RETRIES', 2))  # Extra attempts after a failure
+WEATHER_RETRY_BACKOFF_SECONDS = 0.25  # Doubled on every retry
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+WEATHER_BATCH_SIZE = int(os.environ.get('WEATHER_BATCH_SIZE', 50))  # Locations per multi-location call
+WEATHER_BATCH_DELAY_SECONDS = float(os.environ.get('WEATHER_BATCH_DELAY_SECONDS', 0.02))  # Max wait to fill a batch
+
+WEATHER_SEGMENTS = 8  # ~8 weather segments per route
+WEATHER_GRID_SAMPLES = int(os.environ.get('WEATHER_GRID_SAMPLES', 9))  # Forecast locations for per-point estimation
+WEATHER_MAX_ITERATIONS = 5  # Arrival time <-> weather refinement passes
+WEATHER_CONVERGENCE_SECONDS = 60.0  # Stop once no arrival time moves by more than this
+SNOW_DEPTH_CM_PER_M = 100  # Open-Meteo reports snow depth in meters
+HOURLY_VARIABLES = "temperature_2m,precipitation,wind_speed_10m,wind_direction_10m,snow_depth,weather_code"
+
+logger = logging.getLogger('sanbernard.weather')
+UPSTREAM_ATTEMPTS = REGISTRY.counter(
+    'sanbernard_weather_upstream_attempts_total', 'Open-Meteo request attempts by outcome', ['outcome']
+)
+
+
+@dataclass
+class WeatherData:
+    """Weather data for a specific point and time"""
+    temperature: float  # Celsius
+    precipitation: float  # mm
+    wind_speed: float  # km/h
+    wind_direction: float  # degrees
+    snow_depth: float  # cm
+    weather_code: int
+    description: str
+
+
+def get_weather_factor(weather: Optional[WeatherData]) -> float:
+    """Calculate speed reduction factor based on weather conditions"""
+    if not weather:
+        return 1.0
+    
+    factor = 1.0
+    
+    # Wind impact (headwind assumption - worst case)
+    if weather.wind_speed > 50:
+        factor *= 1.4  # Strong wind significantly slows
+    elif weather.wind_speed > 30:
+        factor *= 1.2
+    elif weather.wind_speed > 15:
+        factor *= 1.1
+    
+    # Precipitation impact
+    if weather.precipitation > 5:
+        factor *= 1.3  # Heavy rain
+    elif weather.precipitation > 1:
+        factor *= 1.15  # Light rain
+    
+    # Snow/cold impact
+    if weather.snow_depth > 30:
+        factor *= 2.0  # Deep snow - very slow
+    elif weather.snow_depth > 10:
+        factor *= 1.5
+    elif weather.snow_depth > 0:
+        factor *= 1.2
+    
+    # Temperature impact (extreme cold or heat)
+    if weather.temperature < -10:
+        factor *= 1.3
+    elif weather.temperature < 0:
+        factor *= 1.1
+    elif weather.temperature > 30:
+        factor *= 1.15
+    
+    return factor
+
+
+def weather_factors(temperature: np.ndarray, precipitation: np.ndarray,
+                    wind_speed: np.ndarray, snow_depth: np.ndarray) -> np.ndarray:
+    """Vectorized get_weather_factor over arrays of conditions (snow depth in cm)"""
+    factor = np.select([wind_speed > 50, wind_speed > 30, wind_speed > 15], [1.4, 1.2, 1.1], 1.0)
+    factor = factor * np.select([precipitation > 5, precipitation > 1], [1.3, 1.15], 1.0)
+    factor = factor * np.select([snow_depth > 30, snow_depth > 10, snow_depth > 0], [2.0, 1.5, 1.2], 1.0)
+    factor = factor * np.select([temperature < -10, temperature < 0, temperature > 30], [1.3, 1.1, 1.15], 1.0)
+    return factor
+
+
+def get_weather_description(code: int) -> str:
+    """Convert WMO weather code to description"""
+    codes = {
+        0: "Clear sky",
+        1: "Mainly clear",
+        2: "Partly cloudy",
+        3: "Overcast",
+        45: "Foggy",
+        48: "Depositing rime fog",
+        51: "Light drizzle",
+        53: "Moderate drizzle",
+        55: "Dense drizzle",
+        61: "Slight rain",
+        63: "Moderate rain",
+        65: "Heavy rain",
+        66: "Light freezing rain",
+        67: "Heavy freezing rain",
+        71: "Slight snow",
+        73: "Moderate snow",
+        75: "Heavy snow",
+        77: "Snow grains",
+        80: "Slight rain showers",
+        81: "Moderate rain showers",
+        82: "Violent rain showers",
+        85: "Slight snow showers",
+        86: "Heavy snow showers",
+        95: "Thunderstorm",
+        96: "Thunderstorm with slight hail",
+        99: "Thunderstorm with heavy hail",
+    }
+    return codes.get(code, "Unknown")
+
+
+class ForecastBatcher:
+    """
+    Merges single-location forecast fetches issued close together (by one route or by
+    concurrent requests) into multi-location Open-Meteo calls, then splits the response
+    back per caller. A batch is sent when full or at most `max_delay` seconds after its
+    first location arrived.
+    """
+
+    def __init__(self, client: 'WeatherClient', max_batch: int = WEATHER_BATCH_SIZE,
+                 max_delay: float = WEATHER_BATCH_DELAY_SECONDS):
+        self.client = client
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches_sent = 0
+        self.locations_sent = 0
+        self._pending: List[Tuple[float, float, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def fetch(self, lat: float, lon: float) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((lat, lon, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._send(batch))
+
+    async def _send(self, batch: List[Tuple[float, float, asyncio.Future]]):
+        # The same location may be requested more than once per batch; ask for it once
+        locations = list(dict.fromkeys((lat, lon) for lat, lon, _ in batch))
+        try:
+            data = await self.client.get_json({
+                "latitude": ",".join(str(lat) for lat, _ in locations),
+                "longitude": ",".join(str(lon) for _, lon in locations),
+                "hourly": HOURLY_VARIABLES,
+                "forecast_days": 3,
+                "timezone": "auto"
+            })
+            results = data if isinstance(data, list) else [data]
+            if len(results) != len(locations):
+                raise ValueError(f"Expected {len(locations)} forecasts, got {len(results)}")
+            self.batches_sent += 1
+            self.locations_sent += len(locations)
+            by_location = dict(zip(locations, results))
+            for lat, lon, future in batch:
+                if not future.done():
+                    future.set_result(by_location[(lat, lon)])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+class WeatherClient:
+    """
+    Open-Meteo client sharing one connection pool (keep-alive, TLS sessions) across requests.
+    At most `concurrency` upstream calls are in flight; failed calls are retried with backoff.
+    With a cache, forecasts are fetched once per grid cell and forecast run, and concurrent
+    requests for the same cell share a single upstream call. With batch_size > 1, locations
+    are fetched through a ForecastBatcher.
+    """
+
+    def __init__(self, base_url: str = OPEN_METEO_URL, concurrency: int = WEATHER_CONCURRENCY,
+                 timeout: float = WEATHER_TIMEOUT_SECONDS, retries: int = WEATHER_RETRIES,
+                 cache: Optional[ForecastCache] = None, batch_size: int = WEATHER_BATCH_SIZE,
+                 batch_delay: float = WEATHER_BATCH_DELAY_SECONDS):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.cache = cache
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[Cell, asyncio.Task] = {}
+        self.batcher = ForecastBatcher(self, batch_size, batch_delay) if batch_size > 1 else None
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        # Created lazily so the client and semaphore bind to the loop that uses them
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.concurrency,
+                                    max_keepalive_connections=self.concurrency)
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._client
+
+    async def get_json(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """GET the forecast endpoint, retrying timeouts, transport errors and 429/5xx responses"""
+        client = self._ensure_client()
+        async with self._semaphore:
+            with span('weather_upstream', logger):
+                for attempt in range(self.retries + 1):
+                    last_attempt = attempt == self.retries
+                    try:
+                        response = await client.get(self.base_url, params=params)
+                        if response.status_code in RETRY_STATUS_CODES and not last_attempt:
+                            UPSTREAM_ATTEMPTS.inc(outcome='retry')
+                            await asyncio.sleep(WEATHER_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+                            continue
+                        response.raise_for_status()
+                        UPSTREAM_ATTEMPTS.inc(outcome='ok')
+                        return response.json()
+                    except httpx.HTTPStatusError:
+                        UPSTREAM_ATTEMPTS.inc(outcome='error')
+                        raise
+                    except httpx.TransportError as e:
+                        if last_attempt:
+                            UPSTREAM_ATTEMPTS.inc(outcome='error')
+                            raise
+                        UPSTREAM_ATTEMPTS.inc(outcome='retry')
+                        log_event(logger, logging.DEBUG, 'weather_upstream_retry', attempt=attempt + 1, error=e)
+                        await asyncio.sleep(WEATHER_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+    async def fetch_forecast(self, lat: float, lon: float) -> Dict[str, Any]:
+        """Hourly forecast for one location (served from the cache when one is configured)"""
+        if self.cache is None:
+            return await self._fetch_location(lat, lon)
+
+        cell = self.cache.cell(lat, lon)
+        cached = self.cache.get(cell, memory_only=True)
+        if cached is None and self.cache.persistent:
+            # sqlite runs on a worker thread so disk I/O never stalls the other fetches on this loop
+            cached = await asyncio.get_running_loop().run_in_executor(None, self.cache.get, cell)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(cell)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_location(*self.cache.cell_center(cell)))
+            self._inflight[cell] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cell, None))
+            data = await task
+            self.cache.put(cell, data, persist=False)
+            if self.cache.persistent:
+                await asyncio.get_running_loop().run_in_executor(None, self.cache.persist, cell, data)
+            return data
+        return await task
+
+    async def _fetch_location(self, lat: float, lon: float) -> Dict[str, Any]:
+        if self.batcher is not None:
+            return await self.batcher.fetch(lat, lon)
+        return await self.get_json({
+            "latitude": lat,
+            "longitude": lon,
+            "hourly": HOURLY_VARIABLES,
+            "forecast_days": 3,
+            "timezone": "auto"
+        })
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class _WeatherRuntime:
+    """One long-lived event loop thread plus the shared client, created once per process"""
+
+    def __init__(self, client: WeatherClient):
+        self.pid = os.getpid()
+        self.client = client
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='weather-loop', daemon=True)
+        self.thread.start()
+
+    def run(self, coro: Awaitable) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+_runtime: Optional[_WeatherRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def _get_runtime() -> _WeatherRuntime:
+    global _runtime
+    with _runtime_lock:
+        # A forked worker must not reuse its parent's loop thread or sockets
+        if _runtime is None or _runtime.pid != os.getpid():
+            _runtime = _WeatherRuntime(WeatherClient(cache=ForecastCache()))
+        return _runtime
+
+
+def configure_weather_client(**kwargs) -> WeatherClient:
+    """
+    Replace the process-wide client (e.g. base_url of a local mock server, concurrency, retries).
+    The existing forecast cache is kept unless a `cache` argument is given.
+    """
+    runtime = _get_runtime()
+    old_client = runtime.client
+    kwargs.setdefault('cache', old_client.cache)
+    runtime.client = WeatherClient(**kwargs)
+    runtime.run(old_client.aclose())
+    return runtime.client
+
+
+def get_weather_client() -> WeatherClient:
+    return _get_runtime().client
+
+
+def run_async(coro: Awaitable) -> Any:
+    """Run a coroutine on the shared weather event loop and wait for its result"""
+    return _get_runtime().run(coro)
+
+
+def parse_hourly_times(data: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse a forecast's hourly timestamps once into UTC epoch seconds.
+    Returns (sorted times, order) where order maps sorted positions to the original indices.
+    Open-Meteo local times are shifted by utc_offset_seconds (0 when absent, i.e. UTC).
+    """
+    local = np.array(data.get('hourly', {}).get('time', []), dtype='datetime64[s]')
+    times = local.astype(np.int64).astype(np.float64) - data.get('utc_offset_seconds', 0)
+    order = np.argsort(times, kind='stable')
+    return times[order], order
+
+
+def has_hourly_data(data: Dict[str, Any]) -> bool:
+    """True when a forecast has at least one hour to interpolate"""
+    return bool(data.get('hourly', {}).get('time'))
+
+
+def _hourly_array(hourly: Dict[str, List], key: str, default: float, size: int) -> np.ndarray:
+    """One variable's series over size hours, the default where it is null or missing"""
+    values = np.full(size, default, dtype=np.float64)
+    given = np.array(hourly.get(key) or [], dtype=np.float64)[:size]  # null entries become NaN
+    values[:given.size] = np.nan_to_num(given, nan=default)
+    return values
+
+
+@dataclass
+class ForecastGrid:
+    """
+    Hourly forecasts at sample locations along a route, as dense (location x hour) arrays.
+    Locations are ordered by distance_from_start; hours are UTC epoch seconds.
+    """
+    distance: np.ndarray  # (L,) meters along the route
+    times: np.ndarray  # (H,) UTC epoch seconds, sorted
+    temperature: np.ndarray  # (L, H) Celsius
+    precipitation: np.ndarray  # (L, H) mm
+    wind_speed: np.ndarray  # (L, H) km/h
+    snow_depth: np.ndarray  # (L, H) cm
+
+    @classmethod
+    def from_forecasts(cls, distances: List[float], forecasts: List[Dict[str, Any]]) -> 'ForecastGrid':
+        """
+        Align every location's series onto the first location's time index. Forecasts
+        without hours are dropped (raises ValueError when none has any).
+        """
+        usable = [(d, data) for d, data in zip(distances, forecasts) if has_hourly_data(data)]
+        if not usable:
+            raise ValueError('No forecast has hourly data')
+        distances = [d for d, _ in usable]
+        forecasts = [data for _, data in usable]
+        times, _ = parse_hourly_times(forecasts[0])
+        fields = {'temperature': [], 'precipitation': [], 'wind_speed': [], 'snow_depth': []}
+        for data in forecasts:
+            hourly = data.get('hourly', {})
+            own_times, order = parse_hourly_times(data)
+            series = {
+                'temperature': _hourly_array(hourly, 'temperature_2m', 15, own_times.size),
+                'precipitation': _hourly_array(hourly, 'precipitation', 0, own_times.size),
+                'wind_speed': _hourly_array(hourly, 'wind_speed_10m', 0, own_times.size),
+                'snow_depth': _hourly_array(hourly, 'snow_depth', 0, own_times.size) * SNOW_DEPTH_CM_PER_M,
+            }
+            for name, values in series.items():
+                fields[name].append(np.interp(times, own_times, values[order]))
+        return cls(
+            distance=np.asarray(distances, dtype=np.float64),
+            times=times,
+            **{name: np.vstack(rows) for name, rows in fields.items()}
+        )
+
+    def interpolate(self, distance: np.ndarray, when: np.ndarray) -> Dict[str, np.ndarray]:
+        """Bilinear interpolation in (distance along route, time) for every query point"""
+        li, w = _bracket(self.distance, distance)
+        ti, u = _bracket(self.times, when)
+        li_next = np.minimum(li + 1, self.distance.size - 1)
+        ti_next = np.minimum(ti + 1, self.times.size - 1)
+
+        result = {}
+        for name in ('temperature', 'precipitation', 'wind_speed', 'snow_depth'):
+            values = getattr(self, name)
+            here = values[li, ti] * (1 - u) + values[li, ti_next] * u
+            there = values[li_next, ti] * (1 - u) + values[li_next, ti_next] * u
+            result[name] = here * (1 - w) + there * w
+        return result
+
+    def weather_factors(self, distance: np.ndarray, when: np.ndarray) -> np.ndarray:
+        conditions = self.interpolate(distance, when)
+        return weather_factors(conditions['temperature'], conditions['precipitation'],
+                               conditions['wind_speed'], conditions['snow_depth'])
+
+
+def _bracket(axis: np.ndarray, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Left neighbour index and interpolation weight of each x on a sorted axis (clamped at the ends)"""
+    x = np.asarray(x, dtype=np.float64)
+    if axis.size < 2:
+        return np.zeros(x.shape, dtype=np.intp), np.zeros(x.shape, dtype=np.float64)
+    i = np.clip(np.searchsorted(axis, x, side='right') - 1, 0, axis.size - 2)
+    span = axis[i + 1] - axis[i]
+    weight = np.zeros(x.shape, dtype=np.float64)
+    np.divide(x - axis[i], span, out=weight, where=span > 0)
+    return i, np.clip(weight, 0, 1)
+
+
+async def fetch_forecast_grid(route: Route, client: Optional[WeatherClient] = None,
+                              samples: int = WEATHER_GRID_SAMPLES) -> Optional[ForecastGrid]:
+    """Fetch forecasts at evenly spaced distances along the route (None if none could be fetched)"""
+    if not len(route):
+        return None
+    client = client or get_weather_client()
+
+    targets = np.linspace(0, route.total_distance, max(1, samples))
+    indices = np.unique(np.minimum(np.searchsorted(route.distance_from_start, targets), len(route) - 1))
+
+    with span('weather_grid', logger, samples=indices.size):
+        results = await asyncio.gather(
+            *(client.fetch_forecast(float(route.lat[i]), float(route.lon[i])) for i in indices),
+            return_exceptions=True
+        )
+    fetched = [(float(route.distance_from_start[i]), data)
+               for i, data in zip(indices, results) if not isinstance(data, BaseException) and has_hourly_data(data)]
+    if not fetched:
+        log_event(logger, logging.WARNING, 'forecast_grid_unavailable',
+                  error=results[0] if isinstance(results[0], BaseException) else 'no hourly data')
+        return None
+    return ForecastGrid.from_forecasts([d for d, _ in fetched], [data for _, data in fetched])
+
+
+def _segment_from_hourly(data: Dict[str, Any], lat: float, lon: float,
+                         arrival_time: datetime, distance_from_start: float) -> Dict[str, Any]:
+    """Pick the forecast hour at arrival and shape it into a weather segment"""
+    hourly = data.get('hourly', {})
+
+    # First forecast hour at or after arrival (falls back to the first hour)
+    times, order = parse_hourly_times(data)
+    position = int(np.searchsorted(times, arrival_time.timestamp(), side='left'))
+    hour_index = int(order[position]) if position < times.size else 0
+
+    def hour_value(key: str, default: Any) -> Any:
+        # Neutral conditions when the forecast has no value for the hour
+        values = hourly.get(key) or []
+        return values[hour_index] if hour_index < len(values) else default
+
+    # Extract weather data
+    temp = hour_value('temperature_2m', 15)
+    precip = hour_value('precipitation', 0)
+    wind_speed = hour_value('wind_speed_10m', 0)
+    wind_dir = hour_value('wind_direction_10m', 0)
+    snow = hour_value('snow_depth', 0) or 0
+    weather_code = hour_value('weather_code', 0)
+
+    # Determine weather type for visualization
+    has_rain = precip > 0.5 and snow == 0
+    has_snow = snow > 0 or (weather_code in [71, 73, 75, 77, 85, 86])
+    has_wind = wind_speed > 5  # km/h (lowered threshold for visibility)
+
+    return {
+        'lat': lat,
+        'lon': lon,
+        'temperature': temp,
+        'precipitation': precip,
+        'wind_speed': wind_speed,
+        'wind_direction': wind_dir,
+        'snow_depth': snow,
+        'weather_code': weather_code,
+        'description': get_weather_description(weather_code),
+        'has_rain': has_rain,
+        'has_snow': has_snow,
+        'has_wind': has_wind,
+        'distance_from_start': distance_from_start
+    }
+
+
+async def _fetch_segment(client: WeatherClient, i: int, count: int, lat: float, lon: float,
+                         arrival_time: datetime, distance_from_start: float) -> Optional[Dict[str, Any]]:
+    try:
+        data = await client.fetch_forecast(lat, lon)
+        segment = _segment_from_hourly(data, lat, lon, arrival_time, distance_from_start)
+        log_event(logger, logging.DEBUG, 'weather_segment', segment=i + 1, of=count, lat=lat, lon=lon,
+                  temperature=segment['temperature'], description=segment['description'],
+                  wind_speed=segment['wind_speed'], wind_direction=segment['wind_direction'],
+                  rain=segment['has_rain'], snow=segment['has_snow'], wind_arrow=segment['has_wind'])
+        return segment
+    except httpx.HTTPStatusError as e:
+        log_event(logger, logging.WARNING, 'weather_segment_failed', segment=i + 1, status=e.response.status_code)
+    except Exception as e:
+        log_event(logger, logging.WARNING, 'weather_segment_failed', segment=i + 1, error=e)
+    return None
+
+
+async def fetch_weather_for_route_area(route: Route, start_time: datetime,
+                                       client: Optional[WeatherClient] = None) -> List[Dict[str, Any]]:
+    """
+    Fetch weather data for the route area, returning weather segments.
+    This creates environmental overlays (wind, rain, snow) rather than point-based weather.
+    Segments are fetched concurrently, bounded by the client's concurrency limit.
+    """
+    if not len(route):
+        return []
+
+    client = client or get_weather_client()
+
+    # Sample points along route to get weather segments
+    sample_rate = max(1, len(route) // WEATHER_SEGMENTS)
+    sampled = route.take(np.arange(0, len(route), sample_rate))
+
+    # Ensure start time is timezone-aware (use UTC if naive)
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+
+    with span('weather_segments', logger, segments=len(sampled)):
+        results = await asyncio.gather(*(
+            _fetch_segment(client, i, len(sampled), lat, lon,
+                           start_time + timedelta(seconds=estimated_time), distance_from_start)
+            for i, (lat, lon, estimated_time, distance_from_start) in enumerate(zip(
+                sampled.lat.tolist(), sampled.lon.tolist(),
+                sampled.estimated_time.tolist(), sampled.distance_from_start.tolist()
+            ))
+        ))
+    weather_segments = [segment for segment in results if segment is not None]
+
+    log_event(logger, logging.INFO, 'weather_fetched', requested=len(sampled), segments=len(weather_segments))
+    return weather_segments
@@ -0,0 +1,51 @@
+import { RouteData, RoutePoint } from "@/types";
+
+// Columnar binary route responses (Accept: application/vnd.sanbernard.route-columns)
+export const ROUTE_COLUMNS_MIMETYPE = "application/vnd.sanbernard.route-columns";
+
+interface ColumnDescriptor {
+  name: string;
+  dtype: "float64" | "float32";
+  offset: number;
+  length: number;
+}
+
+export interface RouteColumns {
+  route: Omit<RouteData, "points">;
+  count: number;
+  columns: Record<string, Float64Array | Float32Array>;
+}
+
+// Views straight into the response buffer; no per-point objects are created
+export function decodeRouteColumns(buffer: ArrayBuffer): RouteColumns {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== "SBRC") {
+    throw new Error("Not a SanBernard route columns payload");
+  }
+  const headerLength = view.getUint32(8, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength)));
+  const dataStart = Math.ceil((12 + headerLength) / 8) * 8;
+
+  const columns: Record<string, Float64Array | Float32Array> = {};
+  for (const column of header.columns as ColumnDescriptor[]) {
+    const ArrayType = column.dtype === "float64" ? Float64Array : Float32Array;
+    columns[column.name] = new ArrayType(buffer, dataStart + column.offset, column.length);
+  }
+  return { route: header.route, count: header.count, columns };
+}
+
+// Materialize the JSON point shape (for components that still expect RoutePoint objects)
+export function columnsToPoints({ count, columns }: RouteColumns): RoutePoint[] {
+  const names = Object.keys(columns);
+  const points: RoutePoint[] = new Array(count);
+  for (let i = 0; i < count; i++) {
+    const point: Record<string, number | string | null> = {};
+    for (const name of names) {
+      const value = columns[name][i];
+      point[name] = name === "time" ? (Number.isNaN(value) ? null : new Date(value).toISOString()) : value;
+    }
+    points[i] = point as unknown as RoutePoint;
+  }
+  return points;
+}
@@ -58,13 +58,33 @@ export interface RouteBounds {
   max_lon: number;
 }
 
+export interface RouteLevelOfDetail {
+  tier: string;
+  tolerance: number;
+  points: number;
+  total_points: number;
+  tiers: Record<string, number>;
+}
+
+export interface PaceProfileSummary {
+  user_id: string;
+  activities: number;
+  pace_factor: number;
+  moving_hours: number;
+  updated_at: string | null;
+}
+
 export interface RouteData {
+  route_id?: string;
   points: RoutePoint[];
   total_distance: number;
   total_ascent: number;
   total_descent: number;
   estimated_total_time?: number;
   estimated_total_time_formatted?: string;
+  weather_aware?: boolean;
+  lod?: RouteLevelOfDetail;
+  pace_profile?: PaceProfileSummary | null;
   bounds?: RouteBounds;
   weatherSummary?: WeatherSummary;
 }